@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timezone
+
+from sqlite_store import SQLiteStore
+
+DEFAULT_AGGREGATE_PATH = os.environ.get(
+    'AGGREGATE_STORE_PATH', os.path.join('.meeting_analyzer', 'aggregates.sqlite3')
+)
+
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS user_aggregates (
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    aggregate TEXT NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (start_date, end_date, user_id)
+) WITHOUT ROWID;
+""",
+]
+
+
+# Per-user partial aggregates (org_rollups.encode_aggregate) by report period. Team and org figures
+# are merged from these, never from raw events.
+class AggregateStore(SQLiteStore):
+    MIGRATIONS = MIGRATIONS
+
+    def __init__(self, path=DEFAULT_AGGREGATE_PATH):
+        super().__init__(path)
+
+    def save_aggregates(self, start_date, end_date, aggregates):
+        # aggregates: (user_id, encoded aggregate) pairs
+        updated_at = datetime.now(timezone.utc).isoformat()
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO user_aggregates VALUES (?, ?, ?, ?, ?)',
+                [(start_date.isoformat(), end_date.isoformat(), user_id, aggregate, updated_at)
+                 for user_id, aggregate in aggregates]
+            )
+
+    def load_aggregates(self, start_date, end_date, user_ids=None):
+        # {user_id: encoded aggregate} for the period, for every stored user or just user_ids
+        period = (start_date.isoformat(), end_date.isoformat())
+        with self._transaction() as conn:
+            if user_ids is None:
+                rows = conn.execute(
+                    'SELECT user_id, aggregate FROM user_aggregates WHERE start_date = ? AND end_date = ?', period
+                ).fetchall()
+            else:
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS wanted_users (user_id TEXT PRIMARY KEY)')
+                conn.execute('DELETE FROM wanted_users')
+                conn.executemany('INSERT OR IGNORE INTO wanted_users VALUES (?)', [(user_id,) for user_id in user_ids])
+                rows = conn.execute(
+                    'SELECT user_id, aggregate FROM user_aggregates JOIN wanted_users USING (user_id) '
+                    'WHERE start_date = ? AND end_date = ?', period
+                ).fetchall()
+        return dict(rows)
+
+    def stored_users(self, start_date, end_date):
+        with self._transaction() as conn:
+            rows = conn.execute(
+                'SELECT user_id FROM user_aggregates WHERE start_date = ? AND end_date = ?',
+                (start_date.isoformat(), end_date.isoformat())
+            ).fetchall()
+        return {row[0] for row in rows}
+
+
+_default_store = None
+
+
+def get_aggregate_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = AggregateStore()
+    return _default_store
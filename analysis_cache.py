@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+import plotly.io as pio
+
+logger = logging.getLogger(__name__)
+
+# Dashboards kept per session, and the memory they may take between them
+ANALYSIS_CACHE_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_ENTRIES', 16))
+ANALYSIS_CACHE_MB = float(os.environ.get('ANALYSIS_CACHE_MB', 256))
+# Older entries are fetched again, so changes no local sync has seen yet still show up
+ANALYSIS_CACHE_TTL = float(os.environ.get('ANALYSIS_CACHE_TTL', 300))
+
+
+@dataclass(frozen=True)
+class CachedDashboard:
+    df: pd.DataFrame
+    analysis: object      # CalendarAnalysis
+    intervals: object     # IntervalAnalysis
+    attendees: object     # AttendeeIndex
+    figures: dict         # name -> built plotly figure
+
+    @property
+    def nbytes(self):
+        # Close enough for eviction: the frames and arrays, and the figures as they go to the browser
+        series = [value for value in vars(self.analysis).values() if isinstance(value, pd.Series)]
+        return int(
+            self.df.memory_usage(deep=True).sum()
+            + sum(value.memory_usage(deep=True) for value in series)
+            + self.intervals.by_day.memory_usage(deep=True).sum() + self.intervals.overlapping.memory_usage()
+            + self.attendees.nbytes
+            + sum(len(pio.to_json(figure, validate=False)) for figure in self.figures.values())
+        )
+
+
+def data_version(calendar_service):
+    # What the locally synced data looks like: the stored sync tokens, which move with every sync
+    # that saw a change. Services without a store have none, and rely on the TTL.
+    store = getattr(calendar_service, 'store', None)
+    user_id = getattr(calendar_service, 'user_id', None)
+    if store is None or user_id is None:
+        return None
+    return store.sync_version(user_id)
+
+
+def dashboard_key(calendar_service, start_date, end_date):
+    user = getattr(calendar_service, 'user_id', None) or type(calendar_service).__name__
+    calendars = tuple(getattr(calendar_service, 'calendar_ids', ()))
+    time_zone = getattr(calendar_service, 'time_zone', None)
+    return user, calendars, time_zone, start_date, end_date, data_version(calendar_service)
+
+
+class AnalysisCache:
+    # Least recently used entries go first once there are more than max_entries or they take
+    # more than max_bytes; an entry older than ttl seconds counts as a miss
+    def __init__(self, max_entries=ANALYSIS_CACHE_ENTRIES, max_bytes=ANALYSIS_CACHE_MB * 2 ** 20,
+                 ttl=ANALYSIS_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.bytes = 0
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0, 'invalidated': 0}
+        self._entries = OrderedDict()  # key -> (value, nbytes, stored at)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() - entry[2] > self.ttl:
+            self._remove(key)
+            self.counters['expired'] += 1
+            entry = None
+        if entry is None:
+            self.counters['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        nbytes = value.nbytes if nbytes is None else nbytes
+        self._remove(key)
+        if nbytes > self.max_bytes:
+            logger.info(f"Not caching a {nbytes / 2 ** 20:.1f} MiB analysis, over the {self.max_bytes / 2 ** 20:.0f} MiB limit")
+            return
+        self._entries[key] = (value, nbytes, self.clock())
+        self.bytes += nbytes
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.counters['evicted'] += 1
+
+    def invalidate(self, key):
+        if self._remove(key):
+            self.counters['invalidated'] += 1
+
+    def clear(self):
+        self.counters['invalidated'] += len(self._entries)
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+        return entry is not None
+
+    def stats(self):
+        return dict(self.counters, entries=len(self._entries), mib=round(self.bytes / 2 ** 20, 1))
@@ -0,0 +1,179 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Who meetings are with, from the event frame's attendee_emails column. Addresses and their
+# domains are dictionary-encoded as integer ids, and each distinct attendee list is stored once as
+# a run of person ids (CSR: list i is ids[offsets[i]:offsets[i + 1]]) that events point at, so a
+# weekly all-hands of 500 costs one int32 per event. Queries total each list's meetings and hours
+# once and spread them over its members, never touching the address strings.
+
+# Domains counted as internal, comma-separated; without it, the domain seen most in meetings
+INTERNAL_DOMAINS = [domain.strip().lower() for domain in os.environ.get('INTERNAL_DOMAINS', '').split(',')
+                    if domain.strip()]
+# Larger lists are left out of pair hours: an all-hands says little about who works with whom,
+# and its pairs grow with the square of its size
+PAIR_MAX_ATTENDEES = int(os.environ.get('PAIR_MAX_ATTENDEES', 50))
+
+
+@dataclass(frozen=True)
+class AttendeeIndex:
+    people: pd.Index            # person id -> address, lower case
+    domains: pd.Index           # domain id -> domain
+    person_domain: np.ndarray   # person id -> domain id
+    offsets: np.ndarray         # list id -> first of its person ids; one longer than the lists
+    ids: np.ndarray             # person ids of every list, one list after the other
+    event_lists: np.ndarray     # frame row -> list id, -1 without attendees
+    list_meetings: np.ndarray   # list id -> events with that list
+    list_hours: np.ndarray      # list id -> hours of those events
+    unlisted_meetings: int      # events without attendees
+    unlisted_hours: float
+
+    @property
+    def nbytes(self):
+        arrays = (self.person_domain, self.offsets, self.ids, self.event_lists, self.list_meetings, self.list_hours)
+        return (sum(array.nbytes for array in arrays) + self.people.memory_usage(deep=True)
+                + self.domains.memory_usage(deep=True))
+
+    def list_sizes(self):
+        return np.diff(self.offsets)
+
+
+def _ids(values):
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return codes.astype(np.int32), pd.Index(uniques, dtype=object)
+
+
+def build_attendee_index(df):
+    # The index for an event frame, row for row; each distinct attendee list is split once
+    emails = df['attendee_emails'] if 'attendee_emails' in df else pd.Series(None, index=df.index, dtype=object)
+    if not isinstance(emails.dtype, pd.CategoricalDtype):
+        emails = emails.astype('category')
+    emails = emails.cat.remove_unused_categories()
+    lists = emails.cat.categories
+    event_lists = emails.cat.codes.to_numpy().astype(np.int32)
+    sizes = np.fromiter((text.count('\n') + 1 for text in lists), dtype=np.int64, count=len(lists))
+    ids, people = _ids('\n'.join(lists).lower().split('\n') if len(lists) else [])
+    # Someone named twice in a list (or in two cases) is in it once
+    members = np.unique(np.repeat(np.arange(len(lists), dtype=np.int64), sizes) * len(people) + ids)
+    ids = (members % max(len(people), 1)).astype(np.int32)
+    sizes = np.bincount(members // max(len(people), 1), minlength=len(lists))
+    person_domain, domains = _ids([address.rpartition('@')[2] for address in people])
+    valid = event_lists >= 0
+    duration = df['duration'].to_numpy(dtype='float64')
+    return AttendeeIndex(
+        people=people,
+        domains=domains,
+        person_domain=person_domain,
+        offsets=np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+        ids=ids,
+        event_lists=event_lists,
+        list_meetings=np.bincount(event_lists[valid], minlength=len(lists)).astype(np.int64),
+        list_hours=np.bincount(event_lists[valid], weights=duration[valid], minlength=len(lists)),
+        unlisted_meetings=int((~valid).sum()),
+        unlisted_hours=float(duration[~valid].sum()),
+    )
+
+
+def _excluded(index, exclude):
+    # Person ids of the given addresses, e.g. the user's own
+    addresses = [address.lower() for address in ([exclude] if isinstance(exclude, str) else exclude)]
+    found = index.people.get_indexer(addresses)
+    return found[found >= 0]
+
+
+def _person_totals(index):
+    sizes = index.list_sizes()
+    meetings = np.bincount(index.ids, weights=np.repeat(index.list_meetings, sizes), minlength=len(index.people))
+    hours = np.bincount(index.ids, weights=np.repeat(index.list_hours, sizes), minlength=len(index.people))
+    return meetings.astype(np.int64), hours
+
+
+def top_collaborators(index, n=10, exclude=()):
+    # The people most meeting time is spent with: meetings and hours together, and their domain
+    meetings, hours = _person_totals(index)
+    table = pd.DataFrame({
+        'meetings': meetings,
+        'hours': hours,
+        'domain': index.domains.to_numpy()[index.person_domain],
+    }, index=index.people.rename('attendee'))
+    table = table.iloc[np.setdiff1d(np.flatnonzero(meetings), _excluded(index, exclude))]
+    return table.sort_values(['hours', 'meetings'], ascending=False, kind='stable').head(n)
+
+
+def _list_ids(index):
+    # List id of every entry in ids
+    return np.repeat(np.arange(len(index.list_meetings)), index.list_sizes())
+
+
+def default_internal_domains(index):
+    # INTERNAL_DOMAINS, or the domain in the most meetings: counted once per meeting, so a
+    # mailing list's 500 members don't outweigh the colleagues in everyday meetings
+    if INTERNAL_DOMAINS:
+        return INTERNAL_DOMAINS
+    present = np.unique(_list_ids(index) * len(index.domains) + index.person_domain[index.ids])
+    by_domain = np.bincount(present % len(index.domains), weights=index.list_meetings[present // len(index.domains)],
+                            minlength=len(index.domains))
+    return [index.domains[int(np.argmax(by_domain))]] if len(by_domain) and by_domain.max() > 0 else []
+
+
+def internal_external(index, internal_domains=None):
+    # Meetings and hours with only internal attendees, with anyone outside, and without attendees
+    internal_domains = default_internal_domains(index) if internal_domains is None else internal_domains
+    internal = np.isin(index.domains, [domain.lower() for domain in internal_domains])
+    outside = ~internal[index.person_domain[index.ids]]
+    external = np.bincount(_list_ids(index)[outside], minlength=len(index.list_meetings)) > 0
+    return pd.DataFrame({
+        'meetings': [int(index.list_meetings[~external].sum()), int(index.list_meetings[external].sum()),
+                     index.unlisted_meetings],
+        'hours': [float(index.list_hours[~external].sum()), float(index.list_hours[external].sum()),
+                  index.unlisted_hours],
+    }, index=pd.Index(['internal', 'external', 'no attendees'], name='audience'))
+
+
+def pair_hours(index, n=10, exclude=(), max_attendees=PAIR_MAX_ATTENDEES):
+    # Meetings and hours per pair of people who attended together, for lists of up to
+    # max_attendees; every list of one size is expanded into its pairs at once
+    sizes = index.list_sizes()
+    used = (index.list_meetings > 0) & (sizes >= 2)
+    if max_attendees is not None:
+        used &= sizes <= max_attendees
+    first, second, meetings, hours = [], [], [], []
+    for size in np.unique(sizes[used]):
+        lists = np.flatnonzero(used & (sizes == size))
+        members = index.ids[index.offsets[lists][:, None] + np.arange(size)]
+        left, right = np.triu_indices(size, 1)
+        first.append(members[:, left].ravel())
+        second.append(members[:, right].ravel())
+        meetings.append(np.repeat(index.list_meetings[lists], len(left)))
+        hours.append(np.repeat(index.list_hours[lists], len(left)))
+    first, second = np.concatenate(first or [[]]).astype(np.int64), np.concatenate(second or [[]]).astype(np.int64)
+    low, high = np.minimum(first, second), np.maximum(first, second)
+    keep = np.ones(len(low), dtype=bool)
+    excluded = _excluded(index, exclude)
+    if len(excluded):
+        keep &= ~np.isin(low, excluded) & ~np.isin(high, excluded)
+    keys = low[keep] * len(index.people) + high[keep]
+    if not len(keys) or n == 0:
+        return pd.DataFrame(columns=['first', 'second', 'meetings', 'hours'])
+    # Each pair's entries are summed once sorted together
+    order = np.argsort(keys)
+    keys = keys[order]
+    firsts = np.flatnonzero(np.diff(keys, prepend=-1))
+    pairs = keys[firsts]
+    meetings = np.add.reduceat(np.concatenate(meetings)[keep][order], firsts)
+    hours = np.add.reduceat(np.concatenate(hours)[keep][order], firsts)
+    # Only pairs with at least the n-th most hours need ranking
+    top = np.arange(len(pairs))
+    if n is not None and n < len(pairs):
+        top = np.flatnonzero(hours >= np.partition(hours, len(pairs) - n)[len(pairs) - n])
+    top = top[np.lexsort((-meetings[top], -hours[top]))][:n]
+    people = index.people.to_numpy()
+    return pd.DataFrame({
+        'first': people[pairs[top] // len(index.people)],
+        'second': people[pairs[top] % len(index.people)],
+        'meetings': meetings[top],
+        'hours': hours[top],
+    })
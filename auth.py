@@ -1,8 +1,7 @@
 import os
+import secrets
 import streamlit as st
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from calendar_services import GoogleCalendarService
+from metrics import metrics
 import logging
 from datetime import datetime, timedelta
 
@@ -12,9 +11,42 @@ logger = logging.getLogger(__name__)
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+OUTLOOK_SCOPES = ['offline_access', 'Calendars.Read']
+# Outlook sign-ins carry this state prefix, so the callback can tell them from Google's
+OUTLOOK_STATE_PREFIX = 'outlook-'
+# How long an issued Outlook state is accepted by the callback
+OAUTH_STATE_TTL = timedelta(minutes=10)
 
 # Store used authorization codes
 used_auth_codes = set()
+# Outlook states handed out and when. The redirect back usually lands in a new Streamlit session,
+# so they're kept here as well as in the session that issued them.
+issued_outlook_states = {}
+
+# The OAuth flow and the calendar pipeline are imported where they're used, so the landing
+# page doesn't load pandas or the API client
+
+def google_calendar_service(credentials):
+    from calendar_services import GoogleCalendarService
+    from event_store import get_event_store
+
+    return GoogleCalendarService(credentials, store=get_event_store())
+
+def outlook_calendar_service(token):
+    from calendar_services import OutlookCalendarService
+    from event_store import get_event_store
+
+    return OutlookCalendarService(token, store=get_event_store(), on_token_refresh=save_outlook_token)
+
+def save_outlook_token(token):
+    # Microsoft rotates refresh tokens, so a service built from the session later must get the new one
+    st.session_state.outlook_token = token
+
+def apple_calendar_service(username, password):
+    from calendar_services import AppleCalendarService
+    from event_store import get_event_store
+
+    return AppleCalendarService(username, password, store=get_event_store())
 
 def authenticate_calendar_service(calendar_type):
     if calendar_type == "Google":
@@ -38,6 +70,8 @@ def authenticate_google():
             return None
 
         logger.info("No existing Google credentials found, starting OAuth flow")
+        from google_auth_oauthlib.flow import Flow
+
         client_config = {
             "web": {
                 "client_id": os.environ['GOOGLE_CLIENT_ID'],
@@ -63,20 +97,65 @@ def authenticate_google():
         st.write(auth_url)
 
     if credentials:
-        return GoogleCalendarService(credentials)
+        return google_calendar_service(credentials)
     return None
 
 def authenticate_outlook():
-    # Placeholder for Outlook authentication
-    logger.info("Outlook authentication not yet implemented")
-    st.error("Outlook Calendar integration is not yet available.")
+    logger.info("Starting Outlook authentication process")
+    token = st.session_state.get('outlook_token')
+    if token:
+        return outlook_calendar_service(token)
+
+    if not os.environ.get('MICROSOFT_CLIENT_ID') or not os.environ.get('MICROSOFT_CLIENT_SECRET'):
+        logger.error("MICROSOFT_CLIENT_ID or MICROSOFT_CLIENT_SECRET environment variables are not set")
+        st.error("Outlook Calendar integration is not configured. Please contact the administrator.")
+        return None
+
+    from requests_oauthlib import OAuth2Session
+    from calendar_services import MICROSOFT_AUTHORITY
+
+    redirect_uri = 'https://meetmetricsanalyzer.streamlit.app/'
+    # One state per session, so the URL doesn't change under the user on every rerun
+    state = st.session_state.get('outlook_oauth_state')
+    if state not in issued_outlook_states:
+        state = st.session_state.outlook_oauth_state = OUTLOOK_STATE_PREFIX + secrets.token_urlsafe(16)
+        issued_outlook_states[state] = datetime.now()
+    session = OAuth2Session(
+        os.environ['MICROSOFT_CLIENT_ID'],
+        scope=OUTLOOK_SCOPES,
+        redirect_uri=redirect_uri,
+        state=state
+    )
+    auth_url, _ = session.authorization_url(f'{MICROSOFT_AUTHORITY}/oauth2/v2.0/authorize', prompt='select_account')
+
+    logger.info(f"Generated Outlook authorization URL: {auth_url}")
+    st.write("Please visit this URL to authorize the application:")
+    st.write(auth_url)
     return None
 
 def authenticate_apple():
-    # Placeholder for Apple Calendar authentication
-    logger.info("Apple Calendar authentication not yet implemented")
-    st.error("Apple Calendar integration is not yet available.")
-    return None
+    # iCloud has no OAuth for calendars; CalDAV takes the Apple ID and an app-specific password
+    logger.info("Starting Apple Calendar authentication process")
+    credentials = st.session_state.get('apple_credentials')
+    if credentials is None:
+        st.info("Apple Calendar is read over CalDAV. Sign in with your Apple ID and an app-specific password "
+                "(appleid.apple.com > Sign-In and Security > App-Specific Passwords).")
+        username = st.text_input("Apple ID")
+        password = st.text_input("App-specific password", type="password")
+        if not st.button("Connect Apple Calendar") or not username or not password:
+            return None
+        credentials = (username, password)
+
+    calendar_service = apple_calendar_service(*credentials)
+    try:
+        calendar_service.authenticate()
+    except Exception as e:
+        logger.error(f"Apple Calendar sign-in failed: {str(e)}")
+        st.error("Could not sign in to Apple Calendar. Please check your Apple ID and app-specific password.")
+        st.session_state.pop('apple_credentials', None)
+        return None
+    st.session_state.apple_credentials = credentials
+    return calendar_service
 
 def verify_environment_variables():
     logger.info("Verifying environment variables")
@@ -112,6 +191,7 @@ def handle_google_callback(code):
         redirect_uri = 'https://meetmetricsanalyzer.streamlit.app/'
         logger.info(f"Using redirect URI in callback: {redirect_uri}")
         
+        from google_auth_oauthlib.flow import Flow
         flow = Flow.from_client_config(
             client_config,
             scopes=SCOPES,
@@ -120,7 +200,8 @@ def handle_google_callback(code):
         logger.info("Flow object created successfully")
         
         try:
-            flow.fetch_token(code=code)
+            with metrics.stage('oauth_token'):
+                flow.fetch_token(code=code)
             logger.info("Token fetched successfully")
             
             # Mark the code as used
@@ -130,7 +211,7 @@ def handle_google_callback(code):
             logger.error(f"Error fetching token: {str(token_error)}")
             logger.error(f"Stack trace: {logging.traceback.format_exc()}")
             logger.error(f"Timestamp: {datetime.now().isoformat()}")
-            logger.error(f"Session state: {st.session_state}")
+            logger.error(f"Session state keys: {list(st.session_state.keys())}")
             st.error("Failed to authenticate. Please try again or contact support if the issue persists.")
             return None
         
@@ -138,19 +219,77 @@ def handle_google_callback(code):
         st.session_state.google_credentials = credentials
         logger.info("Google authentication successful")
         st.success("Google authentication successful! You can now use the app.")
-        return GoogleCalendarService(credentials)
+        return google_calendar_service(credentials)
     except Exception as e:
         logger.error(f"Error during Google authentication: {str(e)}")
         logger.error(f"Stack trace: {logging.traceback.format_exc()}")
         logger.error(f"Timestamp: {datetime.now().isoformat()}")
-        logger.error(f"Session state: {st.session_state}")
+        logger.error(f"Session state keys: {list(st.session_state.keys())}")
+        st.error("Authentication failed. Please try again or contact support if the issue persists.")
+        return None
+
+def verify_outlook_state(state):
+    # The returned state must be exactly the one this session issued or, in a new session, one
+    # this process issued within OAUTH_STATE_TTL. Either way it's good for one callback.
+    now = datetime.now()
+    for issued, issued_at in list(issued_outlook_states.items()):
+        if now - issued_at > OAUTH_STATE_TTL:
+            del issued_outlook_states[issued]
+    expected = st.session_state.pop('outlook_oauth_state', None)
+    if not state or (expected is not None and not secrets.compare_digest(state, expected)):
+        return False
+    return issued_outlook_states.pop(state, None) is not None
+
+def handle_outlook_callback(code, state):
+    try:
+        logger.info("Starting Outlook authentication callback process")
+        if not verify_outlook_state(state):
+            logger.error("Outlook callback state does not match an issued sign-in")
+            st.error("This sign-in link is invalid or has expired. Please start the authentication process again.")
+            return None
+
+        if code in used_auth_codes:
+            logger.error("Outlook authorization code has been used before")
+            st.error("This authorization code has already been used. Please start the authentication process again.")
+            return None
+
+        from requests_oauthlib import OAuth2Session
+        from calendar_services import MICROSOFT_TOKEN_URL
+
+        session = OAuth2Session(
+            os.environ['MICROSOFT_CLIENT_ID'],
+            scope=OUTLOOK_SCOPES,
+            redirect_uri='https://meetmetricsanalyzer.streamlit.app/'
+        )
+        with metrics.stage('oauth_token'):
+            token = session.fetch_token(MICROSOFT_TOKEN_URL, code=code, client_secret=os.environ['MICROSOFT_CLIENT_SECRET'])
+        used_auth_codes.add(code)
+
+        st.session_state.outlook_token = token
+        logger.info("Outlook authentication successful")
+        st.success("Outlook authentication successful! You can now use the app.")
+        return outlook_calendar_service(token)
+    except Exception as e:
+        logger.error(f"Error during Outlook authentication: {str(e)}")
+        logger.error(f"Stack trace: {logging.traceback.format_exc()}")
+        logger.error(f"Timestamp: {datetime.now().isoformat()}")
+        logger.error(f"Session state keys: {list(st.session_state.keys())}")
         st.error("Authentication failed. Please try again or contact support if the issue persists.")
         return None
 
 def clear_authentication():
     if 'google_credentials' in st.session_state:
+        from client_cache import client_cache
+        client_cache.evict(st.session_state.google_credentials)
         del st.session_state.google_credentials
+    for key in ('outlook_token', 'outlook_oauth_state', 'apple_credentials'):
+        st.session_state.pop(key, None)
     if 'calendar_service' in st.session_state:
         del st.session_state.calendar_service
+    if 'available_calendars' in st.session_state:
+        del st.session_state.available_calendars
+    # Cached dashboards belong to the account being signed out
+    if 'analysis_cache' in st.session_state:
+        st.session_state.analysis_cache.clear()
     used_auth_codes.clear()
     logger.info("Authentication data cleared")
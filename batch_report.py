@@ -0,0 +1,187 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import numpy as np
+
+from schedule_store import get_schedule_store
+from scheduler import generate_and_send_report, scheduled_report_service
+from utils import get_last_week_date_range
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROGRESS_PATH = os.path.join('.meeting_analyzer', 'batch_progress.jsonl')
+
+
+class ReportTimeout(BaseException):
+    # A BaseException so the pipeline's own `except Exception` handlers (and the API
+    # limiter's retry on TimeoutError) can't swallow it
+    pass
+
+
+def _timed_out(signum, frame):
+    raise ReportTimeout()
+
+
+def run_user_report(user_id, start_date, end_date, timeout=None, fake_events=None):
+    # Runs in a pool worker. The timeout is a SIGALRM in the worker's main thread, which is
+    # where ProcessPoolExecutor runs tasks.
+    started = time.perf_counter()
+    result = {'user_id': user_id, 'start': start_date.isoformat(), 'end': end_date.isoformat(), 'events': 0}
+    alarm = timeout and hasattr(signal, 'setitimer')
+    if alarm:
+        signal.signal(signal.SIGALRM, _timed_out)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if fake_events is not None:
+            # Synthetic calendars are for load tests; real runs never import them
+            from fake_provider import FakeCalendarService
+            calendar_service, email = FakeCalendarService(user_id, fake_events), f'{user_id}@example.com'
+        else:
+            calendar_service, email = scheduled_report_service(user_id)
+            if calendar_service is None:
+                raise LookupError(f"No stored schedule or credentials for {user_id}")
+        result['events'] = generate_and_send_report(calendar_service, email, start_date, end_date)
+        result['status'] = 'ok'
+    except ReportTimeout:
+        result.update(status='timeout', error=f"Timed out after {timeout}s")
+    except Exception as e:
+        result.update(status='failed', error=f"{type(e).__name__}: {e}")
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def load_progress(path, start_date, end_date):
+    # Users already reported for this date range; anything else is retried
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if (record.get('status') == 'ok' and record.get('start') == start_date.isoformat()
+                    and record.get('end') == end_date.isoformat()):
+                done.add(record['user_id'])
+    return done
+
+
+def summarize(results, elapsed, skipped=0):
+    statuses = Counter(result['status'] for result in results)
+    seconds = np.array([result['seconds'] for result in results]) if results else np.zeros(1)
+    events = sum(result['events'] for result in results)
+    return {
+        'users': len(results) + skipped,
+        'skipped': skipped,
+        'ok': statuses['ok'],
+        'failed': statuses['failed'],
+        'timeout': statuses['timeout'],
+        'seconds': elapsed,
+        'reports_per_minute': statuses['ok'] / elapsed * 60 if elapsed else 0.0,
+        'events_per_second': events / elapsed if elapsed else 0.0,
+        'p50_seconds': float(np.percentile(seconds, 50)),
+        'p95_seconds': float(np.percentile(seconds, 95)),
+        'errors': Counter(result['error'].split(':')[0] for result in results if result.get('error')).most_common(5),
+    }
+
+
+def run_batch(user_ids, start_date, end_date, workers=None, timeout=300, progress_path=DEFAULT_PROGRESS_PATH,
+              fake_events=None):
+    user_ids = list(dict.fromkeys(user_ids))
+    done = load_progress(progress_path, start_date, end_date)
+    pending = [user_id for user_id in user_ids if user_id not in done]
+    if done:
+        logger.info(f"Resuming: {len(user_ids) - len(pending)} of {len(user_ids)} users already reported")
+    os.makedirs(os.path.dirname(os.path.abspath(progress_path)), exist_ok=True)
+
+    results = []
+    started = time.perf_counter()
+    with open(progress_path, 'a') as progress, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_user_report, user_id, start_date, end_date, timeout, fake_events): user_id
+            for user_id in pending
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died
+                result = {'user_id': futures[future], 'start': start_date.isoformat(), 'end': end_date.isoformat(),
+                          'events': 0, 'status': 'failed', 'error': f"{type(e).__name__}: {e}", 'seconds': 0.0}
+            if result['status'] != 'ok':
+                logger.warning(f"Report for {result['user_id']} {result['status']}: {result['error']}")
+            progress.write(json.dumps(result) + '\n')
+            progress.flush()
+            results.append(result)
+    return summarize(results, time.perf_counter() - started, skipped=len(user_ids) - len(pending))
+
+
+def print_summary(summary):
+    print(f"{summary['users']} users: {summary['ok']} ok, {summary['failed']} failed, "
+          f"{summary['timeout']} timed out, {summary['skipped']} already done")
+    print(f"{summary['seconds']:.1f}s, {summary['reports_per_minute']:.1f} reports/min, "
+          f"{summary['events_per_second']:.0f} events/s, per user p50 {summary['p50_seconds']:.2f}s "
+          f"p95 {summary['p95_seconds']:.2f}s")
+    for error, count in summary['errors']:
+        print(f"  {count} x {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate and send calendar reports for many users")
+    users = parser.add_mutually_exclusive_group(required=True)
+    users.add_argument('--users', help="File with one user id per line ('-' for stdin)")
+    users.add_argument('--scheduled', action='store_true', help="Every user with a stored report schedule")
+    users.add_argument('--fake-users', type=int, help="Generate this many synthetic users (implies --fake-provider)")
+    parser.add_argument('--start', type=date.fromisoformat, help="First day of the report (default: last week)")
+    parser.add_argument('--end', type=date.fromisoformat, help="Last day of the report")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds allowed per user")
+    parser.add_argument('--progress', default=DEFAULT_PROGRESS_PATH, help="Progress file used to resume runs")
+    parser.add_argument('--fake-provider', action='store_true', help="Use synthetic calendars instead of Google")
+    parser.add_argument('--fake-events', type=int, default=150, help="Synthetic meetings per user per week")
+    parser.add_argument('--smtp-sink', action='store_true', help="Deliver to a local SMTP sink instead")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start_date, end_date = get_last_week_date_range()
+    start_date, end_date = args.start or start_date, args.end or end_date
+    if args.fake_users is not None:
+        user_ids = [f'fake{i}' for i in range(args.fake_users)]
+    elif args.scheduled:
+        user_ids = [schedule['user_id'] for schedule in get_schedule_store().list_schedules()]
+    else:
+        with (sys.stdin if args.users == '-' else open(args.users)) as f:
+            user_ids = [line.strip() for line in f if line.strip()]
+    fake_events = args.fake_events if args.fake_provider or args.fake_users is not None else None
+
+    sink = None
+    if args.smtp_sink:
+        from smtp_sink import SMTPSink
+        sink = SMTPSink().start()
+        os.environ.update({'SMTP_HOST': sink.address[0], 'SMTP_PORT': str(sink.address[1]), 'SMTP_STARTTLS': '0'})
+        os.environ.pop('SMTP_USERNAME', None)
+    try:
+        summary = run_batch(user_ids, start_date, end_date, args.workers, args.timeout, args.progress, fake_events)
+    finally:
+        if sink:
+            sink.stop()
+    print_summary(summary)
+    if sink:
+        print(f"SMTP sink received {sink.stats()}")
+    sys.exit(1 if summary['failed'] or summary['timeout'] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1088 @@
+import argparse
+import gc
+import heapq
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import random
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from googleapiclient.errors import HttpError
+
+from aggregate_store import AggregateStore
+from attendee_index import build_attendee_index, internal_external, pair_hours, top_collaborators
+from calendar_services import GoogleCalendarService, SELECTED_CALENDARS, SYNC_FUTURE_DAYS, join_addresses
+from categorizer import DEFAULT_RULES, compile_rules
+from client_cache import client_cache
+from data_processor import analyze_calendar_data, analyze_intervals
+from email_sender import send_email_report
+from event_schema import compact_event_frame
+from event_store import EventStore
+from fake_provider import (
+    generate_events, generate_series, synthetic_apple_service, synthetic_google_service,
+    synthetic_outlook_service
+)
+from figure_renderer import FigureRenderer, renderer
+from incremental_analysis import IncrementalAnalysis
+from metrics import metrics
+from org_rollups import query_aggregate, run_org_rollup, summarize_aggregate
+from rate_limiter import RateLimiter, google_retry_delay
+from schedule_store import ScheduleStore
+import scheduler as report_scheduler
+from batch_report import run_batch
+from smtp_sink import SMTPSink
+from smtp_pool import SMTPPool
+from visualizer import create_visualizations
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+SUMMARIES = ['Project sync', 'Team standup', 'Client call', 'Interview', 'Training session', '1:1', 'Lunch']
+
+
+def make_frame(n, seed=0):
+    # An already-parsed event frame, for benchmarks that start after fetch_events
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2024-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 4 * 24 * 365 * 3, n) * 15, unit='m')
+    duration = rng.integers(1, 9, n) * 0.25
+    return pd.DataFrame({
+        'summary': rng.choice(SUMMARIES, n).astype(object),
+        'start': start,
+        'end': start + pd.to_timedelta(duration, unit='h'),
+        'duration': duration,
+        'attendees': rng.integers(0, 13, n),
+        'category': rng.choice(['Project', 'Department', 'Client', 'Recruitment', 'Training', 'Other'], n).astype(object),
+        'calendar_id': 'primary',
+    })
+
+
+def measure(fn):
+    # Time and memory are taken on separate runs so tracemalloc's overhead doesn't skew the timing.
+    # Fake API payloads already in memory are frozen so the cyclic GC doesn't rescan them on every run.
+    gc.collect()
+    gc.freeze()
+    try:
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        gc.unfreeze()
+    return result, elapsed, peak
+
+
+def bench_fetch_events(sizes=(1_000, 10_000, 100_000)):
+    # Seconds leave out the time the stand-in server spends producing responses. The window opens a
+    # day early: generated meetings on 1 January in Asian time zones start on 31 December in UTC.
+    print(f"{'events':>8} {'pages':>6} {'seconds':>9} {'peak MiB':>9}")
+    for n in sizes:
+        service = synthetic_google_service(generate_events(n, seed=n))
+        http = service.http_fake
+        served = []
+
+        def fetch():
+            server = http.server_seconds
+            df = service.fetch_events(datetime(2023, 12, 31), datetime(2027, 12, 31))
+            served.append(http.server_seconds - server)
+            return df
+
+        df, elapsed, peak = measure(fetch)
+        pages = -(-n // service.max_results)
+        print(f"{n:>8} {pages:>6} {elapsed - served[0]:>9.3f} {peak / 2**20:>9.1f}")
+
+
+def bench_sync(sizes=(1_000, 10_000, 100_000), changes=50):
+    print(f"{'events':>8} {'full s':>8} {'full calls':>10} {'incr s':>8} {'incr calls':>10}")
+    for n in sizes:
+        items = generate_events(n, seed=n)
+        service = synthetic_google_service(items, store=EventStore(':memory:'), user_id='bench')
+        http = service.http_fake
+        started = time.perf_counter()
+        service.sync()
+        full = time.perf_counter() - started - http.server_seconds
+        full_calls = http.calls
+
+        edited = [dict(event, summary='Client review') for event in items[:changes // 2]]
+        cancelled = [{'id': event['id'], 'status': 'cancelled'} for event in items[changes // 2:changes]]
+        http.update(edited + cancelled)
+        started, server = time.perf_counter(), http.server_seconds
+        service.sync()
+        incremental = time.perf_counter() - started - (http.server_seconds - server)
+        print(f"{n:>8} {full:>8.3f} {full_calls:>10} {incremental:>8.3f} {http.calls - full_calls:>10}")
+
+
+def _count_response_bytes(http_fake):
+    request = http_fake.request
+    http_fake.bytes = 0
+
+    def counted(*args, **kwargs):
+        response, content = request(*args, **kwargs)
+        http_fake.bytes += len(content)
+        return response, content
+
+    http_fake.request = counted
+
+
+def bench_providers(sizes=(1_000, 10_000, 50_000), changes=50):
+    # The same synthetic calendar through each provider and its stand-in server: a range fetch, a full
+    # sync into a store and an incremental sync after `changes` edits. Seconds exclude server time.
+    providers = {'google': synthetic_google_service, 'outlook': synthetic_outlook_service,
+                 'apple': synthetic_apple_service}
+    window = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+    print(f"{'events':>8} {'provider':<8} {'range s':>8} {'calls':>5} {'KiB':>7} {'full s':>7} {'calls':>5} "
+          f"{'incr s':>7} {'calls':>5} {'KiB':>6}")
+    for n in sizes:
+        items = generate_events(n, seed=n)
+        edited = [dict(event, summary='Client review') for event in items[:changes // 2]]
+        cancelled = [dict(event, status='cancelled') for event in items[changes // 2:changes]]
+        for name, factory in providers.items():
+            service = factory(items)
+            service.authenticate()
+            http = service.http_fake
+            _count_response_bytes(http)
+            started, server = time.perf_counter(), http.server_seconds
+            service.fetch_events(*window)
+            fetch = time.perf_counter() - started - (http.server_seconds - server)
+            fetch_calls, fetch_bytes = http.calls, http.bytes
+
+            service = factory(items, store=EventStore(':memory:'), user_id='bench')
+            service.authenticate()
+            http = service.http_fake
+            _count_response_bytes(http)
+            started = time.perf_counter()
+            service.fetch_events(*window)
+            full = time.perf_counter() - started - http.server_seconds
+            full_calls = http.calls
+
+            http.update(edited + cancelled)
+            started, server, received = time.perf_counter(), http.server_seconds, http.bytes
+            service.fetch_events(*window)
+            incremental = time.perf_counter() - started - (http.server_seconds - server)
+            print(f"{n:>8} {name:<8} {fetch:>8.3f} {fetch_calls:>5} {fetch_bytes / 1024:>7.0f} {full:>7.3f} "
+                  f"{full_calls:>5} {incremental:>7.3f} {http.calls - full_calls:>5} {(http.bytes - received) / 1024:>6.0f}")
+
+
+def bench_recurrence(sizes=(10_000, 50_000)):
+    # A recurrence-heavy Google calendar (generate_series) fetched for a year with server-side
+    # expansion (singleEvents=True) and with series expanded locally: calls, response size and
+    # seconds without server time, for a range fetch and a full sync into a store
+    year = datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2025, 1, 1, tzinfo=timezone.utc)
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    sync_end = today + timedelta(days=SYNC_FUTURE_DAYS)
+    print(f"{'instances':>9} {'mode':<7} {'range s':>8} {'calls':>5} {'KiB':>7} {'sync s':>7} {'calls':>5} {'KiB':>7}")
+    for n in sizes:
+        items = generate_series(n, seed=n)
+        for mode, local in (('server', False), ('local', True)):
+            service = synthetic_google_service(items, horizon=year[1], local_recurrence=local)
+            http = service.http_fake
+            _count_response_bytes(http)
+            started, server = time.perf_counter(), http.server_seconds
+            df = service.fetch_events(year[0], year[1] - timedelta(days=1))
+            fetch = time.perf_counter() - started - (http.server_seconds - server)
+            fetch_calls, fetch_bytes = http.calls, http.bytes
+
+            # The windowed local sync expands to SYNC_FUTURE_DAYS past today, so the server expands as far
+            service = synthetic_google_service(items, horizon=sync_end, local_recurrence=local,
+                                               store=EventStore(':memory:'), user_id='bench')
+            http = service.http_fake
+            _count_response_bytes(http)
+            started = time.perf_counter()
+            service.fetch_events(year[0], year[1] - timedelta(days=1))
+            full = time.perf_counter() - started - http.server_seconds
+            print(f"{len(df):>9} {mode:<7} {fetch:>8.3f} {fetch_calls:>5} {fetch_bytes / 1024:>7.0f} "
+                  f"{full:>7.3f} {http.calls:>5} {http.bytes / 1024:>7.0f}")
+
+
+def bench_metrics(sizes=(10_000, 100_000), repeats=3):
+    # Fetch, analyze and build figures with stage instrumentation off and on; best of `repeats`
+    items_by_size = {n: generate_events(n, seed=n) for n in sizes}
+    print(f"{'events':>8} {'off s':>8} {'on s':>8} {'overhead':>8} {'stages':>6}")
+    window = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+    enabled = metrics.enabled
+    try:
+        for n in sizes:
+            timings = {}
+            for metrics.enabled in (False, True):
+                metrics.reset()
+                best = float('inf')
+                for _ in range(repeats):
+                    service = synthetic_google_service(items_by_size[n])
+                    started = time.perf_counter()
+                    df = service.fetch_events(*window)
+                    create_visualizations(df, analyze_calendar_data(df))
+                    best = min(best, time.perf_counter() - started - service.http_fake.server_seconds)
+                timings[metrics.enabled] = best
+            stages = sum(h['count'] for h in metrics.snapshot()['histograms']) // repeats
+            print(f"{n:>8} {timings[False]:>8.3f} {timings[True]:>8.3f} "
+                  f"{timings[True] / timings[False] - 1:>7.1%} {stages:>6}")
+    finally:
+        metrics.enabled = enabled
+        metrics.reset()
+
+
+def bench_rollups(sizes=(10_000, 100_000), days=(7, 30, 90, 365)):
+    # Dashboard-style analysis of one year of events, from raw events vs. from daily rollups.
+    # Both include the incremental sync that precedes every query.
+    print(f"{'events':>8} {'days':>5} {'raw s':>8} {'rollups s':>9} {'speedup':>7}")
+    for n in sizes:
+        service = synthetic_google_service(generate_events(n, seed=n), store=EventStore(':memory:'), user_id='bench')
+        service.sync()
+        for span in days:
+            window = (datetime(2024, 1, 1), datetime(2024, 1, 1) + timedelta(days=span - 1))
+            started = time.perf_counter()
+            analyze_calendar_data(service.fetch_events(*window))
+            raw_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            service.fetch_analysis(*window)
+            rollup_seconds = time.perf_counter() - started
+            print(f"{n:>8} {span:>5} {raw_seconds:>8.3f} {rollup_seconds:>9.3f} {raw_seconds / rollup_seconds:>6.1f}x")
+
+
+def bench_multi_calendar(sizes=(1_000, 10_000, 100_000), calendars=8, latency=0.05):
+    # Each fake API call sleeps to stand in for network round trips. Threads only overlap that
+    # waiting: 'cpu s' is the parallel fetch without it (the fake server's JSON encoding included),
+    # the floor for 'parallel s' on one core.
+    print(f"{'events':>8} {'calendars':>9} {'slowest s':>9} {'serial s':>9} {'parallel s':>10} {'cpu s':>7}")
+    for n in sizes:
+        per_calendar = {f'cal{c}@example.com': generate_events(n // calendars, seed=c, prefix=f'cal{c}x')
+                        for c in range(calendars)}
+        window = (datetime(2023, 12, 31), datetime(2027, 12, 31))
+        timings = []
+        for cal, items in per_calendar.items():
+            service = synthetic_google_service(calendars={cal: items}, latency=latency, calendar_ids=[cal])
+            started = time.perf_counter()
+            service.fetch_events(*window)
+            timings.append(time.perf_counter() - started)
+        parallel = []
+        for delay in (latency, 0):
+            service = synthetic_google_service(calendars=per_calendar, latency=delay, calendar_ids=SELECTED_CALENDARS)
+            started = time.perf_counter()
+            service.fetch_events(*window)
+            parallel.append(time.perf_counter() - started)
+        print(f"{n:>8} {calendars:>9} {max(timings):>9.3f} {sum(timings):>9.3f} {parallel[0]:>10.3f} {parallel[1]:>7.3f}")
+
+
+def bench_authenticate(sizes=(10, 100)):
+    # sizes is the number of authenticate() calls made on one warm session
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+
+    credentials = Credentials(token='bench', refresh_token='bench', client_id='bench')
+    print(f"{'calls':>8} {'uncached ms/call':>16} {'cached ms/call':>14}")
+    for n in sizes:
+        started = time.perf_counter()
+        for _ in range(n):
+            build('calendar', 'v3', credentials=credentials)
+        uncached = (time.perf_counter() - started) / n
+        client_cache.evict(credentials)
+        service = GoogleCalendarService(credentials)
+        started = time.perf_counter()
+        for _ in range(n):
+            service.authenticate()
+        cached = (time.perf_counter() - started) / n
+        client_cache.evict(credentials)
+        print(f"{n:>8} {uncached * 1000:>16.3f} {cached * 1000:>14.3f}")
+
+
+class QuotaServer(ThreadingHTTPServer):
+    # Local stand-in for the Calendar API: enforces a project QPS quota with 429s and injects random 503s
+    daemon_threads = True
+
+    def __init__(self, qps, error_rate=0.02):
+        super().__init__(('127.0.0.1', 0), QuotaHandler)
+        self.qps = qps
+        self.tokens = qps
+        self.updated = time.monotonic()
+        self.error_rate = error_rate
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def admit(self):
+        # Rejected calls still count against the quota, up to one second of debt
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = max(-self.qps, min(self.qps, self.tokens + (now - self.updated) * self.qps) - 1)
+            self.updated = now
+            return self.tokens >= 0
+
+    def count(self, status):
+        with self.lock:
+            self.counts[status] += 1
+
+
+class QuotaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if random.random() < self.server.error_rate:
+            self.reply(503, {'error': {'code': 503, 'message': 'Backend Error'}})
+        elif not self.server.admit():
+            self.reply(429, {'error': {'code': 429, 'message': 'Rate Limit Exceeded'}}, {'Retry-After': '1'})
+        else:
+            self.reply(200, {'items': []})
+
+    def reply(self, status, body, headers=None):
+        self.server.count(status)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_rate_limit(sizes=(20, 100), requests_per_user=10, server_qps=30):
+    # sizes is the number of users whose reports run at the same time
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+
+    naive = dict(project_rate=float('inf'), user_rate=float('inf'), max_retries=50, base_delay=0,
+                 retry_delay=lambda e: None if google_retry_delay(e) is None else 0)
+    shaped = dict(project_rate=server_qps * 0.9, user_rate=5)
+    print(f"{'users':>6} {'policy':>7} {'seconds':>8} {'ok/s':>7} {'requests':>9} {'429s':>6} {'503s':>5} {'failed':>6}")
+    for users in sizes:
+        for policy, options in (('naive', naive), ('limiter', shaped)):
+            server = QuotaServer(server_qps)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            limiter = RateLimiter(**options)
+            endpoint = f'http://127.0.0.1:{server.server_port}/calendar/v3/'
+
+            def run_user(i):
+                credentials = Credentials(token=f'user{i}')
+                service = GoogleCalendarService(credentials, limiter=limiter, user_id=f'user{i}')
+                service.service = build('calendar', 'v3', credentials=credentials, cache_discovery=False,
+                                        client_options={'api_endpoint': endpoint})
+                failed = 0
+                for _ in range(requests_per_user):
+                    try:
+                        service.fetch_events(datetime(2024, 1, 1), datetime(2024, 1, 7))
+                    except HttpError:
+                        failed += 1
+                return failed
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=users) as pool:
+                failed = sum(pool.map(run_user, range(users)))
+            elapsed = time.perf_counter() - started
+            server.shutdown()
+            counts = server.counts
+            print(f"{users:>6} {policy:>7} {elapsed:>8.2f} {counts[200] / elapsed:>7.1f} "
+                  f"{sum(counts.values()):>9} {counts[429]:>6} {counts[503]:>5} {failed:>6}")
+
+
+def legacy_categorize(summary):
+    # The per-row chain fetch_events used before rules were compiled
+    summary = summary.lower()
+    if 'project' in summary:
+        return 'Project'
+    elif 'department' in summary or 'team' in summary:
+        return 'Department'
+    elif 'client' in summary or 'customer' in summary:
+        return 'Client'
+    elif 'interview' in summary:
+        return 'Recruitment'
+    elif 'training' in summary or 'workshop' in summary:
+        return 'Training'
+    else:
+        return 'Other'
+
+
+def best_time(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def bench_categorize(sizes=(100_000, 1_000_000), threshold=0.25, repeats=3):
+    # Fails when the compiled rules are more than `threshold` slower than the per-row chain on any
+    # mix of summaries, the all-distinct worst case included (tests/test_categorizer.py checks they agree)
+    categorizer = compile_rules(DEFAULT_RULES)
+    print(f"{'events':>8} {'distinct':>8} {'per-row s':>9} {'compiled s':>10}")
+    regressions = 0
+    for n in sizes:
+        rng = random.Random(n)
+        repeated = [rng.choice(SUMMARIES) for _ in range(n)]
+        # Mostly recurring series with some one-off meetings, then the all-distinct worst case
+        mixed = [f'{s} #{rng.randrange(n // 20)}' if rng.random() < 0.8 else f'{s} #{i}' for i, s in enumerate(repeated)]
+        distinct = [f'{summary} #{i}' for i, summary in enumerate(repeated)]
+        for summaries in (repeated, mixed, distinct):
+            df = pd.DataFrame({'summary': summaries, 'attendees': np.zeros(n, dtype='int64')})
+            expected, legacy = best_time(lambda: df['summary'].map(legacy_categorize), repeats)
+            categories, compiled = best_time(lambda: categorizer.categorize(df), repeats)
+            distinct_count = df['summary'].nunique()
+            print(f"{n:>8} {distinct_count:>8} {legacy:>9.3f} {compiled:>10.3f}")
+            if compiled > legacy * (1 + threshold):
+                print(f"REGRESSION {n} events, {distinct_count} distinct: {legacy:.3f} s per row -> {compiled:.3f} s compiled")
+                regressions += 1
+    return regressions
+
+
+def legacy_analyze(df):
+    # analyze_calendar_data plus the groupbys create_visualizations repeated, before the shared engine
+    df = df.copy()
+    result = {
+        'total_meetings': len(df),
+        'total_duration': df['duration'].sum(),
+        'avg_duration': df['duration'].mean(),
+        'avg_attendees': df['attendees'].mean(),
+    }
+    df['day'] = df['start'].dt.date
+    result['meetings_by_day'] = df.groupby('day').size()
+    result['meetings_by_category'] = df.groupby('category').size()
+    result['duration_by_category'] = df.groupby('category')['duration'].sum()
+    result['per_day_chart'] = df.groupby(df['start'].dt.date).size()
+    result['category_chart'] = df.groupby('category')['duration'].sum()
+    df['hour'] = df['start'].dt.hour
+    result['hour_chart'] = df['hour'].value_counts()
+    return result
+
+
+def bench_analyze(sizes=(10_000, 100_000, 1_000_000)):
+    print(f"{'events':>8} {'before s':>9} {'after s':>8}")
+    for n in sizes:
+        df = make_frame(n)
+        started = time.perf_counter()
+        expected = legacy_analyze(df)
+        before = time.perf_counter() - started
+        started = time.perf_counter()
+        analysis = analyze_calendar_data(df)
+        after = time.perf_counter() - started
+        print(f"{n:>8} {before:>9.3f} {after:>8.3f}")
+
+
+def bench_progressive(sizes=(10_000, 100_000, 1_000_000), latency=0.05, refresh=0.5):
+    # The dashboard's streamed fetch against the batch path, with `latency` per API page: the
+    # first figures come after one page whatever the calendar size (tests/test_incremental_analysis.py
+    # checks the final ones match). Seconds exclude server time.
+    window = (datetime(2024, 1, 1).date(), datetime(2024, 12, 31).date())
+    print(f"{'events':>8} {'pages':>5} {'batch s':>8} {'first s':>8} {'stream s':>8} {'updates':>7} {'update ms':>9}")
+    for n in sizes:
+        items = generate_events(n, seed=n)
+        service = synthetic_google_service(items, latency=latency)
+        service.authenticate()
+        started = time.perf_counter()
+        analyze_calendar_data(service.fetch_events(*window))
+        batch = time.perf_counter() - started - service.http_fake.server_seconds
+
+        service = synthetic_google_service(items, latency=latency)
+        service.authenticate()
+        incremental, first, shown, updates, updating = IncrementalAnalysis(), None, None, 0, 0.0
+        started = time.perf_counter()
+        for position, frame in service.iter_events(*window):
+            incremental.add(position, frame)
+            now = time.perf_counter()
+            if shown is None or now - shown >= refresh:
+                incremental.analysis()
+                shown = time.perf_counter()
+                updates, updating = updates + 1, updating + shown - now
+                first = first or shown - started - service.http_fake.server_seconds
+        incremental.result()
+        stream = time.perf_counter() - started - service.http_fake.server_seconds
+        print(f"{n:>8} {len(incremental.batches):>5} {batch:>8.2f} {first:>8.3f} {stream:>8.2f} {updates:>7} "
+              f"{updating / updates * 1000:>9.1f}")
+
+
+def bench_dashboard_cache(sizes=(1_000, 10_000, 100_000), reruns=5):
+    # Dashboard reruns through Streamlit's AppTest: the first run fetches, analyzes and builds the
+    # figures; reruns with nothing new synced come from the session's analysis cache without an API
+    # call; a sync elsewhere that brings a change moves the data version and the next run misses
+    # (tests/test_analysis_cache.py checks what each run shows). Seconds are the page's own stage time, as AppTest polls for the script to finish.
+    from streamlit.testing.v1 import AppTest
+
+    from utils import get_last_week_date_range
+
+    os.environ.setdefault('GOOGLE_CLIENT_ID', 'dashboard-benchmark')
+    os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'dashboard-benchmark')
+    start_date, _ = get_last_week_date_range()
+    app_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    print(f"{'events':>8} {'cold s':>7} {'warm ms':>8} {'synced s':>8} {'cache MiB':>9}  stats")
+    enabled = metrics.enabled
+    metrics.enabled = True
+    try:
+        for n in sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                items = generate_events(n, seed=n, start=start_date, days=7)
+                service = synthetic_google_service(items, store=EventStore(os.path.join(tmp, 'events.sqlite3')))
+                app = AppTest.from_file(app_file, default_timeout=600)
+                app.session_state['calendar_service'] = service
+                app.session_state['page'] = 'Dashboard'
+
+                def run():
+                    metrics.reset()
+                    app.run()
+                    if app.exception or app.error:
+                        raise RuntimeError(f"Dashboard failed: {app.exception or app.error}")
+                    page = [h for h in metrics.snapshot()['histograms'] if h['labels'].get('stage') == 'page']
+                    return page[0]['sum']
+
+                cold = run()
+                warm = [run() for _ in range(reruns)]
+
+                # Another sync (a scheduled report, say) picks up a new meeting
+                service.http_fake.update(generate_events(1, seed=-1, start=start_date, days=7, prefix='new'))
+                service.fetch_events(start_date, start_date + timedelta(days=1))
+                synced = run()
+                cache = app.session_state['analysis_cache']
+                print(f"{n:>8} {cold:>7.2f} {min(warm) * 1000:>8.1f} {synced:>8.2f} {cache.bytes / 2 ** 20:>9.1f}  "
+                      f"{cache.stats()}")
+    finally:
+        metrics.enabled = enabled
+        metrics.reset()
+
+
+def pairwise_overlaps(df):
+    # Every meeting checked against every other, what an O(n^2) overlap report does
+    start = df['start'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    end = df['end'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    overlapping = np.zeros(len(df), dtype=bool)
+    pairs = 0
+    for i in range(len(df)):
+        others = (start[i + 1:] < end[i]) & (start[i] < end[i + 1:])
+        pairs += int(others.sum())
+        overlapping[i] |= others.any()
+        overlapping[i + 1:] |= others
+    return overlapping, pairs
+
+
+def bench_intervals(sizes=(10_000, 100_000, 1_000_000), pairwise_limit=20_000):
+    # Sweep-line overlap, busy and focus analytics, against pairwise comparison where that finishes
+    # (tests/test_intervals.py checks they agree)
+    print(f"{'events':>8} {'pairwise s':>10} {'sweep s':>8} {'overlapping':>11} {'busy h':>8} {'double h':>8} {'focus h':>8}")
+    for n in sizes:
+        df = make_frame(n)
+        pairwise = float('nan')
+        if n <= pairwise_limit:
+            started = time.perf_counter()
+            pairwise_overlaps(df)
+            pairwise = time.perf_counter() - started
+        started = time.perf_counter()
+        intervals = analyze_intervals(df)
+        sweep = time.perf_counter() - started
+        print(f"{n:>8} {pairwise:>10.3f} {sweep:>8.3f} {intervals.overlapping_meetings:>11} {intervals.busy_hours:>8.0f} "
+              f"{intervals.double_booked_hours:>8.0f} {intervals.by_day['focus'].sum():>8.0f}")
+
+
+def attendee_frame(n, distinct, seed=0, large_share=0.02):
+    # make_frame with attendee addresses: `distinct` events get a list of their own drawn from
+    # 20,000 people at 200 domains, the rest reuse one team's lists; large_share of either have
+    # 50 to 500 attendees
+    rng = np.random.default_rng(seed)
+    df = make_frame(n, seed)
+    people = np.array([f'person{j}@org{j % 200}.example' for j in range(20_000)], dtype=object)
+    sizes = np.where(rng.random(n) < large_share, rng.choice([50, 120, 250, 500], n), rng.integers(0, 13, n))
+    own = rng.random(n) < distinct
+    shared = [join_addresses(people[:k].tolist()) for k in range(13)] + [
+        join_addresses([f'member{j}@lists.example' for j in range(k)]) for k in (50, 120, 250, 500)]
+    emails = np.array([shared[k] if k < 13 else shared[13 + [50, 120, 250, 500].index(k)] for k in sizes],
+                      dtype=object)
+    for i in np.flatnonzero(own & (sizes > 0)):
+        emails[i] = join_addresses(people[rng.choice(len(people), sizes[i], replace=False)].tolist())
+    df['attendees'] = sizes
+    df['attendee_emails'] = pd.Categorical(emails)
+    return compact_event_frame(df)
+
+
+def bench_attendee_index(sizes=(10_000, 100_000, 1_000_000), distinct=(0.0, 0.5), explode_limit=100_000):
+    # Memory and query latency of the attendee index, against splitting the addresses per query;
+    # `distinct` is the share of events whose attendee list no other event has
+    print(f"{'events':>8} {'distinct':>8} {'lists':>7} {'text B/ev':>9} {'index B/ev':>10} {'build ms':>8} "
+          f"{'entries':>9} {'top ms':>7} {'int/ext ms':>10} {'pairs ms':>8} {'explode ms':>10}")
+    for n in sizes:
+        for share in distinct:
+            df = attendee_frame(n, share, seed=n)
+            text = df['attendee_emails'].memory_usage(deep=True) / n
+            started = time.perf_counter()
+            index = build_attendee_index(df)
+            build = time.perf_counter() - started
+            timings = []
+            for query in (top_collaborators, internal_external, pair_hours):
+                started = time.perf_counter()
+                query(index)
+                timings.append(time.perf_counter() - started)
+            explode = float('nan')
+            if n <= explode_limit:
+                started = time.perf_counter()
+                addresses = df['attendee_emails'].astype(object).str.lower().str.split('\n').explode()
+                df['duration'].astype('float64').reindex(addresses.index).groupby(addresses.to_numpy()).sum()
+                explode = time.perf_counter() - started
+            print(f"{n:>8} {share:>8.0%} {len(index.list_meetings):>7} {text:>9.0f} {index.nbytes / n:>10.1f} "
+                  f"{build * 1000:>8.1f} {len(index.ids):>9} {timings[0] * 1000:>7.1f} {timings[1] * 1000:>10.1f} "
+                  f"{timings[2] * 1000:>8.1f} {explode * 1000:>10.1f}")
+
+
+def bench_schema(sizes=(10_000, 100_000, 1_000_000)):
+    print(f"{'events':>8} {'object B/ev':>11} {'typed B/ev':>10} {'compact B/ev':>12}")
+    for n in sizes:
+        typed = make_frame(n)
+        # What df.append used to produce: every column object dtype, times as Python datetimes
+        legacy = typed.astype(object)
+        legacy['start'] = typed['start'].array.to_pydatetime()
+        legacy['end'] = typed['end'].array.to_pydatetime()
+        compact = compact_event_frame(typed)
+        sizes_per_event = [frame.memory_usage(deep=True).sum() / n for frame in (legacy, typed, compact)]
+        print(f"{n:>8} {sizes_per_event[0]:>11.0f} {sizes_per_event[1]:>10.0f} {sizes_per_event[2]:>12.0f}")
+
+
+def bench_render(sizes=(1, 2, 4), events=2_000):
+    # sizes is the number of render processes; every run renders the eight report figures
+    figs = create_visualizations(make_frame(events))
+    for fig in figs:
+        fig.to_image(format='png')  # start Kaleido once, so no run pays for it
+    started = time.perf_counter()
+    sequential_bytes = sum(len(fig.to_image(format='png')) for fig in figs)
+    sequential = time.perf_counter() - started
+    print(f"sequential to_image: {sequential:.3f} s, {sequential_bytes} bytes")
+    print(f"{'workers':>7} {'cold s':>7} {'warm s':>7} {'cached s':>8} {'jpeg KiB':>8} {'png KiB':>8}")
+    for workers in sizes:
+        renderer = FigureRenderer(workers=workers)
+        started = time.perf_counter()
+        renderer.render(figs)
+        cold = time.perf_counter() - started
+        renderer._cache.clear()
+        started = time.perf_counter()
+        png = renderer.render(figs)
+        warm = time.perf_counter() - started
+        started = time.perf_counter()
+        renderer.render(figs)
+        cached = time.perf_counter() - started
+        jpeg = renderer.render(figs, image_format='jpeg', width=600, height=400)
+        renderer.close()
+        print(f"{workers:>7} {cold:>7.3f} {warm:>7.3f} {cached:>8.4f} "
+              f"{sum(map(len, jpeg)) / 1024:>8.0f} {sum(map(len, png)) / 1024:>8.0f}")
+
+
+def bench_figures(sizes=(1_000, 10_000, 100_000)):
+    # Report figures with raw per-event traces vs. server-side binning. Payload is the JSON Streamlit
+    # ships to the browser; render is one Kaleido (headless plotly.js) pass, a proxy for browser time.
+    renderer = FigureRenderer(workers=1, cache_size=0)
+    renderer.render(create_visualizations(make_frame(100)))  # start Kaleido and plotly's validators
+    print(f"{'events':>8} {'mode':>6} {'build s':>8} {'payload KiB':>11} {'render s':>8}")
+    for n in sizes:
+        df = make_frame(n)
+        analysis = analyze_calendar_data(df)
+        for large_data in (False, True):
+            started = time.perf_counter()
+            figs = create_visualizations(df, analysis, large_data=large_data)
+            build = time.perf_counter() - started
+            payload = sum(len(pio.to_json(fig, validate=False)) for fig in figs)
+            started = time.perf_counter()
+            renderer.render(figs)
+            render = time.perf_counter() - started
+            print(f"{n:>8} {'binned' if large_data else 'raw':>6} {build:>8.3f} {payload / 1024:>11.0f} {render:>8.2f}")
+    renderer.close()
+
+
+def simulate_reports(fire_times, durations, workers, grace):
+    # Replays a bounded executor on a simulated clock; returns start times (nan when missed)
+    free = [0.0] * workers
+    starts = np.full(len(fire_times), np.nan)
+    for i in np.argsort(fire_times, kind='stable'):
+        worker_free = heapq.heappop(free)
+        start = max(fire_times[i], worker_free)
+        if start - fire_times[i] > grace:
+            heapq.heappush(free, worker_free)
+            continue
+        starts[i] = start
+        heapq.heappush(free, start + durations[i])
+    return starts
+
+
+def bench_scheduler(sizes=(1_000, 5_000), popular_share=0.7, report_seconds=8.0, calls_per_report=10):
+    # Most users keep the default Monday 09:00 slot; the rest pick a random weekday hour.
+    # Fire times come from the real report trigger, so they include its jitter.
+    rng = np.random.default_rng(0)
+    random.seed(0)
+    week = datetime(2024, 1, 7, tzinfo=timezone.utc)  # a Sunday
+    grace = report_scheduler.REPORT_MISFIRE_GRACE_SECONDS
+    print(f"{'users':>6} {'restore s':>9} {'workers':>7} {'jitter':>6} {'peak starts/min':>15} "
+          f"{'peak calls/s':>12} {'p95 wait s':>10} {'max wait s':>10} {'missed':>6} {'drain min':>9}")
+    for n in sizes:
+        days = np.where(rng.random(n) < popular_share, 'mon', rng.choice(['mon', 'tue', 'wed', 'thu', 'fri'], n))
+        hours = np.where(rng.random(n) < popular_share, 9, rng.integers(7, 19, n))
+        durations = rng.lognormal(np.log(report_seconds), 0.5, n)
+
+        store = ScheduleStore(':memory:')
+        for i in range(n):
+            store.save_schedule(f'user{i}', f'user{i}@example.com', str(days[i]), int(hours[i]), 0)
+        started = time.perf_counter()
+        report_scheduler.restore_report_jobs(store)
+        report_scheduler.scheduler.start(paused=True)
+        restore = time.perf_counter() - started
+        report_scheduler.scheduler.remove_all_jobs()
+        report_scheduler.scheduler.shutdown(wait=False)
+
+        for workers, jitter in [(10, 0), (8, 0), (8, 900), (16, 900), (16, 1800)]:
+            fire_times = np.array([
+                (report_scheduler.report_trigger(days[i], int(hours[i]), 0, jitter)
+                 .get_next_fire_time(None, week) - week).total_seconds()
+                for i in range(n)
+            ])
+            starts = simulate_reports(fire_times, durations, workers, grace)
+            ran = ~np.isnan(starts)
+            wait = starts[ran] - fire_times[ran]
+            start_minutes = np.bincount((starts[ran] // 60).astype(np.int64))
+            # Provider calls are spread evenly over each report's run time
+            call_rate = np.zeros(int(np.nanmax(starts + durations)) + 2)
+            np.add.at(call_rate, starts[ran].astype(np.int64), calls_per_report / durations[ran])
+            np.add.at(call_rate, (starts[ran] + durations[ran]).astype(np.int64), -calls_per_report / durations[ran])
+            # How long after Monday 09:00 the last report of that slot is sent
+            monday_nine = ran & (days == 'mon') & (hours == 9)
+            drained = (starts + durations)[monday_nine].max() - (24 + 9) * 3600
+            print(f"{n:>6} {restore:>9.3f} {workers:>7} {jitter:>6} {start_minutes.max():>15} "
+                  f"{np.cumsum(call_rate).max():>12.1f} {np.percentile(wait, 95):>10.0f} {wait.max():>10.0f} "
+                  f"{(~ran).sum():>6} {drained / 60:>9.1f}")
+
+
+def bench_batch(sizes=(10, 40), workers=(1, 2), events_per_week=150):
+    # Headless batch runs of synthetic users into a local SMTP sink; the rerun shows resume cost
+    sink = SMTPSink().start()
+    os.environ.update({'SMTP_HOST': sink.address[0], 'SMTP_PORT': str(sink.address[1]), 'SMTP_STARTTLS': '0'})
+    os.environ.pop('SMTP_USERNAME', None)
+    start_date, end_date = datetime(2024, 1, 1).date(), datetime(2024, 1, 7).date()
+    print(f"{'users':>6} {'workers':>7} {'seconds':>8} {'reports/min':>11} {'p50 s':>6} {'p95 s':>6} "
+          f"{'failed':>6} {'resume s':>8} {'sink msgs':>9}")
+    try:
+        for n in sizes:
+            for count in workers:
+                with tempfile.TemporaryDirectory() as tmp:
+                    progress = os.path.join(tmp, 'progress.jsonl')
+                    users = [f'user{i}' for i in range(n)]
+                    before = sink.stats()['messages']
+                    summary = run_batch(users, start_date, end_date, count, 300, progress, events_per_week)
+                    sent = sink.stats()['messages'] - before
+                    resumed = run_batch(users, start_date, end_date, count, 300, progress, events_per_week)
+                print(f"{n:>6} {count:>7} {summary['seconds']:>8.1f} {summary['reports_per_minute']:>11.1f} "
+                      f"{summary['p50_seconds']:>6.2f} {summary['p95_seconds']:>6.2f} "
+                      f"{summary['failed'] + summary['timeout']:>6} {resumed['seconds']:>8.2f} {sent:>9}")
+    finally:
+        sink.stop()
+
+
+def bench_org_rollups(sizes=(10, 1_000, 10_000), workers=None, events_per_week=150, team=10):
+    # Org-wide map-reduce over synthetic users. The rerun only merges stored aggregates.
+    start_date, end_date = datetime(2024, 1, 1).date(), datetime(2024, 1, 7).date()
+    print(f"{'users':>6} {'map s':>7} {'users/s':>7} {'KiB/user':>8} {'rerun s':>7} {'org q s':>7} {'team q s':>8} "
+          f"{'p50':>5} {'p90':>5} {'attendees':>9}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = AggregateStore(os.path.join(tmp, 'aggregates.sqlite3'))
+            users = [f'user{i}' for i in range(n)]
+            started = time.perf_counter()
+            aggregate, failed = run_org_rollup(users, start_date, end_date, workers, events_per_week, store)
+            mapped = time.perf_counter() - started
+            if failed or aggregate.users != n:
+                raise RuntimeError(f"Org rollup failed for {len(failed)} users")
+            started = time.perf_counter()
+            run_org_rollup(users, start_date, end_date, workers, events_per_week, store)
+            rerun = time.perf_counter() - started
+            started = time.perf_counter()
+            org = query_aggregate(start_date, end_date, store=store)
+            org_query = time.perf_counter() - started
+            started = time.perf_counter()
+            query_aggregate(start_date, end_date, users[:team], store=store)
+            team_query = time.perf_counter() - started
+            stored = sum(map(len, store.load_aggregates(start_date, end_date).values())) / n / 1024
+        summary = summarize_aggregate(org)
+        print(f"{n:>6} {mapped:>7.2f} {n / mapped:>7.0f} {stored:>8.2f} {rerun:>7.2f} {org_query:>7.3f} {team_query:>8.4f} "
+              f"{summary['p50_duration']:>5.2f} {summary['p90_duration']:>5.2f} {summary['unique_attendees']:>9}")
+
+
+def report_message(i, attachment):
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+    msg = MIMEMultipart()
+    msg['From'] = 'reports@example.com'
+    msg['To'] = f'user{i}@example.com'
+    msg['Subject'] = 'Weekly Calendar Analysis Report'
+    msg.attach(MIMEApplication(attachment))
+    return msg
+
+
+def legacy_send(host, port, msg):
+    # What send_email_report did before pooling: a fresh connection and login per message
+    import smtplib
+    with smtplib.SMTP(host, port) as server:
+        server.login('reports', 'secret')
+        server.send_message(msg)
+
+
+def bench_smtp(sizes=(200, 1000), latency=0.005, senders=8, message_kib=60):
+    # `senders` threads submit concurrently, like the scheduler's report workers. The sink
+    # adds `latency` to every round trip.
+    attachment = np.random.default_rng(0).bytes(message_kib * 1024)
+    modes = [
+        ('per-message connection', {}, {}),
+        ('pool 1 x batch 1', {'pool_size': 1, 'batch_size': 1}, {}),
+        ('pool 2 x batch 20', {'pool_size': 2, 'batch_size': 20}, {}),
+        ('pool 4 x batch 20', {'pool_size': 4, 'batch_size': 20}, {}),
+        ('pool 2, no PIPELINING', {'pool_size': 2, 'batch_size': 20}, {'pipelining': False}),
+        ('pool 2, 5% 451s', {'pool_size': 2, 'batch_size': 20}, {'temp_failure_rate': 0.05}),
+    ]
+    print(f"{'messages':>8} {'mode':<24} {'seconds':>8} {'msgs/s':>8} {'delivered':>9} {'conns':>5} {'retries':>7}")
+    for n in sizes:
+        messages = [report_message(i, attachment) for i in range(n)]
+        for name, pool_options, sink_options in modes:
+            random.seed(0)
+            sink = SMTPSink(latency=latency, **sink_options).start()
+            host, port = sink.address
+            started = time.perf_counter()
+            if not pool_options:
+                with ThreadPoolExecutor(senders) as executor:
+                    list(executor.map(lambda msg: legacy_send(host, port, msg), messages))
+                stats = {'connections': n}
+            else:
+                pool = SMTPPool(host, port, 'reports', 'secret', starttls=False, base_delay=0.01, **pool_options)
+                with ThreadPoolExecutor(senders) as executor:
+                    futures = list(executor.map(pool.submit, messages))
+                for future in futures:
+                    future.result()
+                stats = pool.stats()
+                pool.close()
+            elapsed = time.perf_counter() - started
+            sink.stop()
+            print(f"{n:>8} {name:<24} {elapsed:>8.2f} {n / elapsed:>8.0f} {sink.stats()['messages']:>9} "
+                  f"{stats.get('connections', 0):>5} {stats.get('retries', 0):>7}")
+
+
+def measure_stage(fn, repeats=1):
+    # Best wall time of `repeats` runs, then one more run under tracemalloc for the peak allocation.
+    # fn returns (result, seconds to leave out) so time spent in fakes isn't counted.
+    best = float('inf')
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        result, excluded = fn()
+        best = min(best, time.perf_counter() - started - excluded)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak / 2 ** 20
+
+
+def suite_stages(n, email):
+    # The report pipeline stage by stage, on one year of generated events in a single calendar
+    events = generate_events(n, seed=n)
+    window = (datetime(2024, 1, 1).date(), datetime(2024, 12, 31).date())
+    state = {}
+
+    def fetch():
+        service = synthetic_google_service(events)
+        state['df'] = service.fetch_events(*window)
+        return state['df'], service.http_fake.server_seconds
+
+    def analyze():
+        state['analysis'] = analyze_calendar_data(state['df'])
+        state['intervals'] = analyze_intervals(state['df'], *window)
+        return state['analysis'], 0.0
+
+    def figures():
+        state['figs'] = create_visualizations(state['df'], state['analysis'], intervals=state['intervals'])
+        return state['figs'], 0.0
+
+    def email_report():
+        renderer._cache.clear()
+        if not send_email_report(email, state['figs']):
+            raise RuntimeError("Report email was not sent")
+        return None, 0.0
+
+    def scheduled():
+        renderer._cache.clear()
+        service = synthetic_google_service(events)
+        return report_scheduler.generate_and_send_report(service, email, *window), service.http_fake.server_seconds
+
+    return [('fetch', fetch), ('analyze', analyze), ('figures', figures), ('email', email_report),
+            ('scheduled', scheduled)]
+
+
+def compare_to_baseline(results, baseline, threshold, min_seconds=0.05, min_mib=2.0):
+    # A stage regresses when it is more than `threshold` slower or bigger than its baseline and the
+    # difference is also above the noise floor (min_seconds / min_mib)
+    regressions = []
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            for metric, floor in (('seconds', min_seconds), ('peak_mib', min_mib)):
+                if current[metric] > base[metric] * (1 + threshold) and current[metric] - base[metric] > floor:
+                    regressions.append((size, stage, metric, base[metric], current[metric]))
+    return regressions
+
+
+def bench_suite(sizes=(100, 1_000, 10_000, 100_000, 1_000_000), baseline=BASELINE_PATH, update_baseline=False,
+                threshold=None):
+    # End-to-end timing and memory per stage, checked against stored baselines. Time spent
+    # generating fake API responses is left out; email and scheduled runs render with Kaleido
+    # and deliver to a local SMTP sink.
+    sink = SMTPSink().start()
+    os.environ.update({'SMTP_HOST': sink.address[0], 'SMTP_PORT': str(sink.address[1]), 'SMTP_STARTTLS': '0'})
+    os.environ.pop('SMTP_USERNAME', None)
+    stored = {}
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            stored = json.load(f)
+    meta = {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+    # Rendering-bound stages vary by about 20% between runs, hence the default
+    threshold = threshold if threshold is not None else stored.get('threshold', 0.3)
+    if stored and {key: stored['meta'].get(key) for key in meta} != meta:
+        print(f"warning: baseline was recorded on {stored['meta']}, this is {meta}")
+
+    # Start Kaleido and the SMTP pool outside the timings
+    send_email_report('bench@example.com', create_visualizations(make_frame(100)))
+    results = {}
+    print(f"{'events':>8} {'stage':<10} {'seconds':>8} {'base s':>8} {'peak MiB':>8} {'base MiB':>8}")
+    try:
+        for n in sizes:
+            results[str(n)] = {}
+            for stage, fn in suite_stages(n, 'bench@example.com'):
+                _, seconds, peak = measure_stage(fn, repeats=5 if n <= 10_000 else 1)
+                results[str(n)][stage] = {'seconds': round(seconds, 4), 'peak_mib': round(peak, 2)}
+                base = stored.get('results', {}).get(str(n), {}).get(stage, {})
+                print(f"{n:>8} {stage:<10} {seconds:>8.3f} {base.get('seconds', float('nan')):>8.3f} "
+                      f"{peak:>8.1f} {base.get('peak_mib', float('nan')):>8.1f}")
+    finally:
+        sink.stop()
+
+    if update_baseline:
+        merged = dict(stored.get('results', {}), **results)
+        with open(baseline, 'w') as f:
+            json.dump({'meta': meta, 'threshold': threshold, 'results': merged}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline written to {baseline}")
+        return 0
+    regressions = compare_to_baseline(results, stored.get('results', {}), threshold)
+    for size, stage, metric, before, after in regressions:
+        print(f"REGRESSION {size} events {stage} {metric}: {before:g} -> {after:g} ({after / before - 1:+.0%})")
+    return len(regressions)
+
+
+STARTUP_SCRIPT = """
+import os, sys, time
+from streamlit.testing.v1 import AppTest
+print('--- page start', file=sys.stderr, flush=True)
+started = time.perf_counter()
+app = AppTest.from_file(os.path.join({app_dir!r}, 'main.py'), default_timeout=120)
+page = {page!r}
+if page == 'callback':
+    app.query_params['code'] = 'startup-benchmark'
+elif page != 'landing':
+    from fake_provider import FakeCalendarService
+    app.session_state['calendar_service'] = FakeCalendarService('startup', events_per_week=50)
+    app.session_state['page'] = page
+app.run()
+print('--- page done', time.perf_counter() - started, file=sys.stderr, flush=True)
+"""
+
+
+def startup_imports(stderr):
+    # Module self-times (microseconds) from `python -X importtime` output after the page started
+    lines = stderr.split('--- page start', 1)[-1].splitlines()
+    seconds, modules, packages = 0.0, 0, Counter()
+    wall = float('nan')
+    for line in lines:
+        if line.startswith('--- page done'):
+            wall = float(line.split()[-1])
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        seconds += int(self_us) / 1e6
+        modules += 1
+        packages[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return wall, seconds, modules, packages
+
+
+def bench_startup(sizes=(1,), pages=('landing', 'callback', 'Dashboard', 'Manual Report', 'Settings'),
+                  app_dir=os.path.dirname(os.path.abspath(__file__))):
+    # Cold start per page: each page's first run in a fresh interpreter, after streamlit itself is
+    # loaded (a running server already has it). sizes is the number of runs per page; the best is kept.
+    # The callback page's token exchange goes to a closed local port and fails straight away
+    env = dict(os.environ, GOOGLE_CLIENT_ID='startup-benchmark', GOOGLE_CLIENT_SECRET='startup-benchmark',
+               HTTPS_PROXY='http://127.0.0.1:9')
+    print(f"{'page':<14} {'first run s':>11} {'import s':>8} {'modules':>7}  heaviest imports")
+    for page in pages:
+        best = None
+        for _ in range(sizes[0]):
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT.format(app_dir=app_dir, page=page)],
+                cwd=app_dir, env=env, capture_output=True, text=True, timeout=600,
+            )
+            measured = startup_imports(result.stderr)
+            if best is None or measured[0] < best[0]:
+                best = measured
+        wall, seconds, modules, packages = best
+        heaviest = ', '.join(f'{name} {value:.2f}' for name, value in packages.most_common(4))
+        print(f"{page:<14} {wall:>11.2f} {seconds:>8.2f} {modules:>7}  {heaviest}")
+
+
+BENCHMARKS = {
+    'fetch_events': bench_fetch_events,
+    'sync': bench_sync,
+    'providers': bench_providers,
+    'recurrence': bench_recurrence,
+    'rollups': bench_rollups,
+    'metrics': bench_metrics,
+    'multi_calendar': bench_multi_calendar,
+    'authenticate': bench_authenticate,
+    'rate_limit': bench_rate_limit,
+    'categorize': bench_categorize,
+    'analyze': bench_analyze,
+    'intervals': bench_intervals,
+    'attendee_index': bench_attendee_index,
+    'progressive': bench_progressive,
+    'dashboard_cache': bench_dashboard_cache,
+    'schema': bench_schema,
+    'render': bench_render,
+    'figures': bench_figures,
+    'scheduler': bench_scheduler,
+    'batch': bench_batch,
+    'org_rollups': bench_org_rollups,
+    'smtp': bench_smtp,
+    'suite': bench_suite,
+    'startup': bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calendar Analyzer benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', help="Override the benchmark's default sizes")
+    parser.add_argument('--baseline', help="Baseline file for the suite (default: benchmark_baseline.json)")
+    parser.add_argument('--update-baseline', action='store_true', help="Record this run as the suite's baseline")
+    parser.add_argument('--threshold', type=float, help="Allowed slowdown or growth before the suite fails")
+    args = parser.parse_args()
+    benchmark = BENCHMARKS[args.benchmark]
+    options = {'sizes': args.sizes, 'baseline': args.baseline, 'threshold': args.threshold,
+               'update_baseline': args.update_baseline or None}
+    parameters = inspect.signature(benchmark).parameters
+    # Returns the number of regressions found, if the benchmark checks for any
+    if benchmark(**{key: value for key, value in options.items() if value is not None and key in parameters}):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
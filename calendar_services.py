@@ -1,10 +1,437 @@
 from abc import ABC, abstractmethod
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from datetime import datetime, timedelta
+from googleapiclient.errors import HttpError
+from google.auth.exceptions import RefreshError
+from google_auth_httplib2 import AuthorizedHttp
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import quote, urlencode, urljoin
+from xml.sax.saxutils import escape
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import xml.etree.ElementTree as ET
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time as time_module
+import httplib2
+import numpy as np
 import pandas as pd
+from client_cache import client_cache, credential_key
+from rate_limiter import caldav_limiter, calendar_limiter, graph_limiter
+from categorizer import compile_rules
+from event_schema import compact_event_frame, join_addresses
+from data_processor import ANALYSIS_TIMEZONE, analysis_from_rollups, analyze_calendar_data
+from metrics import metrics
+from recurrence import expand_recurrences
+
+logger = logging.getLogger(__name__)
+
+# Only request the fields the analysis actually uses
+GOOGLE_EVENT_FIELDS = 'nextPageToken,nextSyncToken,items(id,iCalUID,status,summary,organizer(email),start,end,attendees(email))'
+# With local recurrence expansion: series masters with their rules, and exceptions
+GOOGLE_SERIES_FIELDS = ('nextPageToken,nextSyncToken,'
+                        'items(id,iCalUID,status,summary,organizer(email),start,end,attendees(email),recurrence,recurringEventId)')
+GOOGLE_INSTANCE_FIELDS = 'nextPageToken,items(id,iCalUID,status,summary,organizer(email),start,end,attendees(email))'
+GOOGLE_CALENDAR_LIST_FIELDS = 'nextPageToken,items(id,summary,primary,selected)'
+GOOGLE_MAX_PAGE_SIZE = 2500
+
+# Fetch series masters and expand them here instead of having the API return every instance
+GOOGLE_LOCAL_RECURRENCE = os.environ.get('GOOGLE_LOCAL_RECURRENCE', '0') not in ('', '0', 'false', 'no')
+
+# Pass as calendar_ids to fetch every calendar the user has selected in Google Calendar
+SELECTED_CALENDARS = 'selected'
+
+GRAPH_API_URL = os.environ.get('GRAPH_API_URL', 'https://graph.microsoft.com/v1.0')
+GRAPH_EVENT_SELECT = 'id,iCalUId,subject,organizer,start,end,isAllDay,isCancelled,attendees'
+GRAPH_PAGE_SIZE = 500
+MICROSOFT_AUTHORITY = os.environ.get('MICROSOFT_AUTHORITY', 'https://login.microsoftonline.com/common')
+MICROSOFT_TOKEN_URL = f'{MICROSOFT_AUTHORITY}/oauth2/v2.0/token'
+# Refresh Microsoft access tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
+CALDAV_URL = os.environ.get('CALDAV_URL', 'https://caldav.icloud.com')
+CALDAV_MULTIGET_BATCH = 200
+
+# Days around today that the windowed change feeds (Outlook, Apple, Google with local
+# recurrence expansion) cover
+SYNC_PAST_DAYS = int(os.environ.get('SYNC_PAST_DAYS', 400))
+SYNC_FUTURE_DAYS = int(os.environ.get('SYNC_FUTURE_DAYS', 90))
+
+
+def to_utc(value, end_of_range=False, tz=None):
+    # Dates from the UI are inclusive, so the end of a range moves to the following midnight.
+    # Dates and naive datetimes are wall-clock times in tz.
+    if not isinstance(value, datetime):
+        value = datetime.combine(value + timedelta(days=1) if end_of_range else value, time.min)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo(tz or ANALYSIS_TIMEZONE))
+    return value.astimezone(timezone.utc)
+
+
+def _offset_minutes(suffix):
+    if suffix in ('', 'Z'):
+        return 0
+    sign = 1 if suffix[0] == '+' else -1
+    return sign * (int(suffix[1:3]) * 60 + int(suffix[4:6]))
+
+
+def parse_event_times(values):
+    # All-day events carry a bare date, timed events an offset; normalise both to UTC in one pass.
+    # A calendar only uses a handful of distinct offsets, so they are resolved once each
+    # instead of letting to_datetime build a tzinfo per value.
+    codes, suffixes = pd.factorize(np.array([value[19:] for value in values], dtype=object))
+    if any(suffix.startswith('.') for suffix in suffixes):
+        return pd.to_datetime(pd.Series(values, dtype=object), utc=True, format='ISO8601')
+    offsets = pd.to_timedelta([_offset_minutes(suffix) for suffix in suffixes], unit='m')
+    local = pd.to_datetime(pd.Series([value[:19] for value in values], dtype=object), format='ISO8601')
+    return (local - offsets.take(codes)).dt.tz_localize('UTC')
+
+
+def build_event_frame(records, calendar_id, categorizer):
+    df = records.drop(columns=['event_id'], errors='ignore')
+    df['duration'] = (df['end'] - df['start']).dt.total_seconds() / 3600  # Duration in hours
+    df['category'] = categorizer.categorize(df)
+    df['calendar_id'] = calendar_id
+    return df
+
+
+def merge_calendar_frames(frames):
+    if not frames:
+        # No calendars selected (or none left on the account)
+        return compact_event_frame(pd.DataFrame({
+            'summary': pd.Series(dtype=object), 'start': pd.Series(dtype='datetime64[ns, UTC]'),
+            'end': pd.Series(dtype='datetime64[ns, UTC]'), 'duration': pd.Series(dtype='float64'),
+            'attendees': pd.Series(dtype='int64'), 'category': pd.Series(dtype=object),
+            'calendar_id': pd.Series(dtype=object), 'attendee_emails': pd.Series(dtype=object),
+        }))
+    if len(frames) == 1:
+        # A single calendar already arrives ordered by start time
+        return compact_event_frame(frames[0].reset_index(drop=True))
+    df = pd.concat(frames, ignore_index=True)
+    # An invitation shows up on every calendar it was copied to; recurring instances share
+    # their series' iCalUID, so the start time is part of the key
+    shared = df['ical_uid'].notna()
+    duplicate = shared & df.duplicated(['ical_uid', 'start'])
+    df = df[~duplicate].sort_values('start', kind='stable', ignore_index=True)
+    return compact_event_frame(df)
+
+
+def merge_event_batches(batches):
+    # What fetch_events returns, from the (calendar position, frame) batches of iter_events: each
+    # calendar's pages in the order they came, then the calendars in order
+    frames = {}
+    for position, frame in batches:
+        frames.setdefault(position, []).append(frame)
+    return merge_calendar_frames([
+        pages[0] if len(pages) == 1 else pd.concat(pages, ignore_index=True)
+        for _, pages in sorted(frames.items())
+    ])
+
+
+def _count_response_bytes(postproc, stage):
+    # Response size as received, before the client decodes the JSON
+    def count(resp, content):
+        stage['bytes'] = stage.get('bytes', 0) + len(content)
+        return postproc(resp, content)
+    return count
+
+
+class EventColumns:
+    def __init__(self):
+        self.event_id = []
+        self.ical_uid = []
+        self.summary = []
+        self.organizer = []
+        self.start = []
+        self.end = []
+        self.attendees = []
+        # Attendee addresses (join_addresses)
+        self.attendee_emails = []
+        self.cancelled = []
+
+    def __len__(self):
+        return len(self.summary)
+
+    def extend(self, items):
+        live = []
+        for event in items:
+            if event.get('status') == 'cancelled':
+                self.cancelled.append(event['id'])
+            else:
+                live.append(event)
+        # One comprehension per column keeps the per-event Python overhead down on large pages
+        self.event_id += [event.get('id') for event in live]
+        self.ical_uid += [event.get('iCalUID') for event in live]
+        self.summary += [event.get('summary') for event in live]
+        self.organizer += [event['organizer'].get('email') if 'organizer' in event else None for event in live]
+        self.start += [event['start'].get('dateTime') or event['start'].get('date') for event in live]
+        self.end += [event['end'].get('dateTime') or event['end'].get('date') for event in live]
+        self.attendees += [len(event['attendees']) if 'attendees' in event else 0 for event in live]
+        self.attendee_emails += [
+            join_addresses([a['email'] for a in event['attendees'] if 'email' in a]) if 'attendees' in event else None
+            for event in live
+        ]
+
+    def to_records(self):
+        with metrics.stage('parse') as stage:
+            stage['events'] = len(self)
+            return pd.DataFrame({
+                'event_id': pd.Series(self.event_id, dtype=object),
+                'ical_uid': pd.Series(self.ical_uid, dtype=object),
+                'summary': pd.Series(self.summary, dtype=object),
+                'organizer': pd.Series(self.organizer, dtype=object),
+                'start': parse_event_times(self.start),
+                'end': parse_event_times(self.end),
+                'attendees': pd.Series(self.attendees, dtype='int64'),
+                'attendee_emails': pd.Series(self.attendee_emails, dtype=object),
+            })
+
+
+class RecurringEventColumns(EventColumns):
+    # events.list items with singleEvents=False. Series masters are expanded locally by expand();
+    # exceptions (moved or cancelled instances) carry the id of the occurrence they replace. A range
+    # fetch passes its window: exceptions are listed by their original time too, so one moved out
+    # of the window is dropped.
+    def __init__(self, window=None):
+        super().__init__()
+        self.window = window
+        self.masters = {}
+        self.overrides = set()
+        self.occurrences = None
+        self._seen = set()
+
+    def __len__(self):
+        return super().__len__() + (0 if self.occurrences is None else len(self.occurrences))
+
+    def extend(self, items):
+        events = []
+        for event in items:
+            # A series' exceptions can be listed twice when it is re-read in full
+            if event['id'] in self._seen:
+                continue
+            self._seen.add(event['id'])
+            if 'recurrence' in event and event.get('status') != 'cancelled':
+                self.masters[event['id']] = event
+                continue
+            if 'recurringEventId' in event:
+                self.overrides.add(event['id'])
+            events.append(event)
+        super().extend(events)
+
+    def expand(self, start, end, server_instances):
+        # Occurrences overlapping [start, end); series with rules the expander doesn't handle are
+        # listed by server_instances(master) instead
+        with metrics.stage('expand') as stage:
+            occurrences, unsupported = expand_recurrences(self.masters.values(), start, end)
+            self.occurrences = occurrences[~occurrences['event_id'].isin(self.overrides)]
+            stage['events'] = len(self.occurrences)
+        for master in unsupported:
+            logger.info(f"Recurrence of {master['id']} isn't expanded locally, listing its instances")
+            self.extend(server_instances(master))
+
+    def to_records(self):
+        records = super().to_records()
+        if self.window is not None:
+            records = records[(records['start'] < self.window[1]) & (records['end'] > self.window[0])]
+        if self.occurrences is None or self.occurrences.empty:
+            return records.reset_index(drop=True)
+        records = pd.concat([records, self.occurrences], ignore_index=True)
+        return records.sort_values('start', kind='stable', ignore_index=True)
+
+
+class GraphEventColumns(EventColumns):
+    # Microsoft Graph events, requested with times in UTC (Prefer: outlook.timezone="UTC").
+    # Delta pages mark deletions with '@removed'.
+    def extend(self, items):
+        live = []
+        for event in items:
+            if '@removed' in event or event.get('isCancelled'):
+                self.cancelled.append(event['id'])
+            else:
+                live.append(event)
+        self.event_id += [event['id'] for event in live]
+        self.ical_uid += [event.get('iCalUId') for event in live]
+        self.summary += [event.get('subject') or None for event in live]
+        self.organizer += [(event.get('organizer') or {}).get('emailAddress', {}).get('address') for event in live]
+        self.start += [_graph_time(event['start'], event.get('isAllDay')) for event in live]
+        self.end += [_graph_time(event['end'], event.get('isAllDay')) for event in live]
+        self.attendees += [len(event.get('attendees') or ()) for event in live]
+        self.attendee_emails += [
+            join_addresses([a['emailAddress']['address'] for a in event.get('attendees') or ()
+                            if (a.get('emailAddress') or {}).get('address')])
+            for event in live
+        ]
+
+
+def _graph_time(field, all_day):
+    # '2024-01-08T09:00:00.0000000' in UTC; all-day events keep only their date, as Google's do
+    value = field['dateTime']
+    return value[:10] if all_day else value[:19] + 'Z'
+
+
+class CalDAVEventColumns(EventColumns):
+    # VEVENTs read from CalDAV calendar-data one line at a time. A resource holds a whole series,
+    # so expanded instances are keyed by resource href and RECURRENCE-ID.
+    def add_resource(self, href, calendar_data):
+        for event in iter_vevents(calendar_data):
+            if event.get('STATUS', ('', ''))[1].upper() == 'CANCELLED':
+                continue
+            params, start = event['DTSTART']
+            recurrence = event.get('RECURRENCE-ID')
+            self.event_id.append(href if recurrence is None else f'{href}#{recurrence[1]}')
+            self.ical_uid.append(event.get('UID', (None, None))[1])
+            self.summary.append(_ical_text(event['SUMMARY'][1]) if 'SUMMARY' in event else None)
+            organizer = event.get('ORGANIZER', (None, None))[1]
+            self.organizer.append(organizer[7:] if organizer and organizer.lower().startswith('mailto:') else organizer)
+            self.start.append(ical_time(params, start))
+            self.end.append(_ical_end(event, self.start[-1]))
+            attendees = event.get('ATTENDEE', ())
+            self.attendees.append(len(attendees))
+            self.attendee_emails.append(join_addresses(attendees))
+
+
+def _unfold(text):
+    # Content lines continue on lines that start with a space or a tab
+    line = None
+    for raw in text.splitlines():
+        if raw[:1] in (' ', '\t') and line is not None:
+            line += raw[1:]
+            continue
+        if line:
+            yield line
+        line = raw
+    if line:
+        yield line
+
+
+# Name and parameters of a content line, up to the first ':' outside a quoted parameter value
+CONTENT_LINE_HEAD = re.compile(r'(?:[^":]|"[^"]*")*')
+
+
+def _content_line(line):
+    # NAME;PARAM=VALUE:VALUE
+    colon = line.find(':')
+    quote = line.find('"')
+    if 0 <= quote < colon:
+        colon = CONTENT_LINE_HEAD.match(line).end()
+    name, _, params = line[:colon].partition(';')
+    return name.upper(), params, line[colon + 1:]
+
+
+def iter_vevents(text):
+    # Yields each VEVENT as {NAME: (params, value)}, with ATTENDEE holding the attendees' addresses.
+    # Nested components such as VALARM are skipped.
+    event, depth = None, 0
+    for line in _unfold(text):
+        if event is not None and line[:8].upper() == 'ATTENDEE' and line[8:9] in (';', ':'):
+            # Often the bulk of a meeting's lines, so only the address is read: whatever follows the
+            # last ':', which drops the 'mailto:' scheme
+            if not depth:
+                event.setdefault('ATTENDEE', []).append(line[line.rfind(':') + 1:])
+            continue
+        name, params, value = _content_line(line)
+        if name == 'BEGIN':
+            if event is not None:
+                depth += 1
+            elif value.upper() == 'VEVENT':
+                event, depth = {}, 0
+        elif name == 'END':
+            if depth:
+                depth -= 1
+            elif event is not None and value.upper() == 'VEVENT':
+                if 'DTSTART' in event:
+                    yield event
+                event = None
+        elif event is not None and not depth:
+            event[name] = (params, value)
+
+
+def _ical_text(value):
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _ical_param(params, name):
+    for param in params.split(';'):
+        key, _, value = param.partition('=')
+        if key.upper() == name:
+            return value.strip('"')
+    return None
+
+
+@lru_cache(maxsize=256)
+def _zone(tzid):
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown TZID {tzid!r}, reading its times as UTC")
+        return None
+
+
+def ical_time(params, value):
+    # iCalendar DATE or DATE-TIME in the ISO form parse_event_times reads. Floating times and
+    # unknown zones are read as UTC, like all-day dates.
+    if len(value) == 8:
+        return f'{value[:4]}-{value[4:6]}-{value[6:8]}'
+    iso = f'{value[:4]}-{value[4:6]}-{value[6:8]}T{value[9:11]}:{value[11:13]}:{value[13:15]}'
+    tzid = None if value.endswith('Z') else _ical_param(params, 'TZID')
+    zone = _zone(tzid) if tzid else None
+    if zone is None:
+        return iso + 'Z'
+    return datetime.fromisoformat(iso).replace(tzinfo=zone).isoformat()
+
+
+ICAL_DURATION = re.compile(r'([-+])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+def _ical_end(event, start):
+    if 'DTEND' in event:
+        return ical_time(*event['DTEND'])
+    match = ICAL_DURATION.match(event.get('DURATION', ('', ''))[1])
+    if match is None:
+        # Without DTEND or DURATION, a date lasts the day and a date-time takes no time
+        return (date.fromisoformat(start) + timedelta(days=1)).isoformat() if len(start) == 10 else start
+    weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups()[1:])
+    length = timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+    if len(start) == 10:
+        return (date.fromisoformat(start) + length).isoformat()
+    return (datetime.fromisoformat(start) + length).isoformat()
+
+
+def iter_multistatus(content):
+    # (href, status, calendar-data) per WebDAV response, parsed incrementally and dropped once
+    # read, so a large report never sits in memory as a tree. A report's sync-token comes
+    # through as (None, None, token).
+    for _, element in ET.iterparse(io.BytesIO(content)):
+        if element.tag == '{DAV:}response':
+            status = element.findtext('{DAV:}status') or element.findtext('{DAV:}propstat/{DAV:}status') or ''
+            yield (element.findtext('{DAV:}href'), int(status.split()[1]) if status else 200,
+                   element.findtext(f'.//{{{CALDAV_NS}}}calendar-data'))
+            element.clear()
+        elif element.tag == '{DAV:}sync-token':
+            yield None, None, element.text
+
+
+def window_token(start, end, token):
+    # Windowed providers keep the window a sync began with next to the provider's own token
+    return f'{int(start.timestamp())} {int(end.timestamp())} {token}'
+
+
+def split_window_token(value):
+    start, end, token = value.split(' ', 2)
+    return datetime.fromtimestamp(int(start), timezone.utc), datetime.fromtimestamp(int(end), timezone.utc), token
+
 
 class CalendarService(ABC):
+    # Days, hours and working hours of the analysis, and the dates of a range, are in this time zone
+    time_zone = ANALYSIS_TIMEZONE
+
     @abstractmethod
     def authenticate(self):
         pass
@@ -13,79 +440,634 @@ class CalendarService(ABC):
     def fetch_events(self, start_date, end_date):
         pass
 
-class GoogleCalendarService(CalendarService):
-    def __init__(self, credentials):
+    def iter_events(self, start_date, end_date):
+        # Yields (calendar position, event frame) batches as they arrive; merge_event_batches
+        # makes fetch_events' frame of them. Here the whole range comes as one batch.
+        yield 0, self.fetch_events(start_date, end_date)
+
+    def fetch_analysis(self, start_date, end_date):
+        return analyze_calendar_data(self.fetch_events(start_date, end_date), self.time_zone)
+
+class SyncedCalendarService(CalendarService):
+    # The API-backed providers. Calendars are fetched concurrently, which overlaps their network
+    # round trips; decoding and parsing hold the GIL, so a fetch still takes at least the CPU time
+    # of every calendar. With a store, each one is synced incrementally and its events read locally.
+    # Providers supply pages of changes since a sync token (change_pages) and the events of a time
+    # range (range_columns). Windowed providers' change feeds are bounded to a time window:
+    # SYNC_PAST_DAYS back and SYNC_FUTURE_DAYS ahead of the first sync, widened (with a full sync)
+    # when a range outside it is asked for.
+    windowed = False
+
+    def __init__(self, store=None, user_id=None, calendar_ids=('primary',), max_workers=8,
+                 limiter=calendar_limiter, categorizer=None, sync_days=None):
+        # With a store, events are synced incrementally and read locally
+        self.store = store
+        self.user_id = user_id
+        self.calendar_ids = calendar_ids
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self.categorizer = categorizer or compile_rules()
+        self.sync_days = sync_days or (SYNC_PAST_DAYS, SYNC_FUTURE_DAYS)
+        self._local = threading.local()
+
+    @abstractmethod
+    def list_calendars(self):
+        pass
+
+    @abstractmethod
+    def change_pages(self, calendar_id, sync_token, window):
+        # Yields (EventColumns, next sync token or None) per page; no sync token lists everything
+        pass
+
+    @abstractmethod
+    def range_columns(self, calendar_id, start, end):
+        pass
+
+    def range_pages(self, calendar_id, start, end):
+        # range_columns a page at a time, where the provider can page a range
+        yield self.range_columns(calendar_id, start, end)
+
+    def sync_window(self, sync_token, start, end):
+        # The window to sync and the token to sync from. Providers whose change feed covers the
+        # whole calendar have no window.
+        if not self.windowed:
+            return None, sync_token
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        low, high = today - timedelta(days=self.sync_days[0]), today + timedelta(days=self.sync_days[1])
+        if sync_token is not None and ' ' not in sync_token:
+            # A token from before the feed was windowed (Google before local recurrence expansion)
+            sync_token = None
+        if sync_token is not None:
+            synced_low, synced_high, _ = split_window_token(sync_token)
+            if (start is None or start >= synced_low) and (end is None or end <= synced_high):
+                return (synced_low, synced_high), sync_token
+            logger.info(f"Requested range is outside the synced window for {self.user_id}, widening it")
+            low, high = min(low, synced_low), max(high, synced_high)
+        return (min(low, start) if start else low, max(high, end) if end else high), None
+
+    def sync_expired(self, error):
+        return isinstance(error, HttpError) and error.resp.status == 410
+
+    def resolve_calendar_ids(self):
+        if self.calendar_ids == SELECTED_CALENDARS:
+            return [c['id'] for c in self.list_calendars() if c.get('selected') or c.get('primary')]
+        return list(self.calendar_ids)
+
+    def sync(self, calendar_id='primary', start=None, end=None):
+        self.store.refresh_categories(self.user_id, calendar_id, self.categorizer, self.time_zone)
+        window, sync_token = self.sync_window(self.store.get_sync_token(self.user_id, calendar_id), start, end)
+        try:
+            return self._sync_pages(calendar_id, sync_token, window)
+        except Exception as e:
+            if sync_token is None or not self.sync_expired(e):
+                raise
+            # Sync token expired or invalidated server-side
+            logger.info(f"Sync token for calendar {calendar_id} is no longer valid, running a full sync")
+            return self._sync_pages(calendar_id, None, window)
+
+    def _sync_pages(self, calendar_id, sync_token, window):
+        if sync_token is None:
+            self.store.reset(self.user_id, calendar_id)
+        changed = 0
+        full_sync = []
+        for columns, next_token in self.change_pages(calendar_id, sync_token, window):
+            records = columns.to_records()
+            # Stored with the event so the store can keep its category rollups current
+            records['category'] = self.categorizer.categorize(records)
+            self.store.apply_changes(
+                self.user_id, calendar_id, records, columns.cancelled, next_token,
+                update_rollups=sync_token is not None, time_zone=self.time_zone
+            )
+            changed += len(columns) + len(columns.cancelled)
+            if sync_token is None:
+                full_sync.append(records[['event_id', 'start', 'end', 'attendees', 'category']].assign(cancelled=False))
+                if columns.cancelled:
+                    full_sync.append(pd.DataFrame({'event_id': columns.cancelled, 'cancelled': True}))
+        if sync_token is None:
+            # A full sync rolls up what it just downloaded in one pass instead of page by page
+            events = pd.concat(full_sync, ignore_index=True).drop_duplicates('event_id', keep='last')
+            self.store.replace_rollups(
+                self.user_id, calendar_id, events[~events['cancelled'].astype(bool)], self.time_zone
+            )
+        logger.info(f"{'Incremental' if sync_token else 'Full'} sync of calendar {calendar_id}: {changed} changes")
+        return changed
+
+    def _map_calendars(self, fn, calendar_ids=None):
+        calendar_ids = self.resolve_calendar_ids() if calendar_ids is None else calendar_ids
+        if len(calendar_ids) <= 1:
+            return calendar_ids, [fn(calendar_id) for calendar_id in calendar_ids]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(calendar_ids))) as pool:
+            return calendar_ids, list(pool.map(fn, calendar_ids))
+
+    def fetch_events(self, start_date, end_date):
+        start, end = to_utc(start_date, tz=self.time_zone), to_utc(end_date, True, self.time_zone)
+        _, frames = self._map_calendars(lambda calendar_id: self.fetch_calendar_events(calendar_id, start, end))
+        return merge_calendar_frames(frames)
+
+    def iter_events(self, start_date, end_date):
+        # Calendars are fetched concurrently in the background and each page handed over as it
+        # arrives. With a store, a calendar is synced and then read locally in one batch. Closing
+        # the generator early stops the fetch after the pages in flight.
+        start, end = to_utc(start_date, tz=self.time_zone), to_utc(end_date, True, self.time_zone)
+        calendar_ids = self.resolve_calendar_ids()
+        batches, stopped = queue.Queue(), threading.Event()
+
+        def fetch(calendar_id):
+            position = calendar_ids.index(calendar_id)
+            for frame in self.calendar_batches(calendar_id, start, end):
+                if stopped.is_set():
+                    return
+                batches.put((position, frame))
+
+        with ThreadPoolExecutor(max_workers=1) as runner:
+            fetched = runner.submit(self._map_calendars, fetch, calendar_ids)
+            fetched.add_done_callback(lambda _: batches.put(None))
+            try:
+                while (batch := batches.get()) is not None:
+                    yield batch
+            finally:
+                stopped.set()
+            fetched.result()
+
+    def calendar_batches(self, calendar_id, start, end):
+        if self.store is not None:
+            yield self.fetch_calendar_events(calendar_id, start, end)
+            return
+        for columns in self.range_pages(calendar_id, start, end):
+            yield build_event_frame(columns.to_records(), calendar_id, self.categorizer)
+
+    def fetch_analysis(self, start_date, end_date, sync=True):
+        # With a store, answered from daily rollups, so the cost barely depends on the range length.
+        # That pays off on long ranges of large calendars (about 2x for a month of 100k events, 11x
+        # for a quarter or more); a week, or a calendar of a few thousand events, costs about the
+        # same either way. Pass sync=False when fetch_events has just synced the same calendars.
+        start, end = to_utc(start_date, tz=self.time_zone), to_utc(end_date, True, self.time_zone)
+        zone = ZoneInfo(self.time_zone)
+        if self.store is None or any(t.astimezone(zone).time() != time.min for t in (start, end)):
+            # Rollups are per local day, so ranges that don't start and end at midnight need raw events
+            return super().fetch_analysis(start_date, end_date)
+        calendar_ids, _ = self._map_calendars(
+            (lambda calendar_id: self.sync(calendar_id, start, end)) if sync else (lambda calendar_id: None)
+        )
+        rollups = self.store.load_rollups(self.user_id, calendar_ids, start, end, self.time_zone)
+        return analysis_from_rollups(rollups)
+
+    def fetch_calendar_events(self, calendar_id, start, end):
+        if self.store is not None:
+            self.sync(calendar_id, start, end)
+            records = self.store.load_events(self.user_id, calendar_id, start, end)
+        else:
+            records = self.range_columns(calendar_id, start, end).to_records()
+        return build_event_frame(records, calendar_id, self.categorizer)
+
+    def categorize_meeting(self, summary):
+        return self.categorizer.categorize_summary(summary)
+
+class GoogleCalendarService(SyncedCalendarService):
+    # With local_recurrence, events are listed with singleEvents=False and recurring series expanded
+    # here. Expansion needs an end, so the change feed is then windowed like Outlook's and Apple's.
+    def __init__(self, credentials, max_results=GOOGLE_MAX_PAGE_SIZE, store=None, user_id=None,
+                 calendar_ids=('primary',), max_workers=8, limiter=calendar_limiter, categorizer=None,
+                 local_recurrence=None, sync_days=None):
+        super().__init__(store, user_id or credential_key(credentials), calendar_ids, max_workers, limiter, categorizer,
+                         sync_days)
         self.credentials = credentials
         self.service = None
+        self.max_results = min(max_results, GOOGLE_MAX_PAGE_SIZE)
+        self.local_recurrence = GOOGLE_LOCAL_RECURRENCE if local_recurrence is None else local_recurrence
+        self.windowed = self.local_recurrence
 
     def authenticate(self):
-        self.service = build('calendar', 'v3', credentials=self.credentials)
+        # Built clients are shared process-wide and their tokens refreshed ahead of expiry. Requests
+        # are authorized with the cached credentials, the ones that refresh keeps current.
+        with metrics.stage('auth'):
+            entry = client_cache.entry(self.credentials)
+        self.service = entry.client
+        if entry.credentials is not self.credentials:
+            self.credentials = entry.credentials
+            self._local = threading.local()
 
-    def fetch_events(self, start_date, end_date):
-        events_result = self.service.events().list(
-            calendarId='primary',
-            timeMin=start_date.isoformat() + 'Z',
-            timeMax=end_date.isoformat() + 'Z',
+    def _http(self):
+        # httplib2 is not thread-safe, so each worker thread keeps its own pooled connection
+        if self.credentials is None:
+            return None
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return http
+
+    def _execute(self, request):
+        # Every API call goes through the shared quota limiter and retry policy
+        return self.limiter.call(self.user_id, lambda: request.execute(http=self._http()))
+
+    def list_calendars(self):
+        calendars = []
+        page_token = None
+        while True:
+            request = self.service.calendarList().list(
+                fields=GOOGLE_CALENDAR_LIST_FIELDS,
+                pageToken=page_token
+            )
+            page = self._execute(request)
+            calendars.extend(page.get('items', []))
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return calendars
+
+    def list_event_pages(self, calendar_id='primary', fields=GOOGLE_EVENT_FIELDS, method='list', **params):
+        # events.list, or events.instances of one series (method='instances' with an eventId)
+        page_token = None
+        while True:
+            request = getattr(self.service.events(), method)(
+                calendarId=calendar_id,
+                maxResults=self.max_results,
+                fields=fields,
+                pageToken=page_token,
+                **params
+            )
+            with metrics.stage('api_page') as stage:
+                if metrics.enabled and hasattr(request, 'postproc'):
+                    request.postproc = _count_response_bytes(request.postproc, stage)
+                page = self._execute(request)
+                stage['events'] = len(page.get('items', ()))
+            yield page
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+
+    def change_pages(self, calendar_id, sync_token, window):
+        if self.local_recurrence:
+            yield self._series_changes(calendar_id, sync_token, window)
+            return
+        for page in self.list_event_pages(calendar_id, syncToken=sync_token, singleEvents=True):
+            columns = EventColumns()
+            columns.extend(page.get('items', []))
+            yield columns, page.get('nextSyncToken')
+
+    def _series_changes(self, calendar_id, sync_token, window):
+        # Exceptions can arrive pages after their master, so the changes are expanded in one go
+        start, end = window
+        columns = RecurringEventColumns()
+        next_token = None
+        for page in self.list_event_pages(
+            calendar_id,
+            fields=GOOGLE_SERIES_FIELDS,
+            syncToken=split_window_token(sync_token)[2] if sync_token else None,
+            singleEvents=False
+        ):
+            columns.extend(page.get('items', []))
+            next_token = page.get('nextSyncToken')
+        if sync_token is None:
+            columns.expand(start, end, lambda master: self._server_instances(calendar_id, master, start, end))
+            return columns, window_token(start, end, next_token)
+
+        # A changed series is expanded again with all of its exceptions, not only the changed ones,
+        # and the stored occurrences it no longer has are deleted
+        series = list(columns.masters) + [event_id for event_id in columns.cancelled if event_id not in columns.overrides]
+        for master in list(columns.masters.values()):
+            for page in self.list_event_pages(calendar_id, fields=GOOGLE_SERIES_FIELDS, iCalUID=master['iCalUID'],
+                                              singleEvents=False):
+                columns.extend(page.get('items', []))
+        columns.expand(start, end, lambda master: self._server_instances(calendar_id, master, start, end))
+        if series:
+            current = set(columns.event_id) | set(columns.occurrences['event_id']) | set(columns.cancelled)
+            columns.cancelled += [
+                event_id for event_id in self.store.resource_event_ids(self.user_id, calendar_id, series, separator='_')
+                if event_id not in current
+            ]
+        return columns, window_token(start, end, next_token)
+
+    def _server_instances(self, calendar_id, master, start, end):
+        items = []
+        for page in self.list_event_pages(calendar_id, fields=GOOGLE_INSTANCE_FIELDS, method='instances', eventId=master['id'],
+                                          timeMin=start.isoformat(), timeMax=end.isoformat()):
+            items += page.get('items', [])
+        return items
+
+    def range_columns(self, calendar_id, start, end):
+        if self.local_recurrence:
+            return self._series_range(calendar_id, start, end)
+        columns = EventColumns()
+        for page in self._range_event_pages(calendar_id, start, end):
+            columns.extend(page.get('items', []))
+        return columns
+
+    def range_pages(self, calendar_id, start, end):
+        if self.local_recurrence:
+            # A series can't be expanded before all of its exceptions are in
+            yield self._series_range(calendar_id, start, end)
+            return
+        for page in self._range_event_pages(calendar_id, start, end):
+            columns = EventColumns()
+            columns.extend(page.get('items', []))
+            yield columns
+
+    def _range_event_pages(self, calendar_id, start, end):
+        return self.list_event_pages(
+            calendar_id,
+            timeMin=start.isoformat(),
+            timeMax=end.isoformat(),
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
-        
-        df = pd.DataFrame(columns=['summary', 'start', 'end', 'duration', 'attendees', 'category'])
-        
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            end = event['end'].get('dateTime', event['end'].get('date'))
-            
-            start_dt = datetime.fromisoformat(start)
-            end_dt = datetime.fromisoformat(end)
-            duration = (end_dt - start_dt).total_seconds() / 3600  # Duration in hours
-            
-            attendees = len(event.get('attendees', []))
-            
-            category = self.categorize_meeting(event['summary'])
-            
-            df = df.append({
-                'summary': event['summary'],
-                'start': start_dt,
-                'end': end_dt,
-                'duration': duration,
-                'attendees': attendees,
-                'category': category
-            }, ignore_index=True)
-        
-        return df
+        )
 
-    def categorize_meeting(self, summary):
-        summary = summary.lower()
-        if 'project' in summary:
-            return 'Project'
-        elif 'department' in summary or 'team' in summary:
-            return 'Department'
-        elif 'client' in summary or 'customer' in summary:
-            return 'Client'
-        elif 'interview' in summary:
-            return 'Recruitment'
-        elif 'training' in summary or 'workshop' in summary:
-            return 'Training'
-        else:
-            return 'Other'
+    def _series_range(self, calendar_id, start, end):
+        columns = RecurringEventColumns((start, end))
+        for page in self.list_event_pages(
+            calendar_id,
+            fields=GOOGLE_SERIES_FIELDS,
+            timeMin=start.isoformat(),
+            timeMax=end.isoformat(),
+            singleEvents=False
+        ):
+            columns.extend(page.get('items', []))
+        columns.expand(start, end, lambda master: self._server_instances(calendar_id, master, start, end))
+        return columns
+
+    def _map_calendars(self, fn, calendar_ids=None):
+        try:
+            return super()._map_calendars(fn, calendar_ids)
+        except RefreshError:
+            # Access was revoked; don't hand the dead client to the next request
+            client_cache.evict(self.credentials)
+            raise
+
+class HttpCalendarService(SyncedCalendarService):
+    # Providers without a client library, spoken to over httplib2, with windowed change feeds.
+    # `http` replaces the per-thread httplib2.Http, e.g. with a stand-in server.
+    windowed = True
+
+    def __init__(self, http=None, **kwargs):
+        super().__init__(**kwargs)
+        self.http = http
+
+    def auth_headers(self):
+        return {}
+
+    def _http(self):
+        if self.http is not None:
+            return self.http
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = httplib2.Http(timeout=60)
+        return http
+
+    def _send(self, uri, method='GET', body=None, headers=None):
+        # Failures raise HttpError like the Google client's, so the limiter's retry policy
+        # (429/503 with Retry-After) and the 410 resync work the same for every provider
+        def send():
+            resp, content = self._http().request(uri, method, body=body, headers={**self.auth_headers(), **(headers or {})})
+            if resp.status >= 400:
+                raise HttpError(resp, content, uri=uri)
+            return content
+
+        with metrics.stage('api_page') as stage:
+            content = self.limiter.call(self.user_id, send)
+            stage['bytes'] = len(content)
+        return content
+
+class OutlookCalendarService(HttpCalendarService):
+    # Microsoft Graph. Ranges come from calendarView, which expands recurring events the way
+    # singleEvents does; sync follows calendarView delta links. token is the OAuth token dict
+    # (access_token, refresh_token, expires_at) from the Microsoft identity platform. Refreshing
+    # replaces the refresh token too, so on_token_refresh(token) is called to keep the new one.
+    def __init__(self, token, base_url=GRAPH_API_URL, page_size=GRAPH_PAGE_SIZE, limiter=graph_limiter,
+                 on_token_refresh=None, **kwargs):
+        super().__init__(limiter=limiter, **kwargs)
+        self.token = token
+        self.on_token_refresh = on_token_refresh
+        self.base_url = base_url.rstrip('/')
+        self.page_size = page_size
 
-# Placeholder for future calendar services
-class OutlookCalendarService(CalendarService):
     def authenticate(self):
-        # Implement Outlook authentication
-        pass
+        with metrics.stage('auth'):
+            expires_at = self.token.get('expires_at')
+            if self.token.get('refresh_token') and expires_at and expires_at - time_module.time() < TOKEN_REFRESH_MARGIN:
+                self._refresh_token()
+            if self.user_id is None:
+                me = json.loads(self._send(f'{self.base_url}/me?$select=id'))
+                self.user_id = f"outlook:{me['id']}"
+
+    def _refresh_token(self):
+        from requests_oauthlib import OAuth2Session
+
+        client_id = os.environ['MICROSOFT_CLIENT_ID']
+        session = OAuth2Session(client_id, token=self.token)
+        self.token = session.refresh_token(
+            MICROSOFT_TOKEN_URL, client_id=client_id, client_secret=os.environ['MICROSOFT_CLIENT_SECRET']
+        )
+        if self.on_token_refresh is not None:
+            self.on_token_refresh(self.token)
+
+    def auth_headers(self):
+        return {
+            'Authorization': f"Bearer {self.token['access_token']}",
+            'Accept': 'application/json',
+            'Prefer': f'outlook.timezone="UTC", odata.maxpagesize={self.page_size}',
+        }
+
+    def _pages(self, url):
+        while url:
+            page = json.loads(self._send(url))
+            yield page
+            url = page.get('@odata.nextLink')
+
+    def _calendar_path(self, calendar_id):
+        return '/me' if calendar_id == 'primary' else f"/me/calendars/{quote(calendar_id, safe='')}"
+
+    def list_calendars(self):
+        calendars = []
+        for page in self._pages(f'{self.base_url}/me/calendars?$select=id,name,isDefaultCalendar'):
+            calendars += [
+                {'id': c['id'], 'summary': c.get('name'), 'primary': c.get('isDefaultCalendar', False), 'selected': True}
+                for c in page.get('value', [])
+            ]
+        return calendars
+
+    def range_columns(self, calendar_id, start, end):
+        columns = GraphEventColumns()
+        for page in self._range_event_pages(calendar_id, start, end):
+            columns.extend(page.get('value', []))
+        return columns
+
+    def range_pages(self, calendar_id, start, end):
+        for page in self._range_event_pages(calendar_id, start, end):
+            columns = GraphEventColumns()
+            columns.extend(page.get('value', []))
+            yield columns
+
+    def _range_event_pages(self, calendar_id, start, end):
+        query = urlencode({
+            'startDateTime': _utc_param(start), 'endDateTime': _utc_param(end),
+            '$select': GRAPH_EVENT_SELECT, '$orderby': 'start/dateTime', '$top': self.page_size,
+        }, safe='$,/:')
+        return self._pages(f'{self.base_url}{self._calendar_path(calendar_id)}/calendarView?{query}')
+
+    def change_pages(self, calendar_id, sync_token, window):
+        start, end = window
+        if sync_token is None:
+            query = urlencode({'startDateTime': _utc_param(start), 'endDateTime': _utc_param(end)}, safe=':')
+            url = f'{self.base_url}{self._calendar_path(calendar_id)}/calendarView/delta?{query}'
+        else:
+            url = split_window_token(sync_token)[2]
+        for page in self._pages(url):
+            columns = GraphEventColumns()
+            columns.extend(page.get('value', []))
+            # The delta link comes with the last page and replays the window it was created for
+            delta_link = page.get('@odata.deltaLink')
+            yield columns, window_token(start, end, delta_link) if delta_link else None
 
-    def fetch_events(self, start_date, end_date):
-        # Implement Outlook event fetching
-        pass
 
-class AppleCalendarService(CalendarService):
+def _utc_param(value):
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _ical_utc(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+CALDAV_NS = 'urn:ietf:params:xml:ns:caldav'
+CALDAV_HEADERS = {'Content-Type': 'application/xml; charset=utf-8'}
+CALDAV_PROPFIND = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    f'<D:propfind xmlns:D="DAV:" xmlns:C="{CALDAV_NS}"><D:prop>{{props}}</D:prop></D:propfind>'
+)
+# Recurring events are expanded by the server over the requested range, as singleEvents does
+CALDAV_EXPAND = '<D:prop><D:getetag/><C:calendar-data><C:expand start="{start}" end="{end}"/></C:calendar-data></D:prop>'
+CALDAV_QUERY = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    f'<C:calendar-query xmlns:D="DAV:" xmlns:C="{CALDAV_NS}">{CALDAV_EXPAND}'
+    '<C:filter><C:comp-filter name="VCALENDAR"><C:comp-filter name="VEVENT">'
+    '<C:time-range start="{start}" end="{end}"/></C:comp-filter></C:comp-filter></C:filter></C:calendar-query>'
+)
+CALDAV_MULTIGET = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    f'<C:calendar-multiget xmlns:D="DAV:" xmlns:C="{CALDAV_NS}">{CALDAV_EXPAND}{{hrefs}}</C:calendar-multiget>'
+)
+CALDAV_SYNC = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<D:sync-collection xmlns:D="DAV:"><D:sync-token>{token}</D:sync-token><D:sync-level>1</D:sync-level>'
+    '<D:prop><D:getetag/></D:prop></D:sync-collection>'
+)
+
+class AppleCalendarService(HttpCalendarService):
+    # iCloud, or any CalDAV server, with an app-specific password. Ranges use calendar-query;
+    # sync uses sync-collection to learn which resources changed and calendar-multiget to read
+    # them. Calendar ids are collection paths; 'primary' is the first calendar in the home set.
+    def __init__(self, username, password, base_url=CALDAV_URL, limiter=caldav_limiter,
+                 multiget_batch=CALDAV_MULTIGET_BATCH, **kwargs):
+        account = hashlib.sha256(f'{base_url}:{username}'.encode()).hexdigest()[:32]
+        kwargs['user_id'] = kwargs.get('user_id') or f'apple:{account}'
+        super().__init__(limiter=limiter, **kwargs)
+        self.username = username
+        self.password = password
+        self.base_url = base_url.rstrip('/')
+        self.multiget_batch = multiget_batch
+        self.home_url = None
+        self._calendars = None
+
+    def auth_headers(self):
+        secret = base64.b64encode(f'{self.username}:{self.password}'.encode()).decode()
+        return {'Authorization': f'Basic {secret}'}
+
+    def _propfind(self, url, props, depth=0):
+        content = self._send(url, 'PROPFIND', CALDAV_PROPFIND.format(props=props),
+                             {**CALDAV_HEADERS, 'Depth': str(depth)})
+        return ET.fromstring(content)
+
     def authenticate(self):
-        # Implement Apple Calendar authentication
-        pass
+        # Finds the calendar home through the principal, as CalDAV clients do (RFC 6764)
+        with metrics.stage('auth'):
+            if self.home_url is not None:
+                return
+            root = self._propfind(self.base_url + '/', '<D:current-user-principal/>')
+            principal = urljoin(self.base_url + '/', root.findtext('.//{DAV:}current-user-principal/{DAV:}href'))
+            root = self._propfind(principal, '<C:calendar-home-set/>')
+            self.home_url = urljoin(principal, root.findtext(f'.//{{{CALDAV_NS}}}calendar-home-set/{{DAV:}}href'))
 
-    def fetch_events(self, start_date, end_date):
-        # Implement Apple Calendar event fetching
-        pass
+    def list_calendars(self):
+        if self._calendars is None:
+            root = self._propfind(self.home_url, '<D:resourcetype/><D:displayname/>', depth=1)
+            calendars = []
+            for response in root.iter('{DAV:}response'):
+                if response.find(f'.//{{DAV:}}resourcetype/{{{CALDAV_NS}}}calendar') is None:
+                    continue
+                href = response.findtext('{DAV:}href')
+                calendars.append({'id': href, 'summary': response.findtext('.//{DAV:}displayname') or href,
+                                  'primary': not calendars, 'selected': True})
+            self._calendars = calendars
+        return self._calendars
+
+    def resolve_calendar_ids(self):
+        calendar_ids = super().resolve_calendar_ids()
+        if 'primary' in calendar_ids:
+            calendars = self.list_calendars()
+            primary = calendars[0]['id'] if calendars else None
+            calendar_ids = [primary if calendar_id == 'primary' else calendar_id for calendar_id in calendar_ids]
+        return [calendar_id for calendar_id in calendar_ids if calendar_id]
+
+    def _report(self, calendar_id, body, depth=1):
+        return self._send(urljoin(self.home_url, calendar_id), 'REPORT', body, {**CALDAV_HEADERS, 'Depth': str(depth)})
+
+    def range_columns(self, calendar_id, start, end):
+        columns = CalDAVEventColumns()
+        for href, calendar_data in self._range_resources(calendar_id, start, end):
+            columns.add_resource(href, calendar_data)
+        return columns
+
+    def range_pages(self, calendar_id, start, end):
+        # A range is one report; it is handed over CALDAV_MULTIGET_BATCH resources at a time as it is parsed
+        columns = CalDAVEventColumns()
+        for i, (href, calendar_data) in enumerate(self._range_resources(calendar_id, start, end), 1):
+            columns.add_resource(href, calendar_data)
+            if i % CALDAV_MULTIGET_BATCH == 0:
+                yield columns
+                columns = CalDAVEventColumns()
+        yield columns
+
+    def _range_resources(self, calendar_id, start, end):
+        content = self._report(calendar_id, CALDAV_QUERY.format(start=_ical_utc(start), end=_ical_utc(end)))
+        for href, status, calendar_data in iter_multistatus(content):
+            if status == 200 and calendar_data:
+                yield href, calendar_data
+
+    def sync_expired(self, error):
+        # RFC 6578 answers an unusable sync token with 403 valid-sync-token; some servers use 410
+        return super().sync_expired(error) or (
+            isinstance(error, HttpError) and error.resp.status == 403 and b'valid-sync-token' in (error.content or b'')
+        )
+
+    def change_pages(self, calendar_id, sync_token, window):
+        start, end = window
+        token = split_window_token(sync_token)[2] if sync_token else ''
+        more = True
+        while more:
+            previous = token
+            content = self._report(calendar_id, CALDAV_SYNC.format(token=escape(token)), depth=0)
+            changed, removed, more = [], [], False
+            for href, status, value in iter_multistatus(content):
+                if href is None:
+                    token = value
+                elif status == 507:
+                    # The server truncated the report; ask again from the token it returned
+                    more = True
+                elif status == 404:
+                    removed.append(href)
+                elif not href.endswith('/'):
+                    changed.append(href)
+            # Each resource is a whole series, so instances that are gone after the change are
+            # found from what was stored for the resource
+            stale = set(self.store.resource_event_ids(self.user_id, calendar_id, changed + removed)) if previous else set()
+            current = set()
+            for i in range(0, len(changed), self.multiget_batch):
+                hrefs = ''.join(f'<D:href>{escape(href)}</D:href>' for href in changed[i:i + self.multiget_batch])
+                body = CALDAV_MULTIGET.format(start=_ical_utc(start), end=_ical_utc(end), hrefs=hrefs)
+                columns = CalDAVEventColumns()
+                for href, status, calendar_data in iter_multistatus(self._report(calendar_id, body)):
+                    if status == 200 and calendar_data:
+                        columns.add_resource(href, calendar_data)
+                current.update(columns.event_id)
+                yield columns, None
+            deletions = CalDAVEventColumns()
+            deletions.cancelled = sorted(stale - current)
+            yield deletions, window_token(start, end, token)
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from metrics import metrics
+
+DEFAULT_CATEGORY = 'Other'
+
+# Checked in order, first match wins. A rule matches when every condition it sets holds:
+#   keywords / regexes     any of them found in the summary (case-insensitive)
+#   organizer_domains      organizer email is in one of these domains
+#   min_attendees / max_attendees   inclusive bounds on the attendee count
+DEFAULT_RULES = [
+    {'category': 'Project', 'keywords': ['project']},
+    {'category': 'Department', 'keywords': ['department', 'team']},
+    {'category': 'Client', 'keywords': ['client', 'customer']},
+    {'category': 'Recruitment', 'keywords': ['interview']},
+    {'category': 'Training', 'keywords': ['training', 'workshop']},
+]
+
+
+def load_rules(path=None):
+    path = path or os.environ.get('CATEGORY_RULES_PATH')
+    if not path:
+        return DEFAULT_RULES
+    with open(path) as f:
+        return json.load(f)
+
+
+# Summaries sampled to judge how many are distinct, and the distinct share above which
+# matching every row beats factorizing first
+DISTINCT_SAMPLE = 10_000
+DISTINCT_SHARE = 0.5
+
+
+def _lowered_buffer(summaries):
+    # Lower-cased summaries as one NUL-separated UTF-8 buffer, and where each one starts. ASCII text
+    # is lower-cased as bytes; anything else goes through str.lower one summary at a time.
+    joined = '\0'.join(summaries)
+    if joined.isascii():
+        buffer = np.frombuffer(joined.encode('ascii'), dtype=np.uint8)
+        buffer = buffer + (((buffer - np.uint8(ord('A'))) < 26).view(np.uint8) << 5)
+        separators = np.flatnonzero(buffer == 0)
+        if len(separators) == len(summaries) - 1:
+            return buffer, np.concatenate([[0], separators + 1])
+        lengths = np.fromiter(map(len, summaries), dtype=np.int64, count=len(summaries))
+    else:
+        encoded = [summary.lower().encode() for summary in summaries]
+        buffer = np.frombuffer(b'\0'.join(encoded), dtype=np.uint8)
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    return buffer, np.concatenate([[0], np.cumsum(lengths[:-1] + 1)])
+
+
+def _rows_containing(buffer, starts, keywords):
+    # For each keyword, the rows of the buffer containing it. Candidates are the positions of any
+    # keyword's first byte, found in one pass; each keyword keeps those matching its first two
+    # bytes, narrows them a byte at a time and maps what's left to the row it starts in.
+    found = [np.ones(len(starts), dtype=bool) if not keyword else np.zeros(len(starts), dtype=bool)
+             for keyword in keywords]
+    keywords = [np.frombuffer(keyword, dtype=np.uint8) for keyword in keywords]
+    firsts = {int(keyword[0]) for keyword in keywords if len(keyword)}
+    if not firsts:
+        return found
+    # Padding keeps the narrowing in bounds and can't match, as keywords hold no NUL
+    buffer = np.concatenate([buffer, np.zeros(max(map(len, keywords)), dtype=np.uint8)])
+    candidate = np.zeros(len(buffer), dtype=bool)
+    for first in firsts:
+        candidate |= buffer == first
+    positions = np.flatnonzero(candidate)
+    pairs = buffer[positions] | buffer[positions + 1].astype(np.uint16) << 8
+    for rows, keyword in zip(found, keywords):
+        if not len(keyword):
+            continue
+        if len(keyword) == 1:
+            hits = positions[buffer[positions] == keyword[0]]
+        else:
+            hits = positions[pairs == keyword[0] | np.uint16(keyword[1]) << 8]
+            for offset in range(2, len(keyword)):
+                hits = hits[buffer[hits + offset] == keyword[offset]]
+        rows[np.searchsorted(starts, hits, side='right') - 1] = True
+    return found
+
+
+class Categorizer:
+    def __init__(self, rules):
+        self.rules = rules
+        self.digest = rule_hash(rules)
+        self.categories = [rule['category'] for rule in rules]
+        # Rules with a text condition; keywords are scanned for in one byte buffer of all the
+        # summaries, regexes still run per summary
+        self.text_rules = []
+        for i, rule in enumerate(rules):
+            keywords = tuple(k.lower().encode() for k in rule.get('keywords', []))
+            regexes = rule.get('regexes', [])
+            pattern = re.compile('|'.join(f'(?:{r})' for r in regexes), re.IGNORECASE) if regexes else None
+            if keywords or pattern is not None:
+                self.text_rules.append((i, keywords, pattern))
+        self.labels = np.array(self.categories + [DEFAULT_CATEGORY], dtype=object)
+
+    def _text_matches(self, summaries):
+        # One row per text rule: which summaries it matches
+        matches = np.zeros((len(self.text_rules), len(summaries)), dtype=bool)
+        if not len(summaries) or not self.text_rules:
+            return matches
+        keywords = [keyword for _, rule_keywords, _ in self.text_rules for keyword in rule_keywords]
+        if keywords:
+            found = iter(_rows_containing(*_lowered_buffer(summaries), keywords))
+            for row, (_, rule_keywords, _) in enumerate(self.text_rules):
+                for _ in rule_keywords:
+                    matches[row] |= next(found)
+        for row, (_, _, pattern) in enumerate(self.text_rules):
+            if pattern is not None:
+                unmatched = np.flatnonzero(~matches[row])
+                matches[row, unmatched] = [pattern.search(summaries[i].lower()) is not None for i in unmatched]
+        return matches
+
+    def _summary_matches(self, summaries):
+        # Text matches per row. Mostly recurring summaries are matched once per distinct one; when
+        # a sample says most are distinct, factorizing costs more than it saves.
+        sample = summaries.iloc[::max(len(summaries) // DISTINCT_SAMPLE, 1)]
+        if len(sample) and sample.nunique(dropna=False) / len(sample) > DISTINCT_SHARE:
+            values = summaries.to_numpy(dtype=object)
+            try:
+                return self._text_matches(values)
+            except (TypeError, AttributeError):
+                # Some summaries are missing; they match nothing
+                missing = pd.isna(values)
+                matches = self._text_matches(np.where(missing, '', values))
+                matches[:, missing] = False
+                return matches
+        # Missing summaries factorize to -1 and pick up the trailing "no match" column
+        codes, uniques = pd.factorize(summaries)
+        matches = self._text_matches(np.asarray(uniques, dtype=object))
+        return np.concatenate([matches, np.zeros((len(matches), 1), dtype=bool)], axis=1)[:, codes]
+
+    def _organizer_domains(self, df, n):
+        if 'organizer' not in df:
+            return np.full(n, '', dtype=object)
+        codes, uniques = pd.factorize(df['organizer'])
+        domains = np.array([email.rpartition('@')[2].lower() for email in uniques] + [''], dtype=object)
+        return domains[codes]
+
+    def _first_match(self, matches, df=None):
+        # Index of the first rule that holds, len(rules) when none do
+        n = matches.shape[1]
+        organizer_domains = None
+        masks = []
+        text_row = {rule: row for row, (rule, _, _) in enumerate(self.text_rules)}
+        for i, rule in enumerate(self.rules):
+            mask = matches[text_row[i]] if i in text_row else np.ones(n, dtype=bool)
+            if rule.get('organizer_domains'):
+                if organizer_domains is None:
+                    organizer_domains = self._organizer_domains(df, n)
+                mask = mask & np.isin(organizer_domains, [d.lower() for d in rule['organizer_domains']])
+            if 'min_attendees' in rule:
+                mask = mask & (df['attendees'].to_numpy() >= rule['min_attendees'])
+            if 'max_attendees' in rule:
+                mask = mask & (df['attendees'].to_numpy() <= rule['max_attendees'])
+            masks.append(mask)
+        if not masks:
+            return np.zeros(n, dtype=np.int64)
+        return np.select(masks, np.arange(len(masks)), default=len(masks))
+
+    def categorize(self, df):
+        with metrics.stage('categorize') as stage:
+            stage['events'] = len(df)
+            first = self._first_match(self._summary_matches(df['summary']), df)
+            return pd.Series(self.labels[first], index=df.index, dtype=object)
+
+    def categorize_summary(self, summary, attendees=0, organizer=None):
+        row = pd.DataFrame({'summary': [summary], 'attendees': [attendees], 'organizer': [organizer]})
+        return self.categorize(row).iloc[0]
+
+
+def rule_hash(rules):
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+
+
+@lru_cache(maxsize=32)
+def _compile(rules_json):
+    return Categorizer(json.loads(rules_json))
+
+
+def compile_rules(rules=None):
+    # Compiled categorizers are shared by every service using the same rule set
+    rules = load_rules() if rules is None else rules
+    return _compile(json.dumps(rules, sort_keys=True))
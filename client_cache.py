@@ -0,0 +1,173 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build_from_document
+
+logger = logging.getLogger(__name__)
+
+# Refresh this long before the access token expires
+REFRESH_MARGIN = timedelta(minutes=5)
+# Wait before retrying a refresh that failed for a transient reason
+REFRESH_RETRY = timedelta(minutes=1)
+# Clients kept per process, and how long an unused one is kept
+CLIENT_CACHE_ENTRIES = int(os.environ.get('CLIENT_CACHE_ENTRIES', 256))
+CLIENT_CACHE_IDLE = float(os.environ.get('CLIENT_CACHE_IDLE', 3600))
+# Calendar v3 discovery document, bundled so clients are built without a lookup or a network call
+DISCOVERY_PATH = os.environ.get('CALENDAR_DISCOVERY_PATH', os.path.join(os.path.dirname(__file__), 'calendar_discovery.json'))
+
+
+def credential_key(credentials):
+    # Stable per-account identity that never exposes the token itself
+    secret = getattr(credentials, 'refresh_token', None) or getattr(credentials, 'token', None) or ''
+    client_id = getattr(credentials, 'client_id', None) or ''
+    return hashlib.sha256(f'{client_id}:{secret}'.encode()).hexdigest()[:32]
+
+
+@lru_cache(maxsize=1)
+def calendar_discovery():
+    with open(DISCOVERY_PATH) as f:
+        return json.load(f)
+
+
+def build_calendar_client(credentials, http=None):
+    # Parsed once per process; build() would re-read and re-parse googleapiclient's copy every time
+    return build_from_document(calendar_discovery(), credentials=credentials, http=http)
+
+
+class _Entry:
+    def __init__(self, client, credentials, used_at):
+        self.client = client
+        self.credentials = credentials
+        self.used_at = used_at
+
+
+class ClientCache:
+    # Least recently used clients go first once there are more than max_entries, and a client
+    # unused for idle_seconds is dropped. One refresher thread, started with the first entry,
+    # refreshes each token refresh_margin before it expires, so no request waits for a refresh;
+    # it skips clients that have gone idle instead of keeping their tokens alive.
+    def __init__(self, factory=build_calendar_client, refresh_margin=REFRESH_MARGIN,
+                 max_entries=CLIENT_CACHE_ENTRIES, idle_seconds=CLIENT_CACHE_IDLE, clock=time.monotonic):
+        self.factory = factory
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # (due as naive UTC, sequence, key, entry), earliest first; stale items are skipped when due
+        self._due = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition(self._lock)
+        self._refresher = None
+
+    def get(self, credentials):
+        return self.entry(credentials).client
+
+    def entry(self, credentials):
+        # The cached client with the credentials the refresher keeps current; requests should be
+        # authorized with these rather than the caller's copy
+        key = credential_key(credentials)
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(self.factory(credentials), credentials, now)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._schedule(key, entry)
+            else:
+                self._entries.move_to_end(key)
+                entry.used_at = now
+        return entry
+
+    def evict(self, credentials):
+        self._remove(credential_key(credentials))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._due.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self, now):
+        # Oldest use first, so stop at the first one still in use
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.used_at <= self.idle_seconds:
+                break
+            del self._entries[key]
+
+    def _remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _schedule(self, key, entry, due=None):
+        # Called with the lock held
+        credentials = entry.credentials
+        if due is None:
+            if not getattr(credentials, 'refresh_token', None) or getattr(credentials, 'expiry', None) is None:
+                return
+            # google-auth keeps expiry as naive UTC
+            due = credentials.expiry - self.refresh_margin
+        heapq.heappush(self._due, (due, next(self._sequence), key, entry))
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name='client-cache-refresh', daemon=True)
+            self._refresher.start()
+        self._wakeup.notify()
+
+    def _next_due(self):
+        # Waits for the earliest refresh that is due and still wanted
+        with self._lock:
+            while True:
+                if not self._due:
+                    self._wakeup.wait()
+                    continue
+                due, _, key, entry = self._due[0]
+                wait = (due - datetime.utcnow()).total_seconds()
+                if wait > 0:
+                    self._wakeup.wait(wait)
+                    continue
+                heapq.heappop(self._due)
+                self._expire(self.clock())
+                if self._entries.get(key) is entry:
+                    return key, entry
+
+    def _refresh_loop(self):
+        while True:
+            key, entry = self._next_due()
+            try:
+                entry.credentials.refresh(Request())
+            except RefreshError as e:
+                # Revoked or expired grant; the next authenticate() starts from scratch
+                logger.info(f"Dropping cached calendar client after failed token refresh: {e}")
+                self._remove(key)
+                continue
+            except Exception as e:
+                logger.warning(f"Background token refresh failed, retrying after {REFRESH_RETRY}: {e}")
+                with self._lock:
+                    self._schedule(key, entry, datetime.utcnow() + REFRESH_RETRY)
+                continue
+            if entry.credentials.expiry is None:
+                continue
+            with self._lock:
+                # A token that comes back already inside the margin is tried again later, not in a loop
+                self._schedule(key, entry, max(entry.credentials.expiry - self.refresh_margin,
+                                               datetime.utcnow() + REFRESH_RETRY))
+
+
+client_cache = ClientCache()
@@ -1,26 +1,321 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 
-def analyze_calendar_data(df):
-    # Perform analysis on the calendar data
+from metrics import metrics
+
+# Days, hours of the day and working hours are counted in this time zone (an IANA name) unless the
+# calendar service or the caller gives another
+ANALYSIS_TIMEZONE = os.environ.get('ANALYSIS_TIMEZONE', 'UTC')
+# Working hours for free and focus time, local time
+WORKDAY_START_HOUR = int(os.environ.get('WORKDAY_START_HOUR', 9))
+WORKDAY_END_HOUR = int(os.environ.get('WORKDAY_END_HOUR', 17))
+# Free blocks at least this long count as focus time
+FOCUS_BLOCK_MINUTES = int(os.environ.get('FOCUS_BLOCK_MINUTES', 60))
+# How each kind of sweep point (meeting end, window end, window start, meeting start) moves the
+# number of meetings running and whether working hours are on
+MEETING_STEP = np.array([-1, 0, 0, 1], dtype=np.int8)
+WINDOW_STEP = np.array([0, -1, 1, 0], dtype=np.int8)
+
+
+@dataclass(frozen=True)
+class CalendarAnalysis:
+    total_meetings: int
+    total_duration: float
+    avg_duration: float
+    avg_attendees: float
+    max_attendees: int
+    meetings_by_day: pd.Series
+    duration_by_day: pd.Series
+    meetings_by_hour: pd.Series
+    meetings_by_category: pd.Series
+    duration_by_category: pd.Series
+    meetings_by_attendees: pd.Series
+
+
+@dataclass(frozen=True)
+class IntervalAnalysis:
+    overlapping_meetings: int   # meetings overlapping at least one other
+    overlapping_pairs: int
+    double_booked_hours: float  # time covered by two or more meetings
+    busy_hours: float           # time covered by at least one meeting, overlaps counted once
+    overlapping: pd.Series      # per event, aligned with the analyzed frame
+    # Per working day: busy, double_booked, free, longest_free and focus hours within working hours,
+    # and fragmentation, the share of free time in blocks too short for focus
+    by_day: pd.DataFrame
+
+
+@dataclass(frozen=True)
+class DailyRollups:
+    # Partial aggregates by local start day (days since the epoch) and category. They add up,
+    # so ranges are answered by summing rows, and weights of -1 take events back out.
+    # EventStore.load_rollups returns hours and attendees already summed over the range, without day.
+    days: pd.DataFrame       # day, category, meetings, duration, attendee_total
+    hours: pd.DataFrame      # day, category, hour, meetings
+    attendees: pd.DataFrame  # day, category, attendees, meetings
+
+
+def local_times(times, tz=None):
+    # Wall-clock datetime64 in tz of UTC (or any tz-aware) times
+    times = pd.DatetimeIndex(times)
+    times = times.tz_localize('UTC') if times.tz is None else times
+    return times.tz_convert(tz or ANALYSIS_TIMEZONE).tz_localize(None).to_numpy()
+
+
+def local_day(value, tz=None):
+    # Local date of an instant, as days since the epoch
+    value = pd.Timestamp(value)
+    value = value.tz_localize('UTC') if value.tzinfo is None else value
+    return (value.tz_convert(tz or ANALYSIS_TIMEZONE).tz_localize(None).normalize() - pd.Timestamp(0)).days
+
+
+def rollup_events(df, weights=None, tz=None):
+    weights = np.ones(len(df), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+    start = local_times(df['start'], tz).astype('datetime64[m]')
+    day = start.astype('datetime64[D]')
+    attendees = df['attendees'].to_numpy(dtype='int64')
+    rows = pd.DataFrame({
+        'day': day.astype('int64'),
+        'category': df['category'].to_numpy(dtype=object),
+        'hour': (start - day).astype('int64') // 60,
+        'attendees': attendees,
+        'meetings': weights,
+        'duration': df['duration'].to_numpy(dtype='float64') * weights,
+        'attendee_total': attendees * weights,
+    })
+    return sum_rollups(DailyRollups(days=rows, hours=rows, attendees=rows))
+
+
+def sum_rollups(rollups):
+    # One row per key, e.g. after combine_rollups
+    return DailyRollups(
+        days=rollups.days.groupby(['day', 'category'], as_index=False, sort=False)[
+            ['meetings', 'duration', 'attendee_total']].sum(),
+        hours=rollups.hours.groupby(['day', 'category', 'hour'], as_index=False, sort=False)['meetings'].sum(),
+        attendees=rollups.attendees.groupby(['day', 'category', 'attendees'], as_index=False, sort=False)['meetings'].sum(),
+    )
+
+
+def _concat(frames):
+    non_empty = [frame for frame in frames if len(frame)]
+    return pd.concat(non_empty, ignore_index=True) if non_empty else frames[0]
+
+
+def combine_rollups(parts):
+    parts = list(parts)
+    return DailyRollups(*(
+        _concat([getattr(part, field) for part in parts]) for field in ('days', 'hours', 'attendees')
+    ))
+
+
+def _breakdown(codes, labels, duration, index_name):
+    counts = np.bincount(codes, minlength=len(labels))
+    durations = np.bincount(codes, weights=duration, minlength=len(labels))
+    index = pd.Index(labels, name=index_name)
+    return pd.Series(counts, index=index, name='meetings'), pd.Series(durations, index=index, name='duration')
+
+
+def analyze_calendar_data(df, tz=None):
+    with metrics.stage('aggregate', source='events') as stage:
+        stage['events'] = len(df)
+        return _analyze_events(df, tz)
+
+
+def _analyze_events(df, tz):
+    # Every breakdown comes from integer codes computed once, and the input frame is never modified
+    duration = df['duration'].to_numpy(dtype='float64')
+    attendees = df['attendees'].to_numpy(dtype='int64')
+    start = local_times(df['start'], tz).astype('datetime64[m]')
+
+    days, day_codes = np.unique(start.astype('datetime64[D]'), return_inverse=True)
+    meetings_by_day, duration_by_day = _breakdown(day_codes, pd.DatetimeIndex(days).date, duration, 'day')
+
+    hours = (start - start.astype('datetime64[D]')).astype('int64') // 60
+    meetings_by_hour = pd.Series(
+        np.bincount(hours, minlength=24), index=pd.RangeIndex(24, name='hour'), name='meetings'
+    )
+
+    category_codes, categories = pd.factorize(df['category'], sort=True)
+    meetings_by_category, duration_by_category = _breakdown(category_codes, categories, duration, 'category')
+
+    attendee_counts = np.bincount(attendees)
+    present = np.flatnonzero(attendee_counts)
+    meetings_by_attendees = pd.Series(
+        attendee_counts[present], index=pd.Index(present, name='attendees'), name='meetings'
+    )
+
     total_meetings = len(df)
-    total_duration = df['duration'].sum()
-    avg_duration = df['duration'].mean()
-    avg_attendees = df['attendees'].mean()
-    
-    # Group meetings by day
-    df['day'] = df['start'].dt.date
-    meetings_by_day = df.groupby('day').size()
-    
-    # Group meetings by category
-    meetings_by_category = df.groupby('category').size()
-    duration_by_category = df.groupby('category')['duration'].sum()
-    
-    return {
-        'total_meetings': total_meetings,
-        'total_duration': total_duration,
-        'avg_duration': avg_duration,
-        'avg_attendees': avg_attendees,
-        'meetings_by_day': meetings_by_day,
-        'meetings_by_category': meetings_by_category,
-        'duration_by_category': duration_by_category
-    }
+    total_duration = float(duration.sum())
+    return CalendarAnalysis(
+        total_meetings=total_meetings,
+        total_duration=total_duration,
+        avg_duration=total_duration / total_meetings if total_meetings else float('nan'),
+        avg_attendees=float(attendees.mean()) if total_meetings else float('nan'),
+        max_attendees=int(attendees.max()) if total_meetings else 0,
+        meetings_by_day=meetings_by_day,
+        duration_by_day=duration_by_day,
+        meetings_by_hour=meetings_by_hour,
+        meetings_by_category=meetings_by_category,
+        duration_by_category=duration_by_category,
+        meetings_by_attendees=meetings_by_attendees,
+    )
+
+
+def analysis_from_rollups(rollups):
+    with metrics.stage('aggregate', source='rollups') as stage:
+        stage['rows'] = len(rollups.days) + len(rollups.hours) + len(rollups.attendees)
+        return _analyze_rollups(rollups)
+
+
+def _analyze_rollups(rollups):
+    # Same result as analyze_calendar_data on the events the rollups were built from
+    days = rollups.days.groupby('day')[['meetings', 'duration']].sum()
+    days = days[days['meetings'] != 0]
+    day_index = pd.Index(pd.to_datetime(days.index.to_numpy(), unit='D').date, name='day')
+
+    categories = rollups.days.groupby('category')[['meetings', 'duration']].sum()
+    categories = categories[categories['meetings'] != 0]
+    category_index = pd.Index(categories.index, name='category')
+
+    hours = rollups.hours.groupby('hour')['meetings'].sum()
+    attendees = rollups.attendees.groupby('attendees')['meetings'].sum()
+    attendees = attendees[attendees != 0]
+
+    total_meetings = int(days['meetings'].sum())
+    total_duration = float(days['duration'].sum())
+    attendee_total = float(rollups.days['attendee_total'].sum())
+    return CalendarAnalysis(
+        total_meetings=total_meetings,
+        total_duration=total_duration,
+        avg_duration=total_duration / total_meetings if total_meetings else float('nan'),
+        avg_attendees=attendee_total / total_meetings if total_meetings else float('nan'),
+        max_attendees=int(attendees.index.max()) if len(attendees) else 0,
+        meetings_by_day=pd.Series(days['meetings'].to_numpy(dtype='int64'), index=day_index, name='meetings'),
+        duration_by_day=pd.Series(days['duration'].to_numpy(), index=day_index, name='duration'),
+        meetings_by_hour=pd.Series(
+            hours.reindex(range(24), fill_value=0).to_numpy(dtype='int64'),
+            index=pd.RangeIndex(24, name='hour'), name='meetings'
+        ),
+        meetings_by_category=pd.Series(
+            categories['meetings'].to_numpy(dtype='int64'), index=category_index, name='meetings'
+        ),
+        duration_by_category=pd.Series(categories['duration'].to_numpy(), index=category_index, name='duration'),
+        meetings_by_attendees=pd.Series(
+            attendees.to_numpy(dtype='int64'), index=pd.Index(attendees.index.to_numpy(dtype='int64'), name='attendees'),
+            name='meetings'
+        ),
+    )
+
+
+def analyze_intervals(df, start_date=None, end_date=None, tz=None):
+    with metrics.stage('intervals') as stage:
+        stage['events'] = len(df)
+        return _analyze_intervals(df, start_date, end_date, tz)
+
+
+def _working_hour(days, hour, tz):
+    # Epoch seconds of a local hour on each of days (local days since the epoch). A time skipped by a
+    # DST change moves to the end of the gap; a repeated one takes its later, standard-time instant.
+    local = pd.to_datetime(days, unit='D') + pd.Timedelta(hours=hour)
+    return local.tz_localize(tz or ANALYSIS_TIMEZONE, ambiguous=False, nonexistent='shift_forward').asi8 // 10 ** 9
+
+
+def _analyze_intervals(df, start_date, end_date, tz):
+    # One sort of every start and end (a sweep line), so no meeting is compared with another
+    rows, start, end = _timed_meetings(df)
+    overlapping = np.zeros(len(df), dtype=bool)
+    overlapping[rows] = _overlapping(start, end)
+
+    # Working-day windows, local days and hours, go into the same sweep, so per-day figures come out of it too
+    if start_date is None or end_date is None:
+        first, last = (0, -1)
+        if len(start):
+            first, last = local_day(start.min() * 10 ** 9, tz), local_day(end.max() * 10 ** 9, tz)
+    else:
+        first = (np.datetime64(start_date, 'D') - np.datetime64(0, 'D')).astype(np.int64)
+        last = (np.datetime64(end_date, 'D') - np.datetime64(0, 'D')).astype(np.int64)
+    days = np.arange(first, last + 1)
+    days = days[(days + 3) % 7 < 5]  # Monday to Friday; day 0 was a Thursday
+    times, kinds = _sweep(
+        start, end, _working_hour(days, WORKDAY_START_HOUR, tz), _working_hour(days, WORKDAY_END_HOUR, tz)
+    )
+    del start, end
+    depth = np.cumsum(MEETING_STEP[kinds], dtype=np.int32)[:-1]
+    window = np.cumsum(kinds == 2, dtype=np.int32)[:-1] - 1
+    working = np.cumsum(WINDOW_STEP[kinds], dtype=np.int8)[:-1] == 1
+    # Segment i runs from point i to point i + 1
+    span = np.diff(times) / 3600
+    del times
+
+    def per_day(chosen):
+        return np.bincount(window[chosen], weights=span[chosen], minlength=len(days))
+
+    # Free time only splits where a meeting starts or a window ends, so each free segment is a whole free block
+    free = working & (depth == 0)
+    longest_free = np.zeros(len(days))
+    np.maximum.at(longest_free, window[free], span[free])
+    free_hours = per_day(free)
+    focus_hours = per_day(free & (span * 60 >= FOCUS_BLOCK_MINUTES))
+    by_day = pd.DataFrame({
+        'busy': per_day(working & (depth > 0)),
+        'double_booked': per_day(working & (depth > 1)),
+        'free': free_hours,
+        'longest_free': longest_free,
+        'focus': focus_hours,
+        'fragmentation': np.divide(free_hours - focus_hours, free_hours, out=np.zeros(len(days)), where=free_hours > 0),
+    }, index=pd.Index(pd.to_datetime(days, unit='D').date, name='day'))
+
+    # Each start overlaps every meeting already running, so the depth it opens counts its pairs
+    starts = kinds[:-1] == 3
+    return IntervalAnalysis(
+        overlapping_meetings=int(overlapping.sum()),
+        overlapping_pairs=int((depth[starts] - 1).sum()),
+        double_booked_hours=float(span[depth > 1].sum()),
+        busy_hours=float(span[depth > 0].sum()),
+        overlapping=pd.Series(overlapping, index=df.index, name='overlapping'),
+        by_day=by_day,
+    )
+
+
+def _timed_meetings(df):
+    # Rows, starts and ends (epoch seconds) of the meetings with a length. All-day events (whole
+    # UTC days) mark holidays and time off rather than meetings and are left out.
+    start = df['start'].to_numpy(dtype='datetime64[s]').view(np.int64)
+    end = df['end'].to_numpy(dtype='datetime64[s]').view(np.int64)
+    length = end - start
+    rows = np.flatnonzero((length > 0) & ((start % 86400 != 0) | (length % 86400 != 0)))
+    if len(rows) == len(df):
+        return rows, start, end
+    return rows, start[rows], end[rows]
+
+
+def _overlapping(start, end):
+    # Meetings ordered by start merge into blocks wherever a start reaches past every earlier end;
+    # every meeting in a block of two or more overlaps another one
+    order = np.argsort(start, kind='stable')
+    reach = np.maximum.accumulate(end[order])
+    new_block = np.ones(len(order), dtype=bool)
+    new_block[1:] = start[order[1:]] >= reach[:-1]
+    block = np.cumsum(new_block, dtype=np.int32) - 1
+    overlapping = np.empty(len(order), dtype=bool)
+    overlapping[order] = np.bincount(block)[block] > 1
+    return overlapping
+
+
+def _sweep(start, end, window_start, window_end):
+    # Every point in time order as (times, kinds), kinds indexing MEETING_STEP and WINDOW_STEP.
+    # Points are sorted as one key, time * 4 + kind, so at equal times ends sort before starts and
+    # back-to-back meetings don't overlap.
+    points = np.empty(2 * len(start) + 2 * len(window_start), dtype=np.int64)
+    offset = 0
+    for kind, times in enumerate((end, window_end, window_start, start)):
+        chosen = points[offset:offset + len(times)]
+        np.multiply(times, 4, out=chosen)
+        chosen += kind
+        offset += len(times)
+    points.sort()
+    kinds = (points & 3).astype(np.int8)
+    points >>= 2
+    return points, kinds
@@ -1,14 +1,24 @@
-import smtplib
+import logging
+import os
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
-import io
+from figure_renderer import MIME_SUBTYPES, IMAGE_FORMATS, renderer
+from smtp_pool import get_delivery_pool
+from metrics import metrics
 
-def send_email_report(email, figs):
+logger = logging.getLogger(__name__)
+
+SEND_TIMEOUT = float(os.environ.get('SMTP_SEND_TIMEOUT', 300))
+
+
+def send_email_report(email, figs, image_format='png', width=None, height=None, scale=1):
     try:
+        pool = get_delivery_pool()
+
         # Create the email message
         msg = MIMEMultipart()
-        msg['From'] = 'your_email@example.com'  # Replace with your email
+        msg['From'] = pool.sender
         msg['To'] = email
         msg['Subject'] = 'Weekly Calendar Analysis Report'
 
@@ -16,10 +26,11 @@ def send_email_report(email, figs):
         text = "Here's your weekly calendar analysis report. Please find the visualizations attached below."
         msg.attach(MIMEText(text, 'plain'))
 
-        # Add visualizations as inline images
-        for i, fig in enumerate(figs):
-            img_bytes = fig.to_image(format="png")
-            img = MIMEImage(img_bytes)
+        # Add visualizations as inline images, rendered in parallel on warm processes with an image cache
+        image_format = IMAGE_FORMATS[image_format.lower()]
+        images = renderer.render(figs, image_format=image_format, width=width, height=height, scale=scale)
+        for i, img_bytes in enumerate(images):
+            img = MIMEImage(img_bytes, _subtype=MIME_SUBTYPES[image_format])
             img.add_header('Content-ID', f'<image{i}>')
             msg.attach(img)
 
@@ -30,18 +41,13 @@ def send_email_report(email, figs):
         html += "</body></html>"
         msg.attach(MIMEText(html, 'html'))
 
-        # Send the email
-        smtp_server = "smtp.gmail.com"  # Replace with your SMTP server
-        smtp_port = 587
-        smtp_username = "your_email@example.com"  # Replace with your email
-        smtp_password = "your_password"  # Replace with your email password or app-specific password
-
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg)
-
+        # Queue the message on a pooled connection and wait for the server's answer
+        with metrics.stage('smtp_send'):
+            refused = pool.submit(msg).result(timeout=SEND_TIMEOUT)
+        if refused:
+            logger.warning(f"Report to {email} refused for: {', '.join(refused)}")
+            return False
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        logger.error(f"Error sending email to {email}: {e}")
         return False
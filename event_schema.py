@@ -0,0 +1,46 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+EVENT_COLUMNS = ['summary', 'start', 'end', 'duration', 'attendees', 'category', 'calendar_id']
+# Kept when present: attendee addresses, newline-separated (None without attendees)
+OPTIONAL_COLUMNS = ['attendee_emails']
+
+# Repeated strings are dictionary-encoded; numbers use the narrowest type that holds them
+CATEGORICAL_COLUMNS = ['summary', 'category', 'calendar_id', 'attendee_emails']
+DATETIME_COLUMNS = ['start', 'end']
+UTC_DTYPE = pd.DatetimeTZDtype(tz='UTC')
+
+
+def join_addresses(addresses):
+    # Newline-separated, or None. Lists repeat across a series' instances and a team's meetings,
+    # so each distinct one is held once.
+    return sys.intern('\n'.join(addresses)) if addresses else None
+
+
+def _compact_ints(values):
+    top = int(values.max()) if len(values) else 0
+    return values.astype('int16' if top <= np.iinfo('int16').max else 'int32')
+
+
+def compact_event_frame(df):
+    # Validates an event frame and returns it in the compact schema; the input is left untouched
+    missing = [column for column in EVENT_COLUMNS if column not in df]
+    if missing:
+        raise ValueError(f"Event frame is missing columns: {', '.join(missing)}")
+
+    compact = {}
+    for column in EVENT_COLUMNS + [column for column in OPTIONAL_COLUMNS if column in df]:
+        values = df[column]
+        if column in CATEGORICAL_COLUMNS:
+            values = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+        elif column in DATETIME_COLUMNS:
+            # to_datetime walks every value of a column that is already UTC
+            values = values if values.dtype == UTC_DTYPE else pd.to_datetime(values, utc=True)
+        elif column == 'attendees':
+            values = _compact_ints(values.fillna(0))
+        elif column == 'duration':
+            values = values.astype('float32')
+        compact[column] = values
+    return pd.DataFrame(compact, index=df.index)
@@ -0,0 +1,345 @@
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from data_processor import ANALYSIS_TIMEZONE, DailyRollups, combine_rollups, local_day, rollup_events
+from sqlite_store import SQLiteStore
+
+DEFAULT_STORE_PATH = os.environ.get('EVENT_STORE_PATH', os.path.join('.meeting_analyzer', 'events.sqlite3'))
+
+# Applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS events (
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    summary TEXT,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    attendees INTEGER NOT NULL,
+    PRIMARY KEY (user_id, calendar_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS events_by_start ON events (user_id, calendar_id, start_ts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    sync_token TEXT,
+    synced_at TEXT,
+    PRIMARY KEY (user_id, calendar_id)
+);
+""",
+    "ALTER TABLE events ADD COLUMN ical_uid TEXT;",
+    "ALTER TABLE events ADD COLUMN organizer TEXT;",
+    """
+ALTER TABLE events ADD COLUMN category TEXT;
+CREATE TABLE IF NOT EXISTS rollup_state (
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    rules_digest TEXT,
+    PRIMARY KEY (user_id, calendar_id)
+);
+CREATE TABLE IF NOT EXISTS rollup_days (
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    meetings INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    attendee_total INTEGER NOT NULL,
+    PRIMARY KEY (user_id, calendar_id, day, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_hours (
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    meetings INTEGER NOT NULL,
+    PRIMARY KEY (user_id, calendar_id, day, category, hour)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_attendees (
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    attendees INTEGER NOT NULL,
+    meetings INTEGER NOT NULL,
+    PRIMARY KEY (user_id, calendar_id, day, category, attendees)
+) WITHOUT ROWID;
+""",
+    # Stored events have no addresses yet, so every calendar starts over with a full sync
+    """
+ALTER TABLE events ADD COLUMN attendee_emails TEXT;
+UPDATE sync_state SET sync_token = NULL;
+""",
+    # Rollups so far were by UTC day and hour, which is what the default records
+    "ALTER TABLE rollup_state ADD COLUMN time_zone TEXT NOT NULL DEFAULT 'UTC';",
+]
+
+# DailyRollups field -> (table, key columns, summed columns)
+ROLLUP_TABLES = {
+    'days': ('rollup_days', ['day', 'category'], ['meetings', 'duration', 'attendee_total']),
+    'hours': ('rollup_hours', ['day', 'category', 'hour'], ['meetings']),
+    'attendees': ('rollup_attendees', ['day', 'category', 'attendees'], ['meetings']),
+}
+
+EVENT_FIELDS = ['ical_uid', 'summary', 'organizer', 'start_ts', 'end_ts', 'attendees', 'category', 'attendee_emails']
+
+
+def to_epoch_seconds(times):
+    return times.to_numpy(dtype='datetime64[s]').astype('int64')
+
+
+def event_frame(rows, extra=()):
+    # rows of EVENT_FIELDS (+ extra) as read from the events table
+    columns = list(zip(*rows)) if rows else [()] * (len(EVENT_FIELDS) + len(extra))
+    values = dict(zip(EVENT_FIELDS + list(extra), columns))
+    frame = pd.DataFrame({
+        'ical_uid': pd.Series(values['ical_uid'], dtype=object),
+        'summary': pd.Series(values['summary'], dtype=object),
+        'organizer': pd.Series(values['organizer'], dtype=object),
+        'start': pd.to_datetime(pd.Series(values['start_ts'], dtype='int64'), unit='s', utc=True),
+        'end': pd.to_datetime(pd.Series(values['end_ts'], dtype='int64'), unit='s', utc=True),
+        'attendees': pd.Series(values['attendees'], dtype='int64'),
+        'category': pd.Series(values['category'], dtype=object),
+        'attendee_emails': pd.Series(values['attendee_emails'], dtype=object),
+    })
+    for column in extra:
+        frame[column] = pd.Series(values[column], dtype=object)
+    return frame
+
+
+def event_rollups(events, sign=1, time_zone=None):
+    duration = (events['end'] - events['start']).dt.total_seconds() / 3600
+    return rollup_events(events.assign(duration=duration), np.full(len(events), sign), time_zone)
+
+
+# Local copy of each user's calendars, kept current with provider sync tokens
+class EventStore(SQLiteStore):
+    MIGRATIONS = MIGRATIONS
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        super().__init__(path)
+
+    def get_sync_token(self, user_id, calendar_id):
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT sync_token FROM sync_state WHERE user_id = ? AND calendar_id = ?',
+                (user_id, calendar_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def sync_version(self, user_id):
+        # Every calendar's sync token: a sync that brings changes moves at least one of them
+        with self._transaction() as conn:
+            return tuple(conn.execute(
+                'SELECT calendar_id, sync_token FROM sync_state WHERE user_id = ? ORDER BY calendar_id', (user_id,)
+            ).fetchall())
+
+    def apply_changes(self, user_id, calendar_id, upserts, deleted_ids, sync_token=None, update_rollups=True,
+                      time_zone=None):
+        # upserts: DataFrame with event_id, ical_uid, summary, organizer, start, end, attendees,
+        # attendee_emails and category. Rollups are by day and hour in time_zone, the one
+        # refresh_categories last built them in.
+        # A full sync passes update_rollups=False and calls replace_rollups once at the end.
+        rows = zip(
+            [user_id] * len(upserts),
+            [calendar_id] * len(upserts),
+            upserts['event_id'],
+            upserts['ical_uid'],
+            upserts['summary'],
+            upserts['organizer'],
+            to_epoch_seconds(upserts['start']).tolist(),
+            to_epoch_seconds(upserts['end']).tolist(),
+            upserts['attendees'].tolist(),
+            upserts['category'],
+            upserts['attendee_emails'],
+        )
+        with self._transaction() as conn:
+            # Rollups move by the difference between the stored and the incoming version of each event
+            if update_rollups:
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS changed_events (event_id TEXT PRIMARY KEY)')
+                conn.execute('DELETE FROM changed_events')
+                conn.executemany(
+                    'INSERT OR IGNORE INTO changed_events VALUES (?)',
+                    [(event_id,) for event_id in list(upserts['event_id']) + list(deleted_ids)]
+                )
+                self._add_rollups(conn, user_id, calendar_id, -1, time_zone)
+            conn.executemany(
+                'INSERT OR REPLACE INTO events '
+                '(user_id, calendar_id, event_id, ical_uid, summary, organizer, start_ts, end_ts, attendees, category, '
+                'attendee_emails) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.executemany(
+                'DELETE FROM events WHERE user_id = ? AND calendar_id = ? AND event_id = ?',
+                [(user_id, calendar_id, event_id) for event_id in deleted_ids]
+            )
+            if update_rollups:
+                self._add_rollups(conn, user_id, calendar_id, 1, time_zone)
+            if sync_token is not None:
+                conn.execute(
+                    'INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)',
+                    (user_id, calendar_id, sync_token, datetime.now(timezone.utc).isoformat())
+                )
+
+    def _add_rollups(self, conn, user_id, calendar_id, sign, time_zone):
+        # Rolls up the stored versions of changed_events (sign=-1 takes them back out). Local days
+        # and hours need the time zone database, so the few changed events are aggregated in pandas.
+        rows = conn.execute(
+            f"SELECT {', '.join(EVENT_FIELDS)} FROM events WHERE user_id = ? AND calendar_id = ? "
+            "AND event_id IN (SELECT event_id FROM changed_events)",
+            (user_id, calendar_id)
+        ).fetchall()
+        if not rows:
+            return
+        rollups = event_rollups(event_frame(rows), sign, time_zone)
+        for field, (table, keys, values) in ROLLUP_TABLES.items():
+            frame = getattr(rollups, field)
+            columns = ['user_id', 'calendar_id'] + keys + values
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT DO UPDATE SET {', '.join(f'{v} = {v} + excluded.{v}' for v in values)}",
+                zip([user_id] * len(frame), [calendar_id] * len(frame), *(frame[c].tolist() for c in keys + values))
+            )
+            if sign < 0:
+                conn.execute(f'DELETE FROM {table} WHERE user_id = ? AND calendar_id = ? AND meetings = 0',
+                             (user_id, calendar_id))
+
+    def _clear_rollups(self, conn, user_id, calendar_id):
+        for table, _, _ in ROLLUP_TABLES.values():
+            conn.execute(f'DELETE FROM {table} WHERE user_id = ? AND calendar_id = ?', (user_id, calendar_id))
+
+    def _replace_rollups(self, conn, user_id, calendar_id, events, time_zone):
+        # Whole calendars are aggregated in one pandas pass, several times faster than SQL GROUP BYs
+        self._clear_rollups(conn, user_id, calendar_id)
+        rollups = event_rollups(events, time_zone=time_zone)
+        for field, (table, keys, values) in ROLLUP_TABLES.items():
+            frame = getattr(rollups, field)
+            columns = ['user_id', 'calendar_id'] + keys + values
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                zip([user_id] * len(frame), [calendar_id] * len(frame), *(frame[c].tolist() for c in keys + values))
+            )
+
+    def _all_events(self, conn, user_id, calendar_id):
+        rows = conn.execute(
+            f"SELECT {', '.join(EVENT_FIELDS)}, event_id FROM events WHERE user_id = ? AND calendar_id = ?",
+            (user_id, calendar_id)
+        ).fetchall()
+        return event_frame(rows, extra=['event_id'])
+
+    def replace_rollups(self, user_id, calendar_id, events, time_zone=None):
+        # events: every stored event of the calendar (start, end, attendees, category)
+        with self._transaction() as conn:
+            self._replace_rollups(conn, user_id, calendar_id, events, time_zone)
+
+    def refresh_categories(self, user_id, calendar_id, categorizer, time_zone=None):
+        # Stored categories and rollups follow the categorizer and time zone they were built with;
+        # when either changes, every stored event is categorized again and its rollups rebuilt
+        time_zone = time_zone or ANALYSIS_TIMEZONE
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT rules_digest, time_zone FROM rollup_state WHERE user_id = ? AND calendar_id = ?',
+                (user_id, calendar_id)
+            ).fetchone()
+            if row and tuple(row) == (categorizer.digest, time_zone):
+                return False
+            events = self._all_events(conn, user_id, calendar_id)
+            events['category'] = categorizer.categorize(events)
+            conn.executemany(
+                'UPDATE events SET category = ? WHERE user_id = ? AND calendar_id = ? AND event_id = ?',
+                zip(events['category'], [user_id] * len(events), [calendar_id] * len(events), events['event_id'])
+            )
+            self._replace_rollups(conn, user_id, calendar_id, events, time_zone)
+            conn.execute('INSERT OR REPLACE INTO rollup_state VALUES (?, ?, ?, ?)',
+                         (user_id, calendar_id, categorizer.digest, time_zone))
+        return True
+
+    def reset(self, user_id, calendar_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM events WHERE user_id = ? AND calendar_id = ?', (user_id, calendar_id))
+            conn.execute('DELETE FROM sync_state WHERE user_id = ? AND calendar_id = ?', (user_id, calendar_id))
+            self._clear_rollups(conn, user_id, calendar_id)
+
+    def load_events(self, user_id, calendar_id, start, end):
+        # Same overlap rule as the Calendar API's timeMin/timeMax
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(EVENT_FIELDS)} FROM events "
+                'WHERE user_id = ? AND calendar_id = ? AND start_ts < ? AND end_ts > ? '
+                'ORDER BY start_ts',
+                (user_id, calendar_id, int(end.timestamp()), int(start.timestamp()))
+            ).fetchall()
+        return event_frame(rows)
+
+    def resource_event_ids(self, user_id, calendar_id, resources, separator='#'):
+        # Providers that store a series as one resource (CalDAV) key its instances '<resource>#<instance>';
+        # locally expanded Google series key theirs '<master>_<start>'
+        with self._transaction() as conn:
+            return [row[0] for resource in resources for row in conn.execute(
+                'SELECT event_id FROM events WHERE user_id = ? AND calendar_id = ? '
+                'AND (event_id = ? OR substr(event_id, 1, ?) = ?)',
+                (user_id, calendar_id, resource, len(resource) + 1, resource + separator)
+            )]
+
+    def load_rollups(self, user_id, calendar_ids, start, end, time_zone=None):
+        # Daily rollups for events overlapping [start, end), both midnights in time_zone. Rollups cover
+        # events that start in the range; the few that started earlier but overlap it, and copies of
+        # one invitation on several of the calendars, are corrected from the raw events.
+        start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+        calendars = ', '.join('?' * len(calendar_ids))
+        parts = {}
+        with self._transaction() as conn:
+            for field, (table, keys, values) in ROLLUP_TABLES.items():
+                # Only the per-day totals keep their day; the histograms come back summed over the range
+                keys = keys if field == 'days' else keys[1:]
+                rows = conn.execute(
+                    f"SELECT {', '.join(keys)}, {', '.join(f'SUM({v})' for v in values)} FROM {table} "
+                    f"WHERE user_id = ? AND calendar_id IN ({calendars}) AND day >= ? AND day < ? "
+                    f"GROUP BY {', '.join(keys)}",
+                    (user_id, *calendar_ids, local_day(start, time_zone), local_day(end, time_zone))
+                ).fetchall()
+                parts[field] = pd.DataFrame(rows, columns=keys + values)
+            earlier = conn.execute(
+                f"SELECT {', '.join(EVENT_FIELDS)} FROM events "
+                f"WHERE user_id = ? AND calendar_id IN ({calendars}) AND start_ts < ? AND end_ts > ?",
+                (user_id, *calendar_ids, start_ts, start_ts)
+            ).fetchall()
+            copies = []
+            if len(calendar_ids) > 1:
+                overlap = f"user_id = ? AND calendar_id IN ({calendars}) AND start_ts < ? AND end_ts > ?"
+                params = (user_id, *calendar_ids, end_ts, start_ts)
+                copies = conn.execute(
+                    f"SELECT {', '.join(EVENT_FIELDS)}, calendar_id FROM events WHERE {overlap} "
+                    f"AND (ical_uid, start_ts) IN (SELECT ical_uid, start_ts FROM events WHERE {overlap} "
+                    f"AND ical_uid IS NOT NULL GROUP BY ical_uid, start_ts HAVING COUNT(*) > 1)",
+                    params + params
+                ).fetchall()
+
+        copies = event_frame(copies, extra=['calendar_id'])
+        if len(copies):
+            # Keep the copy on the first calendar, as merge_calendar_frames does
+            order = {calendar_id: i for i, calendar_id in enumerate(calendar_ids)}
+            copies = copies.iloc[np.argsort(copies['calendar_id'].map(order).to_numpy(), kind='stable')]
+            copies = copies[copies.duplicated(['ical_uid', 'start'])]
+        earlier = event_frame(earlier)
+        corrections = [
+            DailyRollups(rollups.days, rollups.hours.drop(columns='day'), rollups.attendees.drop(columns='day'))
+            for rollups in (event_rollups(frame, sign, time_zone) for frame, sign in ((earlier, 1), (copies, -1))
+                            if len(frame))
+        ]
+        return combine_rollups([DailyRollups(**parts)] + corrections)
+
+
+_default_store = None
+
+
+def get_event_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = EventStore()
+    return _default_store
@@ -0,0 +1,851 @@
+import json
+import random
+import re
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit, urlunsplit
+from xml.sax.saxutils import escape
+from zoneinfo import ZoneInfo
+import xml.etree.ElementTree as ET
+
+import httplib2
+from calendar_services import (
+    CALDAV_NS, AppleCalendarService, CalendarService, EventColumns, GoogleCalendarService, OutlookCalendarService,
+    build_event_frame, merge_calendar_frames, to_utc
+)
+from categorizer import compile_rules
+from client_cache import build_calendar_client
+from rate_limiter import RateLimiter
+
+SUMMARIES = [
+    'Project sync', 'Team standup', 'Department all-hands', 'Client call', 'Customer demo',
+    'Interview', 'Training session', 'Workshop', '1:1', 'Lunch', 'Planning', 'Retro',
+]
+DOMAINS = ['example.com', 'client.example', 'partner.example']
+TIME_ZONES = [
+    'UTC', 'America/Los_Angeles', 'America/New_York', 'Europe/London', 'Europe/Berlin',
+    'Asia/Kolkata', 'Asia/Tokyo', 'Australia/Sydney',
+]
+
+# Attendee lists are shared between events, so a million synthetic events don't hold
+# millions of attendee dicts; they are still serialized in full on every page
+_SMALL_ATTENDEES = [[{'email': f'person{j}@example.com'} for j in range(k)] for k in range(13)]
+_LARGE_ATTENDEES = [[{'email': f'member{j}@lists.example'} for j in range(k)] for k in (50, 120, 250, 500)]
+# Synthetic users are spread over this many teams; a team's meetings draw on its own people
+ORG_TEAMS = 1000
+
+
+@lru_cache(maxsize=ORG_TEAMS)
+def team_attendees(team):
+    # Attendee lists of 0 to 12 people for one team: eight colleagues and four people at a client
+    rng = random.Random(team)
+    people = [f'person{team}.{j}@example.com' for j in range(8)] + [f'guest{j}@client{team % 97}.example' for j in range(4)]
+    rng.shuffle(people)
+    return [[{'email': email} for email in people[:k]] for k in range(13)]
+
+
+def _local_times(zone, day, minute, length):
+    start = datetime.combine(day, datetime.min.time(), zone) + timedelta(minutes=minute)
+    return start, start + timedelta(minutes=length)
+
+
+def _timed(start, end, zone_name):
+    return {'dateTime': start.isoformat(), 'timeZone': zone_name}, {'dateTime': end.isoformat(), 'timeZone': zone_name}
+
+
+def generate_events(n, seed=0, start=date(2024, 1, 1), days=365, prefix='evt', recurring_share=0.4,
+                    all_day_share=0.05, missing_summary_share=0.03, large_share=0.02, attendee_lists=_SMALL_ATTENDEES):
+    # Seeded events.list items (singleEvents=True) for `days` days from `start`: instances of
+    # daily and weekly series sharing an iCalUID, one-off meetings in working hours of mixed
+    # time zones (local times, so UTC offsets move with DST), all-day events, events without
+    # a summary and a few with very large attendee lists. Ordered by start time. attendee_lists
+    # holds the lists of 0 to 12 people other meetings draw from.
+    rng = random.Random(seed)
+    zones = [(name, ZoneInfo(name)) for name in TIME_ZONES]
+    items = []
+
+    def meeting(event_id, summary, start_field, end_field, attendees, ical_uid=None):
+        event = {
+            'kind': 'calendar#event',
+            'id': event_id,
+            'status': 'confirmed',
+            'iCalUID': ical_uid or f'{event_id}@google.com',
+            'organizer': {'email': f'organizer{rng.randrange(20)}@{rng.choice(DOMAINS)}'},
+            'start': start_field,
+            'end': end_field,
+        }
+        if summary is not None:
+            event['summary'] = summary
+        if attendees:
+            event['attendees'] = attendees
+        return event
+
+    def summary():
+        return None if rng.random() < missing_summary_share else rng.choice(SUMMARIES)
+
+    def attendees():
+        if rng.random() < large_share:
+            return rng.choice(_LARGE_ATTENDEES)
+        return attendee_lists[rng.randrange(13)]
+
+    # Recurring series until their instances make up recurring_share of the events
+    series = 0
+    recurring_target = int(n * recurring_share)
+    while len(items) < recurring_target:
+        zone_name, zone = rng.choice(zones)
+        daily = rng.random() < 0.3
+        step = 1 if daily else 7
+        first = rng.randrange(min(days, 28))
+        count = min(recurring_target - len(items), rng.randint(4, 60), max(1, (days - first + step - 1) // step))
+        minute, length = rng.randrange(32, 72) * 15, rng.choice((15, 30, 30, 45, 60))
+        base_id, title, people = f'{prefix}s{series}', summary(), attendees()
+        series += 1
+        for k in range(count):
+            day = start + timedelta(days=first + k * step)
+            if daily and day.weekday() >= 5:
+                continue
+            begin, end = _local_times(zone, day, minute, length)
+            original = begin.astimezone(timezone.utc)
+            instance_id = f"{base_id}_{original.strftime('%Y%m%dT%H%M%SZ')}"
+            if rng.random() < 0.03:
+                # A single instance moved by an hour
+                begin, end = begin + timedelta(hours=1), end + timedelta(hours=1)
+            event = meeting(instance_id, title, *_timed(begin, end, zone_name), people, f'{base_id}@google.com')
+            event['recurringEventId'] = base_id
+            event['originalStartTime'] = {'dateTime': original.isoformat(), 'timeZone': zone_name}
+            items.append(event)
+
+    for i in range(n - len(items)):
+        day = start + timedelta(days=rng.randrange(days))
+        if rng.random() < all_day_share:
+            span = rng.choice((1, 1, 1, 2, 3))
+            start_field = {'date': day.isoformat()}
+            end_field = {'date': (day + timedelta(days=span)).isoformat()}
+        else:
+            zone_name, zone = rng.choice(zones)
+            start_field, end_field = _timed(
+                *_local_times(zone, day, rng.randrange(32, 72) * 15, rng.randint(1, 8) * 15), zone_name
+            )
+        items.append(meeting(f'{prefix}{i}', summary(), start_field, end_field, attendees()))
+
+    items.sort(key=event_start)
+    return items
+
+
+RECURRENCE_RULES = [
+    # (rule, all-day); weekday standups are the bulk of a recurrence-heavy calendar
+    ('RRULE:FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR', False),
+    ('RRULE:FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR', False),
+    ('RRULE:FREQ=DAILY', False),
+    ('RRULE:FREQ=WEEKLY', False),
+    ('RRULE:FREQ=WEEKLY;BYDAY=TU', False),
+    ('RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;WKST=SU', False),
+    ('RRULE:FREQ=DAILY;INTERVAL=3', False),
+    ('RRULE:FREQ=MONTHLY;BYDAY=1MO', False),
+    ('RRULE:FREQ=MONTHLY;BYDAY=-1FR', False),
+    ('RRULE:FREQ=MONTHLY;BYDAY=2TU,4TU', False),
+    ('RRULE:FREQ=MONTHLY;BYMONTHDAY=15', False),
+    ('RRULE:FREQ=MONTHLY;BYMONTHDAY=-1', False),
+    ('RRULE:FREQ=MONTHLY;BYMONTHDAY=31', False),
+    ('RRULE:FREQ=YEARLY;BYMONTH=3,9;BYDAY=2WE', False),
+    ('RRULE:FREQ=WEEKLY;BYDAY=FR', True),
+    ('RRULE:FREQ=YEARLY', True),
+    ('RRULE:FREQ=MONTHLY;BYMONTHDAY=1', True),
+]
+
+
+def expand_series(master, horizon):
+    # The instances of one series starting before horizon, as the Calendar API lists them with
+    # singleEvents=True; python-dateutil does the expansion, independently of recurrence.py
+    from dateutil.rrule import rrulestr
+
+    all_day = 'date' in master['start']
+    zone_name = master['start'].get('timeZone', 'UTC')
+    if all_day:
+        first = datetime.fromisoformat(master['start']['date'])
+        length = datetime.fromisoformat(master['end']['date']) - first
+        limit = horizon.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        zone = ZoneInfo(zone_name)
+        first = datetime.fromisoformat(master['start']['dateTime']).astimezone(zone)
+        length = datetime.fromisoformat(master['end']['dateTime']) - first
+        limit = horizon
+    instances = []
+    for begin in rrulestr('\n'.join(master['recurrence']), dtstart=first, forceset=True):
+        if begin >= limit:
+            break
+        instance = {key: value for key, value in master.items() if key != 'recurrence'}
+        if all_day:
+            instance['id'] = f"{master['id']}_{begin.strftime('%Y%m%d')}"
+            instance['start'] = {'date': begin.date().isoformat()}
+            instance['end'] = {'date': (begin + length).date().isoformat()}
+        else:
+            original = begin.astimezone(timezone.utc)
+            instance['id'] = f"{master['id']}_{original.strftime('%Y%m%dT%H%M%SZ')}"
+            instance['start'], instance['end'] = _timed(begin, (original + length).astimezone(zone), zone_name)
+        instance['recurringEventId'] = master['id']
+        instance['originalStartTime'] = instance['start']
+        instances.append(instance)
+    return instances
+
+
+def server_instances(items, horizon):
+    # events.list items (series masters, exceptions and single events) as singleEvents=True sees
+    # them: series expanded, exceptions in place of the instances they replace, by start time
+    masters = [event for event in items if 'recurrence' in event and event.get('status') != 'cancelled']
+    live = [event for event in items if 'recurrence' not in event and event.get('status') != 'cancelled']
+    exceptions = {event['id'] for event in items if 'recurringEventId' in event}
+    for master in masters:
+        live += [instance for instance in expand_series(master, horizon) if instance['id'] not in exceptions]
+    live.sort(key=event_start)
+    return live
+
+
+def generate_series(n, seed=0, start=date(2024, 1, 1), days=365, prefix='rec', recurring_share=0.8,
+                    moved_share=0.03, cancelled_share=0.02, exdate_share=0.2):
+    # Seeded events.list items (singleEvents=False) for a recurrence-heavy calendar: series masters
+    # with the rules in RECURRENCE_RULES (open-ended, COUNT or UNTIL, some with an EXDATE), moved
+    # and cancelled exceptions, and one-off events, so that about n instances start in the `days`
+    # days from `start`. Masters start in working hours of mixed time zones, so series cross DST.
+    rng = random.Random(seed)
+    horizon = datetime.combine(start + timedelta(days=days), datetime.min.time(), timezone.utc)
+    items = []
+    instances = 0
+    series = 0
+    while instances < n * recurring_share:
+        rule, all_day = rng.choice(RECURRENCE_RULES)
+        base_id = f'{prefix}s{series}'
+        series += 1
+        day = start + timedelta(days=rng.randrange(days // 2))
+        if all_day:
+            start_field, end_field = {'date': day.isoformat()}, {'date': (day + timedelta(days=1)).isoformat()}
+        else:
+            zone_name, zone = rng.choice([(name, ZoneInfo(name)) for name in TIME_ZONES])
+            start_field, end_field = _timed(*_local_times(zone, day, rng.randrange(32, 72) * 15,
+                                                          rng.choice((15, 30, 30, 45, 60))), zone_name)
+        ending = rng.random()
+        if ending < 0.3:
+            rule += f';COUNT={rng.randint(2, 40)}'
+        elif ending < 0.55:
+            until = day + timedelta(days=rng.randint(7, days))
+            rule += f";UNTIL={until.strftime('%Y%m%d')}" if all_day else f";UNTIL={until.strftime('%Y%m%d')}T235959Z"
+        master = {
+            'kind': 'calendar#event',
+            'id': base_id,
+            'status': 'confirmed',
+            'iCalUID': f'{base_id}@google.com',
+            'summary': rng.choice(SUMMARIES),
+            'organizer': {'email': f'organizer{rng.randrange(20)}@{rng.choice(DOMAINS)}'},
+            'start': start_field,
+            'end': end_field,
+            'recurrence': [rule],
+        }
+        people = _SMALL_ATTENDEES[rng.randrange(13)]
+        if people:
+            master['attendees'] = people
+        expanded = expand_series(master, horizon)
+        if not expanded:
+            continue
+        # The first instance becomes the series start, so DTSTART always matches the rule
+        master['start'], master['end'] = expanded[0]['start'], expanded[0]['end']
+        expanded = expand_series(master, horizon)
+        if len(expanded) > 2 and rng.random() < exdate_share:
+            skipped = rng.choice(expanded[1:])
+            if all_day:
+                master['recurrence'].append(f"EXDATE;VALUE=DATE:{skipped['start']['date'].replace('-', '')}")
+            else:
+                local = datetime.fromisoformat(skipped['start']['dateTime'])
+                master['recurrence'].append(f"EXDATE;TZID={skipped['start']['timeZone']}:{local.strftime('%Y%m%dT%H%M%S')}")
+            expanded.remove(skipped)
+        items.append(master)
+        instances += len(expanded)
+        for instance in expanded[1:]:
+            roll = rng.random()
+            if roll < cancelled_share:
+                items.append({'kind': 'calendar#event', 'id': instance['id'], 'status': 'cancelled',
+                              'iCalUID': master['iCalUID'], 'recurringEventId': base_id,
+                              'originalStartTime': instance['start']})
+                instances -= 1
+            elif roll < cancelled_share + moved_share and not all_day:
+                moved = dict(instance, summary=f"{instance['summary']} (moved)")
+                begin = datetime.fromisoformat(instance['start']['dateTime']) + timedelta(hours=1)
+                end = datetime.fromisoformat(instance['end']['dateTime']) + timedelta(hours=1)
+                moved['start'], moved['end'] = _timed(begin, end, instance['start']['timeZone'])
+                items.append(moved)
+
+    zones = [(name, ZoneInfo(name)) for name in TIME_ZONES]
+    for i in range(max(0, n - instances)):
+        day = start + timedelta(days=rng.randrange(days))
+        zone_name, zone = rng.choice(zones)
+        start_field, end_field = _timed(*_local_times(zone, day, rng.randrange(32, 72) * 15, rng.randint(1, 8) * 15), zone_name)
+        event = {'kind': 'calendar#event', 'id': f'{prefix}{i}', 'status': 'confirmed', 'iCalUID': f'{prefix}{i}@google.com',
+                 'summary': rng.choice(SUMMARIES), 'organizer': {'email': f'organizer{rng.randrange(20)}@{rng.choice(DOMAINS)}'},
+                 'start': start_field, 'end': end_field}
+        people = _SMALL_ATTENDEES[rng.randrange(13)]
+        if people:
+            event['attendees'] = people
+        items.append(event)
+    return items
+
+
+def recurrence_corpus():
+    # Hand-written series for the cases generate_series doesn't reach: daily times that fall into a
+    # DST gap or overlap, a leap-day yearly, month-end and BYSETPOS rules, RDATE and UTC EXDATE,
+    # INTERVAL with WKST across the southern DST change, and an HOURLY rule no one expands locally
+    def series(i, start, end, rules, zone_name=None):
+        timed = zone_name is not None
+        return {
+            'kind': 'calendar#event', 'id': f'corpus{i}', 'status': 'confirmed', 'iCalUID': f'corpus{i}@google.com',
+            'summary': rng.choice(SUMMARIES), 'organizer': {'email': 'organizer0@example.com'},
+            'start': {'dateTime': start, 'timeZone': zone_name} if timed else {'date': start},
+            'end': {'dateTime': end, 'timeZone': zone_name} if timed else {'date': end},
+            'attendees': _SMALL_ATTENDEES[i % 13], 'recurrence': rules,
+        }
+
+    rng = random.Random(0)
+    return [
+        series(1, '2024-03-09T02:30:00-05:00', '2024-03-09T03:00:00-05:00', ['RRULE:FREQ=DAILY;COUNT=5'], 'America/New_York'),
+        series(2, '2024-11-02T01:30:00-04:00', '2024-11-02T02:00:00-04:00', ['RRULE:FREQ=DAILY;COUNT=4'], 'America/New_York'),
+        series(3, '2024-02-29', '2024-03-01', ['RRULE:FREQ=YEARLY;COUNT=3']),
+        series(4, '2024-01-31T09:00:00+01:00', '2024-01-31T10:00:00+01:00', ['RRULE:FREQ=MONTHLY;COUNT=6'], 'Europe/Berlin'),
+        series(5, '2024-01-05T09:00:00+00:00', '2024-01-05T09:30:00+00:00', ['RRULE:FREQ=YEARLY;BYMONTHDAY=5;COUNT=14'],
+               'Europe/London'),
+        series(6, '2024-01-01T10:00:00+09:00', '2024-01-01T11:00:00+09:00',
+               ['RRULE:FREQ=WEEKLY;BYDAY=MO', 'RDATE:20240103T060000Z', 'EXDATE:20240108T010000Z'], 'Asia/Tokyo'),
+        series(7, '2024-01-31T09:00:00-08:00', '2024-01-31T10:00:00-08:00',
+               ['RRULE:FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1'], 'America/Los_Angeles'),
+        series(8, '2024-03-24T23:30:00+11:00', '2024-03-25T00:30:00+11:00',
+               ['RRULE:FREQ=WEEKLY;INTERVAL=3;BYDAY=SU,WE;WKST=SU;UNTIL=20241201T000000Z'], 'Australia/Sydney'),
+        series(9, '2024-01-01', '2024-01-03', ['RRULE:FREQ=MONTHLY;BYDAY=-2MO;UNTIL=20241231', 'EXDATE;VALUE=DATE:20240318']),
+        series(10, '2024-01-15T08:00:00+05:30', '2024-01-15T08:45:00+05:30',
+               ['RRULE:FREQ=DAILY;INTERVAL=2;BYMONTH=1,2,7;BYMONTHDAY=15,16,17,-1'], 'Asia/Kolkata'),
+        series(11, '2024-03-13T08:00:00-07:00', '2024-03-13T09:00:00-07:00', ['RRULE:FREQ=YEARLY;BYMONTH=3,9;BYDAY=2WE,-1FR'],
+               'America/Los_Angeles'),
+        series(12, '2024-01-01T09:00:00+00:00', '2024-01-01T09:30:00+00:00', ['RRULE:FREQ=HOURLY;INTERVAL=5;COUNT=20'], 'UTC'),
+        {'kind': 'calendar#event', 'id': 'corpus4_20240331T070000Z', 'status': 'cancelled', 'iCalUID': 'corpus4@google.com',
+         'recurringEventId': 'corpus4', 'originalStartTime': {'dateTime': '2024-03-31T09:00:00+02:00', 'timeZone': 'Europe/Berlin'}},
+    ]
+
+
+def event_start(event):
+    return _timestamp(event['start'])
+
+
+def _default_horizon(calendars):
+    # Open-ended series are expanded to a year past the latest start
+    starts = [_timestamp(event['start']) for items in calendars.values() for event in items if 'start' in event]
+    return datetime.fromtimestamp(max(starts, default=0), timezone.utc) + timedelta(days=366)
+
+
+def _timestamp(field):
+    if 'dateTime' in field:
+        return datetime.fromisoformat(field['dateTime']).timestamp()
+    return datetime.fromisoformat(field['date']).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _item_fields(fields):
+    # Top-level names inside items(...) of a `fields` selector
+    match = re.search(r'items\((.*)\)', fields or '')
+    if not match:
+        return None
+    names, depth, current = [], 0, ''
+    for char in match.group(1):
+        depth += (char == '(') - (char == ')')
+        if char == ',' and depth == 0:
+            names.append(current)
+            current = ''
+        else:
+            current += char
+    names.append(current)
+    return {name.split('(')[0].strip() for name in names}
+
+
+def _page(items, page_token, max_results, **extra):
+    offset = int(page_token or 0)
+    page = {'kind': 'calendar#events', 'items': items[offset:offset + max_results]}
+    if offset + max_results < len(items):
+        page['nextPageToken'] = str(offset + max_results)
+    else:
+        page.update(extra)
+    return page
+
+
+class FakeCalendarHttp:
+    # Stands in for httplib2.Http under a real googleapiclient client, so request building,
+    # JSON decoding and parsing all run as they do against Google. Serves calendarList.list,
+    # events.list with paging, timeMin/timeMax, orderBy=startTime, `fields` and sync tokens
+    # (positions in each calendar's change log; see update()), and events.instances. Calendars
+    # may hold series masters (see generate_series): singleEvents=True lists them expanded up to
+    # `horizon` by expand_series, singleEvents=False lists masters and exceptions, with sync tokens
+    # of its own. server_seconds is the time spent producing responses, so benchmarks can leave it out.
+    def __init__(self, calendars, latency=0, horizon=None):
+        self.latency = latency
+        self.expands = any('recurrence' in event for items in calendars.values() for event in items)
+        self.horizon = horizon or (_default_horizon(calendars) if self.expands else None)
+        if self.expands:
+            self.series = {cal: {event['id']: event for event in items} for cal, items in calendars.items()}
+            self.series_log = {cal: list(items) for cal, items in calendars.items()}
+            calendars = {cal: server_instances(items, self.horizon) for cal, items in calendars.items()}
+        self.current = {cal: {event['id']: event for event in items} for cal, items in calendars.items()}
+        self.log = {cal: list(items) for cal, items in calendars.items()}
+        if not self.expands:
+            # Without masters both views are the same
+            self.series, self.series_log = self.current, self.log
+        self.calls = 0
+        self.server_seconds = 0.0
+        self._listings = {}
+
+    def update(self, items, calendar_id='primary'):
+        if not self.expands and any('recurrence' in event for event in items):
+            self.horizon = self.horizon or _default_horizon({None: items, **{cal: events.values() for cal, events in self.current.items()}})
+            self.series = {cal: dict(events) for cal, events in self.current.items()}
+            self.series_log = {cal: list(log) for cal, log in self.log.items()}
+            self.expands = True
+        if not self.expands:
+            for event in items:
+                if event.get('status') == 'cancelled':
+                    self.current[calendar_id].pop(event['id'], None)
+                else:
+                    self.current[calendar_id][event['id']] = event
+            self.log[calendar_id].extend(items)
+            self._listings.pop(calendar_id, None)
+            return
+
+        # Masters and exceptions change the series view; the expanded view logs whatever
+        # instances that adds, changes or removes
+        series = self.series[calendar_id]
+        for event in items:
+            if event.get('status') == 'cancelled' and 'recurringEventId' not in event:
+                series.pop(event['id'], None)
+                # Deleting a series deletes its exceptions with it
+                for exception_id in [key for key, value in series.items() if value.get('recurringEventId') == event['id']]:
+                    del series[exception_id]
+            else:
+                series[event['id']] = event
+        self.series_log[calendar_id].extend(items)
+        before = self.current[calendar_id]
+        after = {event['id']: event for event in server_instances(list(series.values()), self.horizon)}
+        changes = [event for event_id, event in after.items() if before.get(event_id) != event]
+        changes += [{'id': event_id, 'status': 'cancelled'} for event_id in before if event_id not in after]
+        self.current[calendar_id] = after
+        self.log[calendar_id].extend(changes)
+        self._listings.pop(calendar_id, None)
+
+    def _listing(self, calendar_id, time_min=None, time_max=None):
+        # Live events by start time overlapping the window, kept until the calendar is updated
+        listings = self._listings.setdefault(calendar_id, {})
+        if (time_min, time_max) not in listings:
+            if None not in listings:
+                events = sorted(self.current[calendar_id].values(), key=event_start)
+                listings[None] = (events, [(_timestamp(event['start']), _timestamp(event['end'])) for event in events])
+            events, bounds = listings[None]
+            low = datetime.fromisoformat(time_min).timestamp() if time_min else float('-inf')
+            high = datetime.fromisoformat(time_max).timestamp() if time_max else float('inf')
+            listings[time_min, time_max] = [event for event, (begin, end) in zip(events, bounds)
+                                            if begin < high and end > low]
+        return listings[time_min, time_max]
+
+    def _series_listing(self, calendar_id, time_min=None, time_max=None):
+        # singleEvents=False: masters whose instances overlap the window, and exceptions whose
+        # instance did, before or after it was moved or cancelled
+        listings = self._listings.setdefault(calendar_id, {})
+        key = ('series', time_min, time_max)
+        if key not in listings:
+            spans = {}
+            for event in self.current[calendar_id].values():
+                if 'recurringEventId' in event:
+                    begin, end = spans.get(event['recurringEventId'], (float('inf'), float('-inf')))
+                    spans[event['recurringEventId']] = (min(begin, _timestamp(event['start'])),
+                                                        max(end, _timestamp(event['end'])))
+            low = datetime.fromisoformat(time_min).timestamp() if time_min else float('-inf')
+            high = datetime.fromisoformat(time_max).timestamp() if time_max else float('inf')
+            events = []
+            for event in self.series[calendar_id].values():
+                if 'recurrence' in event:
+                    bounds = [spans.get(event['id'], (float('inf'), float('-inf')))]
+                elif 'recurringEventId' in event:
+                    original = _timestamp(event['originalStartTime'])
+                    bounds = [(original, original + 1)]
+                    if 'start' in event:
+                        bounds.append((_timestamp(event['start']), _timestamp(event['end'])))
+                else:
+                    bounds = [(_timestamp(event['start']), _timestamp(event['end']))]
+                if any(begin < high and end > low for begin, end in bounds):
+                    events.append(event)
+            events.sort(key=lambda event: _timestamp(event.get('start') or event['originalStartTime']))
+            listings[key] = events
+        return listings[key]
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        if self.latency:
+            time.sleep(self.latency)
+        started = time.perf_counter()
+        self.calls += 1
+        url = urlsplit(uri)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        page_token, max_results = query.get('pageToken'), int(query.get('maxResults', 250))
+        if url.path.endswith('/users/me/calendarList'):
+            items = [{'id': cal, 'summary': cal, 'selected': True, 'primary': cal == 'primary'} for cal in self.log]
+            page = _page(items, page_token, max_results)
+        else:
+            calendar_id = unquote(url.path.split('/calendars/', 1)[1].split('/events', 1)[0])
+            if calendar_id not in self.log:
+                return self._error(404, 'notFound', f'Calendar {calendar_id} not found')
+            # Series-view sync tokens carry an 's' so they can't be replayed against the expanded log
+            expanded = query.get('singleEvents') == 'true' or url.path.endswith('/instances') or not self.expands
+            log, prefix = (self.log[calendar_id], '') if expanded else (self.series_log[calendar_id], 's')
+            if 'syncToken' in query:
+                position = query['syncToken'][len(prefix):] if query['syncToken'].startswith(prefix) else ''
+                if not position.isdigit() or int(position) > len(log):
+                    return self._error(410, 'fullSyncRequired', 'Sync token is no longer valid')
+                items = log[int(position):]
+            elif url.path.endswith('/instances'):
+                master_id = unquote(url.path.rsplit('/', 2)[1])
+                items = [event for event in self._listing(calendar_id, query.get('timeMin'), query.get('timeMax'))
+                         if event.get('recurringEventId') == master_id]
+            elif 'iCalUID' in query:
+                items = [event for event in self.series[calendar_id].values() if event.get('iCalUID') == query['iCalUID']]
+            elif expanded:
+                items = self._listing(calendar_id, query.get('timeMin'), query.get('timeMax'))
+            else:
+                items = self._series_listing(calendar_id, query.get('timeMin'), query.get('timeMax'))
+            page = _page(items, page_token, max_results, nextSyncToken=f'{prefix}{len(log)}')
+            fields = _item_fields(query.get('fields'))
+            if fields is not None:
+                page['items'] = [{key: value for key, value in event.items() if key in fields}
+                                 for event in page['items']]
+        content = json.dumps(page).encode()
+        self.server_seconds += time.perf_counter() - started
+        return httplib2.Response({'status': '200', 'content-type': 'application/json; charset=UTF-8'}), content
+
+    def _error(self, status, reason, message):
+        error = {'error': {'code': status, 'message': message, 'errors': [{'reason': reason, 'message': message}]}}
+        response = httplib2.Response({'status': str(status), 'content-type': 'application/json; charset=UTF-8'})
+        return response, json.dumps(error).encode()
+
+
+def _unlimited():
+    return RateLimiter(project_rate=float('inf'), user_rate=float('inf'))
+
+
+class SyntheticGoogleCalendarService(GoogleCalendarService):
+    # The Google provider with a real API client that talks to FakeCalendarHttp instead of Google.
+    # http_fake is exposed for updates and call counts.
+    def __init__(self, http_fake, **kwargs):
+        kwargs.setdefault('limiter', _unlimited())
+        super().__init__(credentials=None, **kwargs)
+        self.http_fake = http_fake
+        self.service = build_calendar_client(None, http=http_fake)
+
+    def authenticate(self):
+        pass
+
+
+def synthetic_google_service(events=None, calendars=None, latency=0, horizon=None, **kwargs):
+    return SyntheticGoogleCalendarService(FakeCalendarHttp(calendars or {'primary': events}, latency, horizon), **kwargs)
+
+
+def _graph_time(field):
+    if 'date' in field:
+        return {'dateTime': f"{field['date']}T00:00:00.0000000", 'timeZone': 'UTC'}
+    value = datetime.fromisoformat(field['dateTime']).astimezone(timezone.utc)
+    return {'dateTime': value.strftime('%Y-%m-%dT%H:%M:%S.0000000'), 'timeZone': 'UTC'}
+
+
+def graph_event(item):
+    # An events.list item as Graph returns it under Prefer: outlook.timezone="UTC"
+    return {
+        'id': item['id'],
+        'iCalUId': item['iCalUID'],
+        'subject': item.get('summary', ''),
+        'isAllDay': 'date' in item['start'],
+        'isCancelled': False,
+        'organizer': {'emailAddress': {'address': item['organizer']['email']}},
+        'start': _graph_time(item['start']),
+        'end': _graph_time(item['end']),
+        'attendees': [{'type': 'required', 'emailAddress': {'address': a['email']}} for a in item.get('attendees', ())],
+    }
+
+
+def _json_response(page, status=200):
+    return httplib2.Response({'status': str(status), 'content-type': 'application/json'}), json.dumps(page).encode()
+
+
+class FakeGraphHttp(FakeCalendarHttp):
+    # Microsoft Graph stand-in over the same calendars and change log: /me, /me/calendars,
+    # calendarView ($top/$skip paging) and calendarView/delta, whose delta links replay the
+    # log from a position for the window the delta began with. Unknown positions answer 410.
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        if self.latency:
+            time.sleep(self.latency)
+        started = time.perf_counter()
+        self.calls += 1
+        url = urlsplit(uri)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        max_page = re.search(r'odata\.maxpagesize=(\d+)', (headers or {}).get('Prefer', ''))
+        page_size = int(query.get('$top') or (max_page.group(1) if max_page else 10))
+        if url.path.endswith('/me'):
+            page = {'id': 'fake-user'}
+        elif url.path.endswith('/me/calendars'):
+            page = {'value': [{'id': cal, 'name': cal, 'isDefaultCalendar': cal == 'primary'} for cal in self.log]}
+        else:
+            if '/me/calendarView' in url.path:
+                calendar_id = 'primary'
+            else:
+                calendar_id = unquote(url.path.split('/calendars/', 1)[1].split('/', 1)[0])
+            if calendar_id not in self.log:
+                return self._graph_error(404, 'ErrorItemNotFound', f'Calendar {calendar_id} not found')
+            time_min, time_max = query.get('startDateTime'), query.get('endDateTime')
+            position = query.get('$deltatoken')
+            if position is not None:
+                if not position.isdigit() or int(position) > len(self.log[calendar_id]):
+                    return self._graph_error(410, 'SyncStateNotFound', 'The sync state is no longer valid')
+                items = self._changes(calendar_id, int(position), time_min, time_max)
+            else:
+                items = self._listing(calendar_id, time_min, time_max)
+            offset = int(query.get('$skip') or query.get('$skiptoken') or 0)
+            page = {'value': [event if '@removed' in event else graph_event(event)
+                              for event in items[offset:offset + page_size]]}
+            delta = url.path.endswith('/delta')
+            if offset + page_size < len(items):
+                page['@odata.nextLink'] = self._link(url, query, **{'$skiptoken' if delta else '$skip': offset + page_size})
+            elif delta:
+                window = {key: query[key] for key in ('startDateTime', 'endDateTime') if key in query}
+                page['@odata.deltaLink'] = self._link(url, window, **{'$deltatoken': len(self.log[calendar_id])})
+        response = _json_response(page)
+        self.server_seconds += time.perf_counter() - started
+        return response
+
+    def _link(self, url, query, **changes):
+        query = {key: value for key, value in query.items() if key not in ('$skip', '$skiptoken')}
+        return urlunsplit((url.scheme, url.netloc, url.path, urlencode(dict(query, **changes), safe='$:,/'), ''))
+
+    def _changes(self, calendar_id, position, time_min, time_max):
+        # The latest state of everything changed since position; events that left the window count as removed
+        listings = self._listings.setdefault(calendar_id, {})
+        key = ('delta', position, time_min, time_max)
+        if key not in listings:
+            low = datetime.fromisoformat(time_min).timestamp() if time_min else float('-inf')
+            high = datetime.fromisoformat(time_max).timestamp() if time_max else float('inf')
+            changed = dict.fromkeys(event['id'] for event in self.log[calendar_id][position:])
+            changes = []
+            for event_id in changed:
+                event = self.current[calendar_id].get(event_id)
+                if event is not None and _timestamp(event['start']) < high and _timestamp(event['end']) > low:
+                    changes.append(event)
+                else:
+                    changes.append({'id': event_id, '@removed': {'reason': 'deleted'}})
+            listings[key] = changes
+        return listings[key]
+
+    def _graph_error(self, status, code, message):
+        return _json_response({'error': {'code': code, 'message': message}}, status)
+
+
+def _ical_time(name, field, utc):
+    if 'date' in field:
+        return f"{name};VALUE=DATE:{field['date'].replace('-', '')}"
+    value = datetime.fromisoformat(field['dateTime'])
+    if utc:
+        return f"{name}:{value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+    return f"{name};TZID={field['timeZone']}:{value.strftime('%Y%m%dT%H%M%S')}"
+
+
+def _fold(line):
+    # Content lines are folded at 75 octets (all ASCII here)
+    return '\r\n '.join([line[:75]] + [line[i:i + 74] for i in range(75, len(line), 74)])
+
+
+def ical_resource(events, window=None):
+    # A CalDAV resource holding one event or the instances of one series. With a window (epoch
+    # seconds), only instances overlapping it are kept, in UTC, as <C:expand> returns them.
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//MeetingAnalyzer//Fake CalDAV//EN']
+    for event in events:
+        if window and not (_timestamp(event['start']) < window[1] and _timestamp(event['end']) > window[0]):
+            continue
+        utc = window is not None
+        lines += ['BEGIN:VEVENT', f"UID:{event['iCalUID']}", 'DTSTAMP:20240101T000000Z']
+        if 'originalStartTime' in event:
+            lines.append(_ical_time('RECURRENCE-ID', event['originalStartTime'], utc))
+        lines += [_ical_time('DTSTART', event['start'], utc), _ical_time('DTEND', event['end'], utc)]
+        if 'summary' in event:
+            summary = event['summary'].replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;')
+            lines.append(f'SUMMARY:{summary}')
+        lines.append(f"ORGANIZER;CN=Organizer:mailto:{event['organizer']['email']}")
+        lines += [f'ATTENDEE;CN="Guest: {a["email"].split("@")[0]}";PARTSTAT=ACCEPTED;ROLE=REQ-PARTICIPANT:'
+                  f'mailto:{a["email"]}' for a in event.get('attendees', ())]
+        lines += ['BEGIN:VALARM', 'ACTION:DISPLAY', 'TRIGGER:-PT10M', 'END:VALARM', 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+
+def _ical_utc(value):
+    return datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+
+
+STATUS_REASONS = {200: 'OK', 403: 'Forbidden', 404: 'Not Found', 507: 'Insufficient Storage'}
+
+
+def _multistatus(responses, sync_token=None):
+    parts = [f'<?xml version="1.0" encoding="utf-8"?><D:multistatus xmlns:D="DAV:" xmlns:C="{CALDAV_NS}">']
+    for href, status, props in responses:
+        parts.append(f'<D:response><D:href>{escape(href)}</D:href>')
+        if status == 200:
+            parts.append(f'<D:propstat><D:prop>{props}</D:prop><D:status>HTTP/1.1 200 OK</D:status></D:propstat>')
+        else:
+            parts.append(f'<D:status>HTTP/1.1 {status} {STATUS_REASONS[status]}</D:status>')
+        parts.append('</D:response>')
+    if sync_token is not None:
+        parts.append(f'<D:sync-token>{escape(sync_token)}</D:sync-token>')
+    parts.append('</D:multistatus>')
+    return httplib2.Response({'status': '207', 'content-type': 'application/xml; charset=utf-8'}), ''.join(parts).encode()
+
+
+class FakeCalDAVHttp(FakeCalendarHttp):
+    # CalDAV stand-in over the same calendars and change log. Each event, or each recurring
+    # series, is one resource under /calendars/fake/<calendar>/. Serves the discovery PROPFINDs,
+    # calendar-query and calendar-multiget (expanded to UTC when <C:expand> is asked for) and
+    # sync-collection, whose tokens are log positions; max_sync truncates sync reports with 507.
+    HOME = '/calendars/fake/'
+    SYNC_PREFIX = 'https://caldav.fake/sync/'
+
+    def __init__(self, calendars, latency=0, max_sync=None):
+        super().__init__(calendars, latency)
+        self.max_sync = max_sync
+
+    def _href(self, calendar_id, resource=''):
+        return f"{self.HOME}{quote(calendar_id, safe='')}/{quote(resource, safe='') + '.ics' if resource else ''}"
+
+    def _resources(self, calendar_id):
+        listings = self._listings.setdefault(calendar_id, {})
+        if 'resources' not in listings:
+            resources = {}
+            for event in sorted(self.current[calendar_id].values(), key=event_start):
+                resources.setdefault(event.get('recurringEventId') or event['id'], []).append(event)
+            listings['resources'] = resources
+        return listings['resources']
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        if self.latency:
+            time.sleep(self.latency)
+        started = time.perf_counter()
+        self.calls += 1
+        path = urlsplit(uri).path
+        root = ET.fromstring(body) if body else None
+        if method == 'PROPFIND':
+            response = self._propfind(path, (headers or {}).get('Depth', '0'))
+        else:
+            calendar_id = unquote(path[len(self.HOME):].strip('/'))
+            if calendar_id not in self.log:
+                response = httplib2.Response({'status': '404'}), b''
+            elif root.tag == '{DAV:}sync-collection':
+                response = self._sync_collection(calendar_id, root.findtext('{DAV:}sync-token') or '')
+            else:
+                response = self._calendar_report(calendar_id, root)
+        self.server_seconds += time.perf_counter() - started
+        return response
+
+    def _propfind(self, path, depth):
+        if path == '/':
+            return _multistatus([(path, 200, '<D:current-user-principal><D:href>/principals/fake/</D:href>'
+                                             '</D:current-user-principal>')])
+        if path.startswith('/principals/'):
+            return _multistatus([(path, 200, f'<C:calendar-home-set><D:href>{self.HOME}</D:href></C:calendar-home-set>')])
+        responses = [(self.HOME, 200, '<D:resourcetype><D:collection/></D:resourcetype>')]
+        if depth != '0':
+            responses += [(self._href(cal), 200, f'<D:resourcetype><D:collection/><C:calendar/></D:resourcetype>'
+                                                 f'<D:displayname>{escape(cal)}</D:displayname>') for cal in self.log]
+        return _multistatus(responses)
+
+    def _etag(self, events):
+        return f'"{zlib.crc32(json.dumps(events, sort_keys=True).encode()):x}"'
+
+    def _sync_collection(self, calendar_id, token):
+        log = self.log[calendar_id]
+        position = token[len(self.SYNC_PREFIX):] if token.startswith(self.SYNC_PREFIX) else ('0' if not token else '')
+        if not position.isdigit() or int(position) > len(log):
+            error = b'<?xml version="1.0" encoding="utf-8"?><D:error xmlns:D="DAV:"><D:valid-sync-token/></D:error>'
+            return httplib2.Response({'status': '403', 'content-type': 'application/xml'}), error
+        position = int(position)
+        end = len(log) if self.max_sync is None else min(len(log), position + self.max_sync)
+        if token:
+            changed = dict.fromkeys(event.get('recurringEventId') or event['id'] for event in log[position:end])
+        else:
+            # An initial sync lists what exists, not the history
+            changed = dict.fromkeys(self._resources(calendar_id))
+        resources = self._resources(calendar_id)
+        responses = [(self._href(calendar_id, resource), 200, f'<D:getetag>{self._etag(resources[resource])}</D:getetag>')
+                     if resource in resources else (self._href(calendar_id, resource), 404, '')
+                     for resource in changed]
+        if token and end < len(log):
+            responses.append((self._href(calendar_id), 507, ''))
+        return _multistatus(responses, f'{self.SYNC_PREFIX}{end if token else len(log)}')
+
+    def _calendar_report(self, calendar_id, root):
+        expand = root.find(f'.//{{{CALDAV_NS}}}expand')
+        window = (_ical_utc(expand.get('start')).timestamp(), _ical_utc(expand.get('end')).timestamp()) if expand is not None else None
+        resources = self._resources(calendar_id)
+        if root.tag == f'{{{CALDAV_NS}}}calendar-multiget':
+            names = [unquote(href.text.rsplit('/', 1)[1])[:-len('.ics')] for href in root.iter('{DAV:}href')]
+        else:
+            time_range = root.find(f'.//{{{CALDAV_NS}}}time-range')
+            events = self._listing(calendar_id, _ical_utc(time_range.get('start')).isoformat(),
+                                   _ical_utc(time_range.get('end')).isoformat())
+            names = list(dict.fromkeys(event.get('recurringEventId') or event['id'] for event in events))
+        responses = []
+        for name in names:
+            if name not in resources:
+                responses.append((self._href(calendar_id, name), 404, ''))
+                continue
+            data = escape(ical_resource(resources[name], window))
+            responses.append((self._href(calendar_id, name), 200,
+                              f'<D:getetag>{self._etag(resources[name])}</D:getetag><C:calendar-data>{data}</C:calendar-data>'))
+        return _multistatus(responses)
+
+
+def synthetic_outlook_service(events=None, calendars=None, latency=0, **kwargs):
+    # OutlookCalendarService against FakeGraphHttp, exposed as http_fake
+    http_fake = FakeGraphHttp(calendars or {'primary': events}, latency)
+    kwargs.setdefault('limiter', _unlimited())
+    service = OutlookCalendarService({'access_token': 'fake'}, base_url='https://graph.fake/v1.0', http=http_fake, **kwargs)
+    service.http_fake = http_fake
+    return service
+
+
+def synthetic_apple_service(events=None, calendars=None, latency=0, max_sync=None, **kwargs):
+    # AppleCalendarService against FakeCalDAVHttp, exposed as http_fake
+    http_fake = FakeCalDAVHttp(calendars or {'primary': events}, latency, max_sync)
+    kwargs.setdefault('limiter', _unlimited())
+    service = AppleCalendarService('fake@icloud.example', 'app-password', base_url='https://caldav.fake',
+                                   http=http_fake, **kwargs)
+    service.http_fake = http_fake
+    return service
+
+
+class FakeCalendarService(CalendarService):
+    # Synthetic calendar for offline batch runs and benchmarks. Each user gets a deterministic
+    # set of generated events for any given date range, parsed the way Google pages are, with
+    # the people of one of ORG_TEAMS teams as attendees.
+    def __init__(self, user_id, events_per_week=150, latency=0, categorizer=None):
+        self.user_id = user_id
+        self.events_per_week = events_per_week
+        self.latency = latency
+        self.categorizer = categorizer or compile_rules()
+
+    def authenticate(self):
+        pass
+
+    def fetch_events(self, start_date, end_date):
+        start, end = to_utc(start_date, tz=self.time_zone), to_utc(end_date, True, self.time_zone)
+        if self.latency:
+            time.sleep(self.latency)
+        days = max(1, (end - start).days)
+        seed = zlib.crc32(f'{self.user_id}:{start.isoformat()}'.encode())
+        team = zlib.crc32(self.user_id.encode()) % ORG_TEAMS
+        items = generate_events(int(self.events_per_week * days / 7), seed, start.date(), days,
+                                prefix=f'{self.user_id}-', attendee_lists=team_attendees(team))
+        columns = EventColumns()
+        columns.extend(items)
+        return merge_calendar_frames([build_event_frame(columns.to_records(), 'primary', self.categorizer)])
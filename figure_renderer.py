@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import plotly.io as pio
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {'png': 'png', 'jpeg': 'jpeg', 'jpg': 'jpeg', 'svg': 'svg'}
+MIME_SUBTYPES = {'png': 'png', 'jpeg': 'jpeg', 'svg': 'svg+xml'}
+
+
+def figure_key(fig_dict, image_format, width, height, scale):
+    spec = pio.to_json(fig_dict, validate=False, remove_uids=True)
+    return hashlib.sha256(f'{image_format}:{width}:{height}:{scale}:{spec}'.encode()).hexdigest()
+
+
+def _to_image(fig_dict, image_format, width, height, scale):
+    # Runs in a render process, on the Kaleido that process's plotly keeps warm
+    return pio.to_image(fig_dict, format=image_format, width=width, height=height, scale=scale, validate=False)
+
+
+class FigureRenderer:
+    # Renders figures in parallel on a few warm processes, each exporting through its own plotly's
+    # public to_image: plotly has one Kaleido per process and serializes requests to it, so threads
+    # alone would render one figure at a time. Threads key, cache and hand figures to the processes;
+    # the processes start with the first render and are kept until close().
+    def __init__(self, workers=None, cache_size=None):
+        self.workers = workers or int(os.environ.get('RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+        self.cache_size = cache_size if cache_size is not None else int(os.environ.get('RENDER_CACHE_SIZE', 256))
+        self.timings = []
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._processes = None
+
+    def _pool(self):
+        with self._lock:
+            if self._processes is None:
+                # spawn, not fork: the app and the scheduler have threads running
+                self._processes = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                # A multiprocessing child (a batch worker) exits by joining its children, so the render
+                # processes are stopped first, and before the pool's queues close at priority 10
+                multiprocessing.util.Finalize(self, self.close, exitpriority=100)
+            return self._processes
+
+    def _render_one(self, fig_dict, image_format, width, height, scale):
+        return self._pool().submit(_to_image, fig_dict, image_format, width, height, scale).result()
+
+    def close(self):
+        # Stops the render processes; the next render starts new ones
+        with self._lock:
+            processes, self._processes = self._processes, None
+        if processes is not None:
+            processes.shutdown(cancel_futures=True)
+
+    def _cached(self, key):
+        with self._lock:
+            image = self._cache.get(key)
+            if image is not None:
+                self._cache.move_to_end(key)
+            return image
+
+    def _store(self, key, image):
+        with self._lock:
+            self._cache[key] = image
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def render(self, figs, image_format='png', width=None, height=None, scale=1):
+        image_format = IMAGE_FORMATS[image_format.lower()]
+
+        def render(fig):
+            started = time.perf_counter()
+            fig_dict = fig.to_dict() if hasattr(fig, 'to_dict') else fig
+            key = figure_key(fig_dict, image_format, width, height, scale)
+            image = self._cached(key)
+            cached = image is not None
+            if not cached:
+                image = self._render_one(fig_dict, image_format, width, height, scale)
+                self._store(key, image)
+            timing = {
+                'title': fig_dict.get('layout', {}).get('title', {}).get('text'),
+                'format': image_format,
+                'seconds': time.perf_counter() - started,
+                'bytes': len(image),
+                'cached': cached,
+            }
+            return image, timing
+
+        with metrics.stage('render', format=image_format) as stage, \
+                ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(render, figs))
+            stage['images'] = len(results)
+            stage['bytes'] = sum(timing['bytes'] for _, timing in results)
+            stage['cached'] = sum(timing['cached'] for _, timing in results)
+        timings = [timing for _, timing in results]
+        for timing in timings:
+            logger.info(f"Rendered '{timing['title']}' as {timing['format']} in {timing['seconds']:.3f}s "
+                        f"({timing['bytes']} bytes{', cached' if timing['cached'] else ''})")
+        self.timings = timings
+        return [image for image, _ in results]
+
+
+renderer = FigureRenderer()
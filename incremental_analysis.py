@@ -0,0 +1,64 @@
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from calendar_services import merge_calendar_frames, merge_event_batches
+from data_processor import analysis_from_rollups, analyze_calendar_data, combine_rollups, rollup_events, sum_rollups
+
+
+# Calendar statistics for events that arrive in batches (CalendarService.iter_events). Batches are
+# rolled up by day and category when figures are asked for, so an update costs the events since
+# the last one rather than every event again. Once the last batch is in, result() gives the frame
+# and analysis fetch_events and analyze_calendar_data would have.
+class IncrementalAnalysis:
+    def __init__(self, time_zone=None):
+        self.time_zone = time_zone
+        self.batches = []
+        self.events = 0
+        self._pending = []
+        self._rollups = None
+        # Sorted hashes of the (iCalUID, start) rolled up so far: an invitation copied to several
+        # calendars counts once, as merge_calendar_frames keeps it once
+        self._seen = np.zeros(0, dtype=np.uint64)
+
+    def add(self, position, frame):
+        self.batches.append((position, frame))
+        self._pending.append(frame)
+
+    def analysis(self):
+        # The figures so far
+        if self._pending or self._rollups is None:
+            # Before the first batch the figures are those of no events
+            frames, self._pending = self._pending or [merge_calendar_frames([])], []
+            frame = self._new_events(frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True))
+            self.events += len(frame)
+            rollups = rollup_events(frame, tz=self.time_zone)
+            # Hours and attendee counts are only needed over the whole range, so they are kept without day
+            rollups = replace(rollups, hours=rollups.hours.assign(day=0), attendees=rollups.attendees.assign(day=0))
+            self._rollups = rollups if self._rollups is None else sum_rollups(combine_rollups([self._rollups, rollups]))
+        return analysis_from_rollups(self._rollups)
+
+    def _new_events(self, frame):
+        if 'ical_uid' not in frame:
+            return frame
+        keys = pd.util.hash_pandas_object(frame[['ical_uid', 'start']], index=False).to_numpy()
+        shared = np.flatnonzero(frame['ical_uid'].notna().to_numpy())
+        unique, first = np.unique(keys[shared], return_index=True)
+        place = np.searchsorted(self._seen, unique)
+        seen = np.zeros(len(unique), dtype=bool)
+        if len(self._seen):
+            seen = self._seen[np.minimum(place, len(self._seen) - 1)] == unique
+        keep = np.ones(len(frame), dtype=bool)
+        keep[shared] = False
+        keep[shared[first[~seen]]] = True
+        self._seen = np.insert(self._seen, place[~seen], unique[~seen])
+        return frame[keep]
+
+    def frame(self):
+        return merge_event_batches(self.batches)
+
+    def result(self):
+        # (events, analysis) of everything added, identical to the batch path
+        df = self.frame()
+        return df, analyze_calendar_data(df, self.time_zone)
@@ -1,23 +1,34 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from auth import authenticate_calendar_service, handle_google_callback, verify_environment_variables, clear_authentication
-from data_processor import analyze_calendar_data
-from visualizer import create_visualizations
-from email_sender import send_email_report
-from scheduler import schedule_weekly_report
+from auth import (
+    authenticate_calendar_service, handle_google_callback, handle_outlook_callback, verify_environment_variables,
+    clear_authentication, OUTLOOK_STATE_PREFIX
+)
 from utils import get_last_week_date_range
+from metrics import metrics, start_metrics_server
 import os
 import logging
+import time
 from datetime import datetime, timedelta
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Least time between dashboard updates while events are still arriving
+DASHBOARD_REFRESH_SECONDS = float(os.environ.get('DASHBOARD_REFRESH_SECONDS', 0.5))
+
+# pandas, plotly, the Google API client and APScheduler are imported by the pages that use
+# them, so the landing page and the OAuth callback start without them
+
+def is_google_service(calendar_service):
+    # Only reached with a service in hand, so calendar_services is already loaded
+    from calendar_services import GoogleCalendarService
+    return isinstance(calendar_service, GoogleCalendarService)
+
 def main():
     try:
         st.set_page_config(page_title="Calendar Analyzer", layout="wide")
         st.title("Multi-Calendar Analyzer")
+        start_metrics_server()
 
         if not verify_environment_variables():
             st.error("Application configuration error. Please contact the administrator.")
@@ -28,12 +39,15 @@ def main():
 
         if "code" in params:
             logger.info("OAuth code found in query parameters")
-            calendar_service = handle_google_callback(params["code"])
+            if params.get("state", "").startswith(OUTLOOK_STATE_PREFIX):
+                calendar_service = handle_outlook_callback(params["code"], params["state"])
+            else:
+                calendar_service = handle_google_callback(params["code"])
+            # Clear the 'code' parameter from the URL; a failed code can't be retried anyway
+            st.query_params.clear()
             if calendar_service:
                 st.session_state.calendar_service = calendar_service
-                # Clear the 'code' parameter from the URL
-                st.experimental_set_query_params()
-            st.rerun()
+                st.rerun()
 
         calendar_type = st.sidebar.selectbox("Select Calendar Service", ["Google", "Outlook", "Apple"])
         
@@ -42,24 +56,27 @@ def main():
             if calendar_service:
                 st.session_state.calendar_service = calendar_service
             else:
-                if calendar_type == "Google":
-                    st.info("To use this app, you need to authenticate with Google Calendar. Follow the instructions below to start the authentication process.")
+                if calendar_type in ("Google", "Outlook"):
+                    st.info(f"To use this app, you need to authenticate with {calendar_type} Calendar. Follow the instructions below to start the authentication process.")
                     st.warning("IMPORTANT: Do not reuse the authorization URL. If you encounter an error, please use the 'Start Over' button below to restart the authentication process.")
                     if st.button("Start Over"):
                         clear_authentication()
                         st.rerun()
-                else:
-                    st.info(f"{calendar_type} Calendar integration is not yet implemented. Please choose Google Calendar for now.")
                 return
 
-        page = st.sidebar.selectbox("Select a page", ["Dashboard", "Manual Report", "Settings"])
+        if hasattr(st.session_state.calendar_service, 'list_calendars'):
+            select_calendars(st.session_state.calendar_service)
+        select_time_zone(st.session_state.calendar_service)
+
+        page = st.sidebar.selectbox("Select a page", ["Dashboard", "Manual Report", "Settings"], key="page")
 
-        if page == "Dashboard":
-            show_dashboard(st.session_state.calendar_service)
-        elif page == "Manual Report":
-            show_manual_report(st.session_state.calendar_service)
-        elif page == "Settings":
-            show_settings(st.session_state.calendar_service)
+        with metrics.profile(page.lower().replace(' ', '_')), metrics.stage('page', page=page):
+            if page == "Dashboard":
+                show_dashboard(st.session_state.calendar_service)
+            elif page == "Manual Report":
+                show_manual_report(st.session_state.calendar_service)
+            elif page == "Settings":
+                show_settings(st.session_state.calendar_service)
 
         # Add debug information
         st.sidebar.markdown("---")
@@ -67,65 +84,201 @@ def main():
         redirect_uri = 'https://meetmetricsanalyzer.streamlit.app/'
         st.sidebar.text(f"Redirect URI: {redirect_uri}")
         st.sidebar.text(f"Session State Keys: {list(st.session_state.keys())}")
+        from rate_limiter import calendar_limiter
+        limiter = getattr(st.session_state.calendar_service, 'limiter', calendar_limiter)
+        st.sidebar.text(f"API limiter: {limiter.stats()}")
+        if 'analysis_cache' in st.session_state:
+            st.sidebar.text(f"Analysis cache: {st.session_state.analysis_cache.stats()}")
         
     except Exception as e:
         logger.error(f"An error occurred in the main function: {str(e)}")
         logger.error(f"Stack trace: {logging.traceback.format_exc()}")
         logger.error(f"Timestamp: {datetime.now().isoformat()}")
-        logger.error(f"Session state: {st.session_state}")
+        logger.error(f"Session state keys: {list(st.session_state.keys())}")
         st.error("An unexpected error occurred. Please try refreshing the page or contact support if the issue persists.")
 
+def select_calendars(calendar_service):
+    if 'available_calendars' not in st.session_state:
+        calendar_service.authenticate()
+        st.session_state.available_calendars = calendar_service.list_calendars()
+    calendars = st.session_state.available_calendars
+    names = {c['id']: c.get('summary', c['id']) for c in calendars}
+    default = [c['id'] for c in calendars if c.get('selected') or c.get('primary')]
+    selected = st.sidebar.multiselect("Calendars", list(names), default=default, format_func=names.get)
+    calendar_service.calendar_ids = selected or ['primary']
+
+def select_time_zone(calendar_service):
+    # Days, hours of the day and working hours are counted in this zone
+    from zoneinfo import available_timezones
+
+    zones = sorted(available_timezones())
+    current = st.session_state.get('time_zone', calendar_service.time_zone)
+    index = zones.index(current) if current in zones else zones.index('UTC')
+    st.session_state.time_zone = calendar_service.time_zone = st.sidebar.selectbox("Time zone", zones, index=index)
+
+def session_analysis_cache():
+    # One per browser session; clear_authentication empties it
+    from analysis_cache import AnalysisCache
+
+    if 'analysis_cache' not in st.session_state:
+        st.session_state.analysis_cache = AnalysisCache()
+    return st.session_state.analysis_cache
+
 def show_dashboard(calendar_service):
+    from analysis_cache import dashboard_key
+
     st.header("Dashboard")
     st.write(f"Welcome to your {type(calendar_service).__name__} Analyzer dashboard!")
     
-    start_date, end_date = get_last_week_date_range()
+    start_date, end_date = get_last_week_date_range(calendar_service.time_zone)
+    cache = session_analysis_cache()
+    if st.button("Refresh data"):
+        cache.invalidate(dashboard_key(calendar_service, start_date, end_date))
     
+    # Filled in as pages arrive and again with the final figures
+    st.subheader("Last Week's Calendar Statistics")
+    progress = st.empty()
+    placeholders = [st.empty() for _ in range(4)]
+    # Reruns for the same user, calendars, week and synced data reuse the last result
+    dashboard = cache.get(dashboard_key(calendar_service, start_date, end_date))
+    if dashboard is None:
+        dashboard = fetch_dashboard(calendar_service, start_date, end_date, progress, placeholders)
+        # Keyed again: authenticate() may have found the user id, and the fetch synced
+        cache.put(dashboard_key(calendar_service, start_date, end_date), dashboard)
+
+    if dashboard.analysis.total_meetings == 0:
+        for placeholder in placeholders:
+            placeholder.empty()
+        st.warning("No events found for the selected date range.")
+        return
+
+    show_statistics(dashboard.analysis, placeholders, 'final', dashboard.figures)
+    show_time_use(dashboard.df, dashboard.intervals, figure=dashboard.figures['time_use'])
+    show_collaborators(dashboard.attendees)
+
+def fetch_dashboard(calendar_service, start_date, end_date, progress, placeholders):
+    from analysis_cache import CachedDashboard
+    from attendee_index import build_attendee_index
+    from data_processor import analyze_intervals
+    from incremental_analysis import IncrementalAnalysis
+    from visualizer import time_use_chart
+
+    incremental = IncrementalAnalysis(calendar_service.time_zone)
+    shown, updates = None, 0
     with st.spinner("Fetching and analyzing your calendar data..."):
         calendar_service.authenticate()
-        df = calendar_service.fetch_events(start_date, end_date)
-        
-        if df.empty:
-            st.warning("No events found for the selected date range.")
-            return
-        
-        analysis = analyze_calendar_data(df)
-        
-        st.subheader("Last Week's Calendar Statistics")
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total Meetings", analysis['total_meetings'])
-        col2.metric("Total Duration (hours)", f"{analysis['total_duration']:.2f}")
-        col3.metric("Avg. Duration (hours)", f"{analysis['avg_duration']:.2f}")
-        col4.metric("Avg. Attendees", f"{analysis['avg_attendees']:.1f}")
-        
-        st.subheader("Meetings by Day")
-        fig_meetings_by_day = px.bar(
-            analysis['meetings_by_day'].reset_index(),
+        for position, batch in calendar_service.iter_events(start_date, end_date):
+            incremental.add(position, batch)
+            if shown is None or time.monotonic() - shown >= DASHBOARD_REFRESH_SECONDS:
+                updates += 1
+                show_statistics(incremental.analysis(), placeholders, updates)
+                progress.caption(f"{incremental.events} events so far...")
+                shown = time.monotonic()
+        # Overlap and free time need the events themselves, not just the daily rollups
+        if getattr(calendar_service, 'store', None) is not None:
+            df = incremental.frame()
+            analysis = calendar_service.fetch_analysis(start_date, end_date, sync=False)
+        else:
+            df, analysis = incremental.result()
+        intervals = analyze_intervals(df, start_date, end_date, calendar_service.time_zone)
+        figures = {}
+        if analysis.total_meetings:
+            figures = dict(statistics_figures(analysis), time_use=time_use_chart(intervals))
+    progress.empty()
+    return CachedDashboard(df, analysis, intervals, build_attendee_index(df), figures)
+
+def statistics_figures(analysis):
+    import plotly.express as px
+
+    return {
+        'meetings_by_day': px.bar(
+            analysis.meetings_by_day.reset_index(),
             x='day',
-            y='meetings_by_day',
-            labels={'day': 'Date', 'meetings_by_day': 'Number of Meetings'},
+            y='meetings',
+            labels={'day': 'Date', 'meetings': 'Number of Meetings'},
             title='Meetings per Day'
-        )
-        st.plotly_chart(fig_meetings_by_day)
-        
-        st.subheader("Meetings by Category")
-        fig_meetings_by_category = px.pie(
-            analysis['meetings_by_category'].reset_index(),
-            values='category',
-            names='index',
+        ),
+        'meetings_by_category': px.pie(
+            analysis.meetings_by_category.reset_index(),
+            values='meetings',
+            names='category',
             title='Distribution of Meetings by Category'
-        )
-        st.plotly_chart(fig_meetings_by_category)
-        
-        st.subheader("Duration by Category")
-        fig_duration_by_category = px.bar(
-            analysis['duration_by_category'].reset_index(),
-            x='index',
+        ),
+        'duration_by_category': px.bar(
+            analysis.duration_by_category.reset_index(),
+            x='category',
             y='duration',
-            labels={'index': 'Category', 'duration': 'Total Duration (hours)'},
+            labels={'category': 'Category', 'duration': 'Total Duration (hours)'},
             title='Total Duration of Meetings by Category'
-        )
-        st.plotly_chart(fig_duration_by_category)
+        ),
+    }
+
+def show_statistics(analysis, placeholders, update, figures=None):
+    # Rendered into placeholders so each update replaces the last; charts are keyed by update
+    # because Streamlit won't show two identical charts in one run
+    figures = figures or statistics_figures(analysis)
+    metrics_row, by_day, by_category, duration = placeholders
+    col1, col2, col3, col4 = metrics_row.container().columns(4)
+    col1.metric("Total Meetings", analysis.total_meetings)
+    col2.metric("Total Duration (hours)", f"{analysis.total_duration:.2f}")
+    col3.metric("Avg. Duration (hours)", f"{analysis.avg_duration:.2f}")
+    col4.metric("Avg. Attendees", f"{analysis.avg_attendees:.1f}")
+
+    with by_day.container():
+        st.subheader("Meetings by Day")
+        st.plotly_chart(figures['meetings_by_day'], key=f'meetings_by_day_{update}')
+
+    with by_category.container():
+        st.subheader("Meetings by Category")
+        st.plotly_chart(figures['meetings_by_category'], key=f'meetings_by_category_{update}')
+
+    with duration.container():
+        st.subheader("Duration by Category")
+        st.plotly_chart(figures['duration_by_category'], key=f'duration_by_category_{update}')
+
+def show_time_use(df, intervals, chart=True, figure=None):
+    from visualizer import time_use_chart
+
+    st.subheader("Time Use")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Busy (hours)", f"{intervals.busy_hours:.2f}")
+    col2.metric("Double-Booked (hours)", f"{intervals.double_booked_hours:.2f}")
+    col3.metric("Overlapping Meetings", intervals.overlapping_meetings)
+    col4.metric("Focus Time (hours)", f"{intervals.by_day['focus'].sum():.2f}")
+    if chart:
+        st.plotly_chart(figure or time_use_chart(intervals))
+
+    st.dataframe(intervals.by_day.rename(columns={
+        'busy': 'Busy (h)', 'double_booked': 'Double-booked (h)', 'free': 'Free (h)',
+        'longest_free': 'Longest free block (h)', 'focus': 'Focus (h)', 'fragmentation': 'Fragmentation'
+    }))
+    if intervals.overlapping_meetings:
+        st.caption(f"{intervals.overlapping_meetings} meetings overlap another one "
+                   f"({intervals.overlapping_pairs} overlapping pairs)")
+        st.dataframe(df.loc[intervals.overlapping, ['summary', 'start', 'end', 'calendar_id']].head(100))
+
+def show_collaborators(index):
+    from attendee_index import internal_external, pair_hours, top_collaborators
+
+    if not len(index.people):
+        return
+    st.subheader("Who You Meet With")
+    # The user's own address is on most of their meetings
+    me = st.session_state.get('user_email') or ()
+    audience = internal_external(index)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Internal (hours)", f"{audience.loc['internal', 'hours']:.2f}")
+    col2.metric("With External Attendees (hours)", f"{audience.loc['external', 'hours']:.2f}")
+    col3.metric("People Met", len(index.people))
+    st.dataframe(top_collaborators(index, exclude=me).rename(columns={
+        'meetings': 'Meetings', 'hours': 'Hours', 'domain': 'Domain'
+    }))
+    pairs = pair_hours(index, exclude=me)
+    if len(pairs):
+        st.caption("Hours per pair of people in the same meetings")
+        st.dataframe(pairs.rename(columns={
+            'first': 'Attendee', 'second': 'With', 'meetings': 'Meetings', 'hours': 'Hours'
+        }), hide_index=True)
 
 def show_manual_report(calendar_service):
     st.header("Generate Manual Report")
@@ -148,10 +301,22 @@ def show_manual_report(calendar_service):
                     st.warning("No events found for the selected date range.")
                     return
                 
-                figs = create_visualizations(df)
+                from data_processor import analyze_calendar_data, analyze_intervals
+                from email_sender import send_email_report
+                from visualizer import create_visualizations
+
+                if getattr(calendar_service, 'store', None) is not None:
+                    # Aggregates come from the daily rollups; the per-event charts still need df
+                    analysis = calendar_service.fetch_analysis(start_date, end_date, sync=False)
+                else:
+                    analysis = analyze_calendar_data(df, calendar_service.time_zone)
+                intervals = analyze_intervals(df, start_date, end_date, calendar_service.time_zone)
+                figs = create_visualizations(df, analysis, intervals=intervals)
                 
                 for fig in figs:
                     st.plotly_chart(fig)
+                # The time-use chart is already among the report figures
+                show_time_use(df, intervals, chart=False)
                 
                 if 'user_email' in st.session_state and send_email_report(st.session_state.user_email, figs):
                     st.success("Report sent successfully!")
@@ -173,12 +338,26 @@ def show_settings(calendar_service):
     schedule_time = st.time_input("Select time for weekly report")
     
     if st.button("Save Schedule"):
-        if 'user_email' in st.session_state:
-            schedule_weekly_report(calendar_service, st.session_state.user_email, schedule_day, schedule_time)
-            st.success("Weekly report scheduled successfully!")
+        if not is_google_service(calendar_service):
+            # Scheduled runs restore stored Google credentials; other providers aren't persisted yet
+            st.error("Scheduled reports are currently available for Google Calendar only.")
+        elif 'user_email' in st.session_state:
+            from scheduler import schedule_weekly_report
+            try:
+                schedule_weekly_report(calendar_service, st.session_state.user_email, schedule_day, schedule_time)
+            except (RuntimeError, ValueError) as e:
+                # No encryption key configured, or credentials without a refresh token
+                st.error(f"Could not schedule the report: {e}")
+            else:
+                st.success("Weekly report scheduled successfully!")
         else:
             st.error("Please save your email address before scheduling reports.")
 
+    if is_google_service(calendar_service) and st.button("Cancel Schedule"):
+        from scheduler import cancel_weekly_report
+        cancel_weekly_report(calendar_service.user_id)
+        st.success("Weekly report cancelled.")
+
     st.subheader("Authentication")
     if st.button("Clear Authentication Data"):
         clear_authentication()
@@ -187,3 +366,6 @@ def show_settings(calendar_service):
 
 if __name__ == "__main__":
     main()
+    # Started explicitly once the page has rendered; only the first run in a process does any work
+    from scheduler import start_scheduler
+    start_scheduler()
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'meeting_analyzer'
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _env_flag(name):
+    return os.environ.get(name, '0') not in ('', '0', 'false', 'no')
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    # Timings and counts for each pipeline stage. `with metrics.stage('parse') as stage:` times the
+    # block, and numbers stored in `stage` (events, bytes, ...) are added to per-stage counters.
+    # Disabled, stage() returns a fresh nullcontext({}), so instrumented code costs one call and
+    # what it stores goes nowhere.
+    def __init__(self, enabled=None, log_json=None, profile_seconds=None, profile_dir=None):
+        self.log_json = log_json if log_json is not None else _env_flag('METRICS_LOG_JSON')
+        if enabled is None:
+            enabled = _env_flag('METRICS_ENABLED') or self.log_json or bool(os.environ.get('METRICS_PORT'))
+        self.enabled = enabled
+        if profile_seconds is None and os.environ.get('PROFILE_SLOW_SECONDS'):
+            profile_seconds = float(os.environ['PROFILE_SLOW_SECONDS'])
+        self.profile_seconds = profile_seconds
+        self.profile_dir = profile_dir or os.environ.get('PROFILE_DIR', os.path.join('.meeting_analyzer', 'profiles'))
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._profiling = threading.local()
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name, _labels(labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(STAGE_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def stage(self, name, **labels):
+        if not self.enabled:
+            # A fresh dict each time, as callers may use it as scratch; it's thrown away
+            return nullcontext({})
+        return self._timed(name, labels)
+
+    @contextmanager
+    def _timed(self, name, labels):
+        recorded = {}
+        status = 'ok'
+        started = time.perf_counter()
+        try:
+            yield recorded
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe('stage_seconds', seconds, stage=name, **labels)
+            if status == 'error':
+                self.count('stage_errors_total', stage=name, **labels)
+            for key, value in recorded.items():
+                self.count(f'stage_{key}_total', value, stage=name, **labels)
+            if self.log_json:
+                logger.info(json.dumps({'stage': name, **labels, 'seconds': round(seconds, 6), 'status': status,
+                                        **recorded}, default=str))
+
+    def profile(self, name):
+        # Opt-in (PROFILE_SLOW_SECONDS): profiles the block and keeps the profile only when it ran slow
+        if self.profile_seconds is None or getattr(self._profiling, 'active', False):
+            return nullcontext({})
+        return self._profiled(name)
+
+    @contextmanager
+    def _profiled(self, name):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        self._profiling.active = True
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield {}
+        finally:
+            profiler.disable()
+            self._profiling.active = False
+            seconds = time.perf_counter() - started
+            if seconds >= self.profile_seconds:
+                path = os.path.join(self.profile_dir, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.prof')
+                try:
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    profiler.dump_stats(path)
+                    logger.info(f"{name} took {seconds:.2f}s, profile written to {path}")
+                except OSError as e:
+                    logger.warning(f"Could not write profile for {name}: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in self._counters.items()]
+            histograms = [{'name': name, 'labels': dict(labels), 'count': histogram[-1], 'sum': histogram[-2],
+                           'buckets': dict(zip(STAGE_BUCKETS, histogram[:-2]))}
+                          for (name, labels), histogram in self._histograms.items()]
+        return {'counters': counters, 'histograms': histograms}
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            metric = f'{METRIC_PREFIX}_{name}'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{_format_labels(labels)} {value:g}')
+        for (name, labels), histogram in histograms:
+            metric = f'{METRIC_PREFIX}_{name}'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} histogram')
+            for bound, count in zip(STAGE_BUCKETS, histogram):
+                lines.append(f'{metric}_bucket{_format_labels(labels, [("le", f"{bound:g}")])} {count}')
+            lines.append(f'{metric}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram[-1]}')
+            lines.append(f'{metric}_sum{_format_labels(labels)} {histogram[-2]:g}')
+            lines.append(f'{metric}_count{_format_labels(labels)} {histogram[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = Metrics()
+
+
+def _metrics_handler():
+    # http.server is imported with the server, so apps that never serve metrics don't load it
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = metrics.render_prometheus().encode(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(metrics.snapshot()).encode(), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host=None):
+    # Serves /metrics (Prometheus text) and /metrics.json when METRICS_PORT is set; safe to call on every rerun
+    global _server
+    port = port if port is not None else os.environ.get('METRICS_PORT')
+    if port is None or not metrics.enabled:
+        return None
+    with _server_lock:
+        if _server is None:
+            from http.server import ThreadingHTTPServer
+
+            _server = ThreadingHTTPServer((host or os.environ.get('METRICS_HOST', '127.0.0.1'), int(port)),
+                                          _metrics_handler())
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+            logger.info(f"Serving metrics on {_server.server_address[0]}:{_server.server_address[1]}")
+        return _server
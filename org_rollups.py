@@ -0,0 +1,270 @@
+import argparse
+import base64
+import json
+import logging
+import math
+import os
+import sys
+import time
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from aggregate_store import get_aggregate_store
+from metrics import metrics
+from schedule_store import get_schedule_store
+from scheduler import scheduled_report_service
+from sketches import HyperLogLog, TDigest
+from utils import get_last_week_date_range
+
+logger = logging.getLogger(__name__)
+
+# Team- and org-level meeting load as a map-reduce over users. The map step turns each user's
+# events into a MeetingAggregate, stored per user and period; every figure in one merges across
+# users: counts and sums exactly, duration quantiles through a t-digest and distinct attendees
+# through a HyperLogLog. Team and org queries merge stored aggregates and never read events.
+
+# Users handed to a worker at a time; the worker merges its chunk before returning it
+CHUNK_SIZE = int(os.environ.get('ORG_ROLLUP_CHUNK_SIZE', 50))
+
+
+@dataclass(frozen=True)
+class MeetingAggregate:
+    users: int
+    meetings: int
+    duration: float               # hours
+    attendee_total: int
+    meetings_by_category: dict    # category -> meetings
+    duration_by_category: dict    # category -> hours
+    meetings_by_hour: np.ndarray  # timed meetings by UTC start hour
+    durations: TDigest            # meeting durations in hours
+    attendees: HyperLogLog        # distinct attendee addresses
+
+
+def empty_aggregate(users=0):
+    return MeetingAggregate(
+        users=users, meetings=0, duration=0.0, attendee_total=0,
+        meetings_by_category={}, duration_by_category={},
+        meetings_by_hour=np.zeros(24, dtype=np.int64), durations=TDigest(), attendees=HyperLogLog(),
+    )
+
+
+def aggregate_events(df):
+    # One user's event frame as a MeetingAggregate
+    if df.empty:
+        return empty_aggregate(users=1)
+    duration = df['duration'].to_numpy(dtype='float64')
+    start = df['start'].to_numpy(dtype='datetime64[m]')
+    minutes = (start - start.astype('datetime64[D]')).astype('int64')
+    # All-day events all start at midnight and would swamp the hour histogram
+    all_day = (minutes == 0) & ((df['end'].to_numpy(dtype='datetime64[m]') - start).astype('int64') % 1440 == 0)
+    categories = pd.Series(duration).groupby(df['category'].astype(object).to_numpy(), sort=True).agg(['size', 'sum'])
+    attendees = HyperLogLog()
+    if 'attendee_emails' in df:
+        # Each distinct attendee list is split once; addresses are compared case-insensitively
+        lists = df['attendee_emails'].dropna().astype(object).unique()
+        if len(lists):
+            attendees.add(np.unique('\n'.join(lists).lower().split('\n')))
+    return MeetingAggregate(
+        users=1,
+        meetings=len(df),
+        duration=float(duration.sum()),
+        attendee_total=int(df['attendees'].sum()),
+        meetings_by_category={category: int(count) for category, count in categories['size'].items()},
+        duration_by_category={category: float(hours) for category, hours in categories['sum'].items()},
+        meetings_by_hour=np.bincount(minutes[~all_day] // 60, minlength=24).astype(np.int64),
+        durations=TDigest.from_values(duration),
+        attendees=attendees,
+    )
+
+
+def combine_aggregates(parts):
+    # Merges any number of aggregates in one pass rather than pair by pair
+    parts = list(parts)
+    if not parts:
+        return empty_aggregate()
+    meetings, durations = Counter(), defaultdict(list)
+    for part in parts:
+        meetings.update(part.meetings_by_category)
+        for category, hours in part.duration_by_category.items():
+            durations[category].append(hours)
+    return MeetingAggregate(
+        users=sum(part.users for part in parts),
+        meetings=sum(part.meetings for part in parts),
+        duration=math.fsum(part.duration for part in parts),
+        attendee_total=sum(part.attendee_total for part in parts),
+        meetings_by_category=dict(sorted(meetings.items())),
+        duration_by_category={category: math.fsum(durations[category]) for category in sorted(durations)},
+        meetings_by_hour=np.sum([part.meetings_by_hour for part in parts], axis=0),
+        durations=TDigest.combine(part.durations for part in parts),
+        attendees=HyperLogLog.combine(part.attendees for part in parts),
+    )
+
+
+def encode_aggregate(aggregate):
+    # JSON text for the aggregate store; the HyperLogLog registers are mostly zeros for one user,
+    # so they are compressed
+    return json.dumps({
+        'users': aggregate.users,
+        'meetings': aggregate.meetings,
+        'duration': aggregate.duration,
+        'attendee_total': aggregate.attendee_total,
+        'categories': {
+            category: [meetings, aggregate.duration_by_category[category]]
+            for category, meetings in aggregate.meetings_by_category.items()
+        },
+        'hours': aggregate.meetings_by_hour.tolist(),
+        'durations': aggregate.durations.to_dict(),
+        'attendees': base64.b64encode(zlib.compress(aggregate.attendees.to_bytes())).decode('ascii'),
+    }, separators=(',', ':'))
+
+
+def decode_aggregate(text):
+    data = json.loads(text)
+    return MeetingAggregate(
+        users=data['users'],
+        meetings=data['meetings'],
+        duration=data['duration'],
+        attendee_total=data['attendee_total'],
+        meetings_by_category={category: value[0] for category, value in data['categories'].items()},
+        duration_by_category={category: value[1] for category, value in data['categories'].items()},
+        meetings_by_hour=np.array(data['hours'], dtype=np.int64),
+        durations=TDigest.from_dict(data['durations']),
+        attendees=HyperLogLog.from_bytes(zlib.decompress(base64.b64decode(data['attendees']))),
+    )
+
+
+def summarize_aggregate(aggregate):
+    # The figures managers look at, per user where that makes sense
+    users = max(aggregate.users, 1)
+    return {
+        'users': aggregate.users,
+        'meetings': aggregate.meetings,
+        'hours': aggregate.duration,
+        'meetings_per_user': aggregate.meetings / users,
+        'hours_per_user': aggregate.duration / users,
+        'avg_attendees': aggregate.attendee_total / aggregate.meetings if aggregate.meetings else float('nan'),
+        'p50_duration': aggregate.durations.quantile(0.5),
+        'p90_duration': aggregate.durations.quantile(0.9),
+        'p99_duration': aggregate.durations.quantile(0.99),
+        'unique_attendees': aggregate.attendees.count(),
+        'busiest_hour': int(np.argmax(aggregate.meetings_by_hour)) if aggregate.meetings else None,
+        'hours_by_category': dict(sorted(aggregate.duration_by_category.items(), key=lambda item: -item[1])),
+    }
+
+
+def user_aggregate(user_id, start_date, end_date, fake_events=None):
+    if fake_events is not None:
+        # Synthetic calendars are for load tests; real runs never import them
+        from fake_provider import FakeCalendarService
+        calendar_service = FakeCalendarService(user_id, fake_events)
+    else:
+        calendar_service, _ = scheduled_report_service(user_id)
+        if calendar_service is None:
+            raise LookupError(f"No stored schedule or credentials for {user_id}")
+    calendar_service.authenticate()
+    return aggregate_events(calendar_service.fetch_events(start_date, end_date))
+
+
+def map_users(user_ids, start_date, end_date, fake_events=None):
+    # Runs in a pool worker: each user's encoded aggregate, failures, and the chunk merged
+    encoded, failed, parts = [], [], []
+    for user_id in user_ids:
+        try:
+            aggregate = user_aggregate(user_id, start_date, end_date, fake_events)
+        except Exception as e:
+            failed.append((user_id, f"{type(e).__name__}: {e}"))
+            continue
+        parts.append(aggregate)
+        encoded.append((user_id, encode_aggregate(aggregate)))
+    return encoded, failed, encode_aggregate(combine_aggregates(parts))
+
+
+def run_org_rollup(user_ids, start_date, end_date, workers=None, fake_events=None, store=None, chunk_size=CHUNK_SIZE):
+    # Map: per-user aggregates in a process pool, stored as they arrive; users already stored for
+    # the period are skipped. Reduce: the chunk aggregates plus the skipped users' stored ones.
+    store = store or get_aggregate_store()
+    user_ids = list(dict.fromkeys(user_ids))
+    done = store.stored_users(start_date, end_date) & set(user_ids)
+    pending = [user_id for user_id in user_ids if user_id not in done]
+    if done:
+        logger.info(f"{len(done)} of {len(user_ids)} users already aggregated for this period")
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    parts, failed = [], []
+    with metrics.stage('org_map') as stage, ProcessPoolExecutor(max_workers=workers) as pool:
+        stage['users'] = len(pending)
+        futures = [pool.submit(map_users, chunk, start_date, end_date, fake_events) for chunk in chunks]
+        for future in futures:
+            encoded, chunk_failed, merged = future.result()
+            store.save_aggregates(start_date, end_date, encoded)
+            failed += chunk_failed
+            parts.append(decode_aggregate(merged))
+    for user_id, error in failed:
+        logger.warning(f"No aggregate for {user_id}: {error}")
+    with metrics.stage('org_reduce') as stage:
+        stored = store.load_aggregates(start_date, end_date, done) if done else {}
+        stage['parts'] = len(parts) + len(stored)
+        return combine_aggregates(parts + [decode_aggregate(text) for text in stored.values()]), failed
+
+
+def query_aggregate(start_date, end_date, user_ids=None, store=None):
+    # A team's (or, without user_ids, the whole org's) aggregate, from stored per-user aggregates
+    store = store or get_aggregate_store()
+    with metrics.stage('org_query') as stage:
+        stored = store.load_aggregates(start_date, end_date, user_ids)
+        stage['users'] = len(stored)
+        return combine_aggregates(decode_aggregate(text) for text in stored.values())
+
+
+def print_summary(summary):
+    print(f"{summary['users']} users: {summary['meetings']} meetings, {summary['hours']:.0f} hours "
+          f"({summary['meetings_per_user']:.1f} meetings, {summary['hours_per_user']:.1f} hours per user)")
+    print(f"duration p50 {summary['p50_duration']:.2f} h, p90 {summary['p90_duration']:.2f} h, "
+          f"p99 {summary['p99_duration']:.2f} h; avg attendees {summary['avg_attendees']:.1f}, "
+          f"~{summary['unique_attendees']} distinct attendees; busiest hour {summary['busiest_hour']}:00 UTC")
+    for category, hours in summary['hours_by_category'].items():
+        print(f"  {category:<14} {hours:>10.1f} h")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Team and org meeting load from per-user partial aggregates")
+    users = parser.add_mutually_exclusive_group(required=True)
+    users.add_argument('--users', help="File with one user id per line ('-' for stdin)")
+    users.add_argument('--scheduled', action='store_true', help="Every user with a stored report schedule")
+    users.add_argument('--fake-users', type=int, help="Generate this many synthetic users")
+    parser.add_argument('--start', type=date.fromisoformat, help="First day of the period (default: last week)")
+    parser.add_argument('--end', type=date.fromisoformat, help="Last day of the period")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--fake-events', type=int, default=150, help="Synthetic meetings per user per week")
+    parser.add_argument('--query-only', action='store_true', help="Merge stored aggregates without aggregating users")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start_date, end_date = get_last_week_date_range()
+    start_date, end_date = args.start or start_date, args.end or end_date
+    if args.fake_users is not None:
+        user_ids = [f'fake{i}' for i in range(args.fake_users)]
+    elif args.scheduled:
+        user_ids = [schedule['user_id'] for schedule in get_schedule_store().list_schedules()]
+    else:
+        with (sys.stdin if args.users == '-' else open(args.users)) as f:
+            user_ids = [line.strip() for line in f if line.strip()]
+
+    started = time.perf_counter()
+    if args.query_only:
+        aggregate, failed = query_aggregate(start_date, end_date, user_ids), []
+    else:
+        fake_events = args.fake_events if args.fake_users is not None else None
+        aggregate, failed = run_org_rollup(user_ids, start_date, end_date, args.workers, fake_events)
+    print_summary(summarize_aggregate(aggregate))
+    print(f"{time.perf_counter() - started:.1f}s, {len(failed)} users failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import random
+import threading
+import time
+import logging
+from collections import Counter
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = (b'rateLimitExceeded', b'userRateLimitExceeded', b'quotaExceeded')
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token now and returns how long the caller must wait before using it
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+def google_retry_delay(error):
+    # Returns None if the error should not be retried, otherwise the server's Retry-After (0 if absent)
+    if not isinstance(error, HttpError):
+        return 0 if isinstance(error, (ConnectionError, TimeoutError)) else None
+    status = error.resp.status
+    if status == 403 and not any(reason in (error.content or b'') for reason in RATE_LIMIT_REASONS):
+        return None
+    if status != 403 and status not in RETRYABLE_STATUSES:
+        return None
+    try:
+        return float(error.resp.get('retry-after', 0))
+    except ValueError:
+        return 0
+
+
+class RateLimiter:
+    def __init__(self, project_rate=None, user_rate=None, max_retries=None,
+                 base_delay=0.5, max_delay=32.0, retry_delay=google_retry_delay):
+        self.project_rate = project_rate or float(os.environ.get('CALENDAR_PROJECT_QPS', 50))
+        self.user_rate = user_rate or float(os.environ.get('CALENDAR_USER_QPS', 5))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('CALENDAR_MAX_RETRIES', 6))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.project_bucket = TokenBucket(self.project_rate)
+        self.user_buckets = {}
+        self.user_rates = {}
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def set_user_rate(self, user_id, rate):
+        with self._lock:
+            self.user_rates[user_id] = rate
+            self.user_buckets.pop(user_id, None)
+
+    def _user_bucket(self, user_id):
+        with self._lock:
+            bucket = self.user_buckets.get(user_id)
+            if bucket is None:
+                bucket = self.user_buckets[user_id] = TokenBucket(self.user_rates.get(user_id, self.user_rate))
+            return bucket
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def acquire(self, user_id):
+        wait = max(self.project_bucket.reserve(), self._user_bucket(user_id).reserve())
+        if wait > 0:
+            self._count('throttled')
+            self._count('throttled_seconds', wait)
+            time.sleep(wait)
+
+    def backoff(self, attempt, retry_after=0):
+        # Full jitter, but never sooner than the server asked for
+        return max(retry_after, random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def call(self, user_id, fn):
+        attempt = 0
+        while True:
+            self.acquire(user_id)
+            self._count('calls')
+            try:
+                return fn()
+            except Exception as e:
+                retry_after = self.retry_delay(e)
+                if retry_after is None or attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+                delay = self.backoff(attempt, retry_after)
+                attempt += 1
+                self._count('retries')
+                logger.info(f"Retrying provider call in {delay:.2f}s after {type(e).__name__}: {e}")
+                time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+calendar_limiter = RateLimiter()
+# Microsoft Graph and CalDAV servers throttle independently of Google's quota
+graph_limiter = RateLimiter(project_rate=float(os.environ.get('GRAPH_PROJECT_QPS', 50)),
+                            user_rate=float(os.environ.get('GRAPH_USER_QPS', 4)))
+caldav_limiter = RateLimiter(project_rate=float(os.environ.get('CALDAV_PROJECT_QPS', 20)),
+                             user_rate=float(os.environ.get('CALDAV_USER_QPS', 2)))
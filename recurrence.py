@@ -0,0 +1,335 @@
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+
+from event_schema import join_addresses
+
+# Local expansion of recurring series (RFC 5545 RRULE/RDATE/EXDATE) into occurrence rows. Series
+# sharing a rule are expanded together in numpy, with per-series starts, COUNT and UNTIL, and times
+# are converted to UTC once per zone. Occurrence ids follow Google's instance ids,
+# '<master id>_<original start, UTC>' ('<master id>_<date>' for all-day series), so exceptions
+# override occurrences by id. Rules using parts not handled here raise UnsupportedRule.
+
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+FREQUENCIES = {'DAILY': 1, 'WEEKLY': 7, 'MONTHLY': 31, 'YEARLY': 366}
+RULE_PARTS = {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY', 'BYMONTHDAY', 'BYMONTH', 'WKST'}
+# COUNT series are generated in growing spans; no series runs longer than this
+MAX_SERIES_DAYS = 200 * 366
+SECONDS_PER_DAY = 86400
+NEVER = np.iinfo(np.int64).max
+# (series, local seconds) pairs are packed into one int64 to sort and match them together
+_SECONDS_BIAS = 2 ** 38
+
+
+class UnsupportedRule(ValueError):
+    pass
+
+
+class Rule:
+    def __init__(self, value):
+        parts = dict(part.split('=', 1) for part in value.split(';') if part)
+        if set(parts) - RULE_PARTS or parts.get('FREQ') not in FREQUENCIES:
+            raise UnsupportedRule(value)
+        self.freq = parts['FREQ']
+        self.interval = int(parts.get('INTERVAL', 1))
+        self.count = int(parts['COUNT']) if 'COUNT' in parts else None
+        self.until = parts.get('UNTIL')
+        self.wkst = WEEKDAYS[parts.get('WKST', 'MO')]
+        self.byday = [(int(code[:-2] or 0), WEEKDAYS[code[-2:]]) for code in parts['BYDAY'].split(',')] if 'BYDAY' in parts else []
+        self.bymonthday = [int(day) for day in parts['BYMONTHDAY'].split(',')] if 'BYMONTHDAY' in parts else []
+        self.bymonth = [int(month) for month in parts['BYMONTH'].split(',')] if 'BYMONTH' in parts else []
+        ordinals = any(n for n, _ in self.byday)
+        if ordinals and (self.freq in ('DAILY', 'WEEKLY') or (self.freq == 'YEARLY' and not self.bymonth)):
+            # Year-scoped ordinals (BYDAY=20MO) and ordinals in daily/weekly rules aren't handled
+            raise UnsupportedRule(value)
+        # Series with the same pattern (everything but the bounds) are expanded together
+        self.pattern = (self.freq, self.interval, self.wkst, tuple(self.byday), tuple(self.bymonthday), tuple(self.bymonth))
+
+
+@lru_cache(maxsize=1024)
+def parse_rule(value):
+    return Rule(value)
+
+
+# Days are int64 counts since 1970-01-01, which was a Thursday
+def _weekday(days):
+    return (days + 3) % 7
+
+
+def _month_index(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def _month_start(months):
+    return months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+def _pack(rows, values):
+    return rows.astype(np.int64) * (2 * _SECONDS_BIAS) + (values + _SECONDS_BIAS)
+
+
+def _unpack(packed):
+    rows, values = np.divmod(packed, 2 * _SECONDS_BIAS)
+    return rows, values - _SECONDS_BIAS
+
+
+def _ragged(starts, counts, step):
+    # arange(start, start + count * step, step) for every row, concatenated, with each value's row
+    counts = np.maximum(counts, 0)
+    rows = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(rows.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    return starts[rows] + offsets * step, rows
+
+
+def _month_days(rule, months, rows, first):
+    # The days a monthly (or month-scoped yearly) rule picks in `months`, with their rows; without
+    # BYDAY or BYMONTHDAY that is each series' own day of the month
+    starts, ends = _month_start(months), _month_start(months + 1)
+    if not rule.byday and not rule.bymonthday:
+        picked = starts + (first - _month_start(_month_index(first)))[rows]
+        keep = picked < ends
+        return picked[keep], rows[keep]
+    by_date = [], []
+    for day in rule.bymonthday:
+        picked = starts + day - 1 if day > 0 else ends + day
+        keep = (picked >= starts) & (picked < ends)
+        by_date[0].append(picked[keep])
+        by_date[1].append(rows[keep])
+    by_weekday = [], []
+    for n, weekday in rule.byday:
+        if n == 0:
+            picked = ((starts + (weekday - _weekday(starts)) % 7)[:, None] + 7 * np.arange(5)).ravel()
+            picked_rows = np.repeat(rows, 5)
+            keep = picked < np.repeat(ends, 5)
+        elif n > 0:
+            picked, picked_rows = starts + (weekday - _weekday(starts)) % 7 + 7 * (n - 1), rows
+            keep = picked < ends
+        else:
+            picked, picked_rows = ends - 1 - (_weekday(ends - 1) - weekday) % 7 + 7 * (n + 1), rows
+            keep = picked >= starts
+        by_weekday[0].append(picked[keep])
+        by_weekday[1].append(picked_rows[keep])
+    if not by_date[0]:
+        return np.concatenate(by_weekday[0]), np.concatenate(by_weekday[1])
+    if not by_weekday[0]:
+        return np.concatenate(by_date[0]), np.concatenate(by_date[1])
+    both = np.intersect1d(_pack(np.concatenate(by_date[1]), np.concatenate(by_date[0])),
+                          _pack(np.concatenate(by_weekday[1]), np.concatenate(by_weekday[0])))
+    rows, days = _unpack(both)
+    return days, rows
+
+
+def _rule_days(rule, first, limit):
+    # Days in [first, limit) the rule generates for each series, as (rows, days) sorted by both
+    if rule.freq == 'DAILY':
+        days, rows = _ragged(first, (limit - first - 1) // rule.interval + 1, rule.interval)
+        if rule.byday:
+            keep = np.isin(_weekday(days), [weekday for _, weekday in rule.byday])
+            days, rows = days[keep], rows[keep]
+        if rule.bymonthday:
+            months = _month_index(days)
+            from_start = days - _month_start(months) + 1
+            from_end = days - _month_start(months + 1)
+            keep = np.isin(from_start, rule.bymonthday) | np.isin(from_end, rule.bymonthday)
+            days, rows = days[keep], rows[keep]
+    elif rule.freq == 'WEEKLY':
+        anchor = first - (_weekday(first) - rule.wkst) % 7
+        weeks, rows = _ragged(anchor, (limit - anchor - 1) // (7 * rule.interval) + 1, 7 * rule.interval)
+        if rule.byday:
+            offsets = np.array(sorted({(weekday - rule.wkst) % 7 for _, weekday in rule.byday}), dtype=np.int64)
+            days = (weeks[:, None] + offsets).ravel()
+            rows = np.repeat(rows, len(offsets))
+        else:
+            days = weeks + ((_weekday(first) - rule.wkst) % 7)[rows]
+    elif rule.freq == 'MONTHLY':
+        start_month = _month_index(first)
+        months, rows = _ragged(start_month, (_month_index(limit) - start_month) // rule.interval + 1, rule.interval)
+        days, rows = _month_days(rule, months, rows, first)
+    else:
+        start_month = _month_index(first)
+        years, rows = _ragged(start_month // 12, (_month_index(limit) // 12 - start_month // 12) // rule.interval + 1,
+                              rule.interval)
+        if rule.bymonth or rule.byday or rule.bymonthday:
+            in_year = np.array(rule.bymonth, dtype=np.int64) - 1 if rule.bymonth else np.arange(12, dtype=np.int64)
+            months = (years[:, None] * 12 + in_year).ravel()
+            rows = np.repeat(rows, len(in_year))
+        else:
+            months = years * 12 + (start_month % 12)[rows]
+        days, rows = _month_days(rule, months, rows, first)
+    if rule.bymonth and rule.freq != 'YEARLY':
+        keep = np.isin(_month_index(days) % 12 + 1, rule.bymonth)
+        days, rows = days[keep], rows[keep]
+    keep = (days >= first[rows]) & (days < limit[rows])
+    return _unpack(np.unique(_pack(rows[keep], days[keep])))
+
+
+def _rule_starts(rule, first, counts, until, horizon):
+    # Local start seconds of the series starting at `first` (local seconds) under one pattern, before
+    # horizon, as (rows, seconds); counts are 0 for series without a COUNT
+    first_day, time_of_day = np.divmod(first, SECONDS_PER_DAY)
+    limit = np.minimum(-(-horizon // SECONDS_PER_DAY), np.where(until == NEVER, NEVER, until // SECONDS_PER_DAY + 1))
+    # COUNT counts from the first occurrence, whatever the window
+    counted = counts > 0
+    limit[counted] = first_day[counted] + (counts[counted] + 1) * rule.interval * FREQUENCIES[rule.freq] + 7
+    while True:
+        rows, days = _rule_days(rule, first_day, np.maximum(limit, first_day))
+        seconds = days * SECONDS_PER_DAY + time_of_day[rows]
+        keep = seconds <= until[rows]
+        rows, seconds = rows[keep], seconds[keep]
+        found = np.bincount(rows, minlength=len(first))
+        short = counted & (found < counts) & (limit - first_day < MAX_SERIES_DAYS)
+        if not short.any():
+            break
+        limit[short] = first_day[short] + 4 * (limit[short] - first_day[short])
+    # Rows come sorted, so an occurrence's rank is its position within its row
+    rank = np.arange(len(rows)) - np.repeat(np.cumsum(found) - found, found)
+    keep = ~counted[rows] | (rank < counts[rows])
+    return rows[keep], seconds[keep]
+
+
+def _local_seconds(value, zone, all_day):
+    # An iCalendar DATE or DATE-TIME (UTC 'Z' or floating) as naive local seconds since the epoch
+    if len(value) == 8:
+        moment = datetime.strptime(value, '%Y%m%d')
+    elif value.endswith('Z'):
+        moment = datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+        moment = moment.replace(tzinfo=None) if all_day else moment.astimezone(zone).replace(tzinfo=None)
+    else:
+        moment = datetime.strptime(value, '%Y%m%dT%H%M%S')
+    return int(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _date_list(line, zone, all_day):
+    # RDATE/EXDATE values, converted to the series' local time
+    head, _, values = line.partition(':')
+    params = dict(param.split('=', 1) for param in head.split(';')[1:])
+    source = ZoneInfo(params['TZID']) if 'TZID' in params else None
+    seconds = []
+    for value in values.split(','):
+        if source is not None and source != zone and len(value) > 8:
+            moment = datetime.strptime(value, '%Y%m%dT%H%M%S').replace(tzinfo=source).astimezone(timezone.utc)
+            value = moment.strftime('%Y%m%dT%H%M%SZ')
+        seconds.append(_local_seconds(value, zone, all_day))
+    return seconds
+
+
+class Series:
+    # One master: its first start as local seconds, duration, zone and recurrence lines
+    def __init__(self, master):
+        start, end = master['start'], master['end']
+        self.all_day = 'date' in start
+        if self.all_day:
+            self.zone_name = 'UTC'
+            first = date.fromisoformat(start['date'])
+            self.duration = (date.fromisoformat(end['date']) - first).days * SECONDS_PER_DAY
+            self.first = (first - date(1970, 1, 1)).days * SECONDS_PER_DAY
+        else:
+            self.zone_name = start.get('timeZone') or 'UTC'
+            begin = datetime.fromisoformat(start['dateTime'])
+            self.duration = int((datetime.fromisoformat(end['dateTime']) - begin).total_seconds())
+            local = begin.astimezone(ZoneInfo(self.zone_name)).replace(tzinfo=None)
+            self.first = int(local.replace(tzinfo=timezone.utc).timestamp())
+        zone = ZoneInfo(self.zone_name)
+        self.rules, self.rdates, self.exdates = [], [], []
+        for line in master['recurrence']:
+            name = line.split(':', 1)[0].split(';', 1)[0].upper()
+            if name == 'RRULE':
+                rule = parse_rule(line.split(':', 1)[1])
+                self.rules.append((rule, _local_seconds(rule.until, zone, self.all_day) if rule.until else NEVER))
+            elif name == 'RDATE' and 'VALUE=PERIOD' not in line:
+                self.rdates += _date_list(line, zone, self.all_day)
+            elif name == 'EXDATE':
+                self.exdates += _date_list(line, zone, self.all_day)
+            else:
+                raise UnsupportedRule(line)
+
+
+def _series_dates(series, dates):
+    # Per-series RDATE or EXDATE lists, packed
+    return _pack(np.repeat(np.arange(len(series)), [len(getattr(one, dates)) for one in series]),
+                 np.array([value for one in series for value in getattr(one, dates)], dtype=np.int64))
+
+
+def expand_recurrences(masters, start, end):
+    # Occurrence records of `masters` (events.list items with `recurrence`) overlapping [start, end),
+    # with the columns of EventColumns.to_records, and the masters that couldn't be expanded locally
+    series, rows, unsupported = [], [], []
+    for master in masters:
+        try:
+            series.append(Series(master))
+            rows.append(master)
+        except (UnsupportedRule, KeyError, ValueError):
+            unsupported.append(master)
+    if not series:
+        return _empty_records(), unsupported
+
+    # A day of slack on the local side covers every UTC offset
+    horizon = int(end.timestamp()) + SECONDS_PER_DAY
+    patterns = {}
+    for index, one in enumerate(series):
+        for rule, until in one.rules:
+            patterns.setdefault(rule.pattern, (rule, []))[1].append((index, one.first, rule.count or 0, until))
+    packed = [_series_dates(series, 'rdates')]
+    for rule, members in patterns.values():
+        index, first, counts, until = (np.array(column, dtype=np.int64) for column in zip(*members))
+        member_rows, seconds = _rule_starts(rule, first, counts, until, horizon)
+        packed.append(_pack(index[member_rows], seconds))
+    packed = np.unique(np.concatenate(packed))
+    index, local_starts = _unpack(packed[~np.isin(packed, _series_dates(series, 'exdates'))])
+    keep = local_starts < horizon
+    index, local_starts = index[keep], local_starts[keep]
+
+    utc_starts = local_starts.copy()
+    zones = np.array([one.zone_name for one in series], dtype=object)[index]
+    all_day = np.array([one.all_day for one in series])[index]
+    for zone_name in pd.unique(zones[~all_day]):
+        # One vectorized conversion per zone. Nonexistent local times (spring forward) move an hour
+        # later and ambiguous ones take the first (daylight) instant, as the Calendar API does.
+        chosen = (zones == zone_name) & ~all_day
+        wall = pd.DatetimeIndex(local_starts[chosen].astype('datetime64[s]'))
+        converted = wall.tz_localize(zone_name, ambiguous=np.ones(len(wall), dtype=bool),
+                                     nonexistent=pd.Timedelta(hours=1))
+        utc_starts[chosen] = converted.as_unit('s').asi8
+    utc_ends = utc_starts + np.array([one.duration for one in series], dtype=np.int64)[index]
+    keep = (utc_starts < int(end.timestamp())) & (utc_ends > int(start.timestamp()))
+    index, utc_starts, utc_ends, all_day = index[keep], utc_starts[keep], utc_ends[keep], all_day[keep]
+
+    master_ids = [master['id'] for master in rows]
+    texts = np.datetime_as_string(utc_starts.astype('datetime64[s]'), unit='s').tolist()
+    event_ids = [
+        f'{master_ids[i]}_{t[:4]}{t[5:7]}{t[8:10]}' if whole_day else
+        f'{master_ids[i]}_{t[:4]}{t[5:7]}{t[8:10]}T{t[11:13]}{t[14:16]}{t[17:19]}Z'
+        for i, t, whole_day in zip(index.tolist(), texts, all_day.tolist())
+    ]
+
+    def column(values, dtype=object):
+        return pd.Series(np.array(values, dtype=dtype)[index], dtype=dtype)
+
+    return pd.DataFrame({
+        'event_id': pd.Series(event_ids, dtype=object),
+        'ical_uid': column([master.get('iCalUID') for master in rows]),
+        'summary': column([master.get('summary') for master in rows]),
+        'organizer': column([master['organizer'].get('email') if 'organizer' in master else None for master in rows]),
+        'start': pd.to_datetime(utc_starts, unit='s', utc=True),
+        'end': pd.to_datetime(utc_ends, unit='s', utc=True),
+        'attendees': column([len(master.get('attendees', ())) for master in rows], 'int64'),
+        'attendee_emails': column([
+            join_addresses([a['email'] for a in master['attendees'] if 'email' in a]) if 'attendees' in master else None
+            for master in rows
+        ]),
+    }), unsupported
+
+
+def _empty_records():
+    return pd.DataFrame({
+        'event_id': pd.Series([], dtype=object),
+        'ical_uid': pd.Series([], dtype=object),
+        'summary': pd.Series([], dtype=object),
+        'organizer': pd.Series([], dtype=object),
+        'start': pd.Series([], dtype='datetime64[ns, UTC]'),
+        'end': pd.Series([], dtype='datetime64[ns, UTC]'),
+        'attendees': pd.Series([], dtype='int64'),
+        'attendee_emails': pd.Series([], dtype=object),
+    })
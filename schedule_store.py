@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEDULE_PATH = os.environ.get(
+    'SCHEDULE_STORE_PATH', os.path.join('.meeting_analyzer', 'schedules.sqlite3')
+)
+# Fernet key (cryptography.fernet.Fernet.generate_key()) that stored refresh tokens are encrypted
+# with. Without it, credentials for scheduled reports can't be saved or loaded.
+SCHEDULE_ENCRYPTION_KEY = os.environ.get('SCHEDULE_ENCRYPTION_KEY')
+GOOGLE_TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS credentials (
+    user_id TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    info TEXT NOT NULL,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS report_schedules (
+    user_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    day_of_week TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    minute INTEGER NOT NULL,
+    calendar_ids TEXT NOT NULL,
+    updated_at TEXT
+);
+""",
+    # Reports so far ran and counted their days in UTC
+    "ALTER TABLE report_schedules ADD COLUMN time_zone TEXT NOT NULL DEFAULT 'UTC';",
+    # Only the encrypted refresh token is kept; client id and secret come from the environment.
+    # Rows of credentials (whole plaintext token JSON) are moved here when the store opens.
+    """
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    user_id TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    scopes TEXT NOT NULL,
+    token BLOB NOT NULL,
+    updated_at TEXT
+);
+""",
+]
+
+SCHEDULE_COLUMNS = ['user_id', 'email', 'day_of_week', 'hour', 'minute', 'calendar_ids', 'time_zone']
+
+
+def _schedule(row):
+    schedule = dict(zip(SCHEDULE_COLUMNS, row))
+    schedule['calendar_ids'] = json.loads(schedule['calendar_ids'])
+    return schedule
+
+
+# Report schedules and the stored credentials they run with. Scheduled jobs only carry a
+# user_id; the credentials are loaded here when the job fires.
+class ScheduleStore(SQLiteStore):
+    MIGRATIONS = MIGRATIONS
+
+    def __init__(self, path=DEFAULT_SCHEDULE_PATH, key=None):
+        self.key = key or SCHEDULE_ENCRYPTION_KEY
+        if path != ':memory:':
+            # Holds refresh tokens: a private directory, and the file made 0600 before SQLite opens
+            # it, since its -wal and -shm files are created with the database file's permissions
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            os.chmod(directory, 0o700)
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+            for name in (path, f'{path}-wal', f'{path}-shm'):
+                if os.path.exists(name):
+                    os.chmod(name, 0o600)
+        super().__init__(path)
+        # Deleted tokens are overwritten rather than left in free pages
+        self._conn.execute('PRAGMA secure_delete = ON')
+        self._move_plaintext_credentials()
+
+    def _cipher(self):
+        if not self.key:
+            raise RuntimeError("Set SCHEDULE_ENCRYPTION_KEY to store credentials for scheduled reports")
+        from cryptography.fernet import Fernet
+
+        return Fernet(self.key)
+
+    def _move_plaintext_credentials(self):
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT user_id, provider, info FROM credentials').fetchall()
+            if not rows:
+                return
+            if not self.key:
+                logger.warning(f"{len(rows)} stored credentials are unencrypted; set SCHEDULE_ENCRYPTION_KEY")
+                return
+            for user_id, provider, info in rows:
+                info = json.loads(info)
+                if info.get('refresh_token'):
+                    self._save_token(conn, user_id, provider, info['refresh_token'], info.get('scopes') or [])
+            conn.execute('DELETE FROM credentials')
+        self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        logger.info(f"Encrypted the refresh tokens of {len(rows)} stored credentials")
+
+    def _save_token(self, conn, user_id, provider, refresh_token, scopes):
+        conn.execute(
+            'INSERT OR REPLACE INTO refresh_tokens VALUES (?, ?, ?, ?, ?)',
+            (user_id, provider, json.dumps(list(scopes)), self._cipher().encrypt(refresh_token.encode()),
+             datetime.now(timezone.utc).isoformat())
+        )
+
+    def save_credentials(self, user_id, credentials, provider='google'):
+        if not credentials.refresh_token:
+            raise ValueError("Scheduled reports need credentials with a refresh token (offline access)")
+        with self._transaction() as conn:
+            self._save_token(conn, user_id, provider, credentials.refresh_token, credentials.scopes or [])
+
+    def load_credentials(self, user_id):
+        # Credentials with only a refresh token; the first request fetches an access token
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT provider, scopes, token FROM refresh_tokens WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        provider, scopes, token = row
+        if provider != 'google':
+            raise ValueError(f"Unsupported credential provider: {provider}")
+        from cryptography.fernet import InvalidToken
+        from google.oauth2.credentials import Credentials
+
+        try:
+            refresh_token = self._cipher().decrypt(token).decode()
+        except InvalidToken:
+            logger.warning(f"Stored credentials for {user_id} don't decrypt with SCHEDULE_ENCRYPTION_KEY")
+            return None
+        return Credentials(
+            None, refresh_token=refresh_token, token_uri=GOOGLE_TOKEN_URI, client_id=os.environ['GOOGLE_CLIENT_ID'],
+            client_secret=os.environ['GOOGLE_CLIENT_SECRET'], scopes=json.loads(scopes)
+        )
+
+    def delete_credentials(self, user_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM refresh_tokens WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM credentials WHERE user_id = ?', (user_id,))
+
+    def save_schedule(self, user_id, email, day_of_week, hour, minute, calendar_ids=('primary',), time_zone='UTC'):
+        # calendar_ids is a list of ids or calendar_services.SELECTED_CALENDARS. The report runs at
+        # hour:minute in time_zone and counts its days and working hours there.
+        calendar_ids = calendar_ids if isinstance(calendar_ids, str) else list(calendar_ids)
+        row = (user_id, email, day_of_week, hour, minute, json.dumps(calendar_ids), time_zone)
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO report_schedules ({', '.join(SCHEDULE_COLUMNS)}, updated_at) "
+                f"VALUES ({', '.join('?' * (len(row) + 1))})",
+                row + (datetime.now(timezone.utc).isoformat(),)
+            )
+        return _schedule(row)
+
+    def get_schedule(self, user_id):
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(SCHEDULE_COLUMNS)} FROM report_schedules WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return _schedule(row) if row else None
+
+    def list_schedules(self):
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(SCHEDULE_COLUMNS)} FROM report_schedules ORDER BY user_id"
+            ).fetchall()
+        return [_schedule(row) for row in rows]
+
+    def delete_schedule(self, user_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM report_schedules WHERE user_id = ?', (user_id,))
+
+
+_default_store = None
+
+
+def get_schedule_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = ScheduleStore()
+    return _default_store
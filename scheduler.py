@@ -1,37 +1,141 @@
+import logging
+import os
+import threading
+
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from data_processor import analyze_calendar_data
-from visualizer import create_visualizations
-from email_sender import send_email_report
+from schedule_store import get_schedule_store
+from metrics import metrics
 from utils import get_last_week_date_range
 
-scheduler = BackgroundScheduler()
-scheduler.start()
+# The report pipeline (pandas, plotly, the Google client) is imported when a report runs, so
+# starting the scheduler from the app doesn't load it
 
-def schedule_weekly_report(calendar_service, email, day, time):
-    # Remove existing job if it exists
-    scheduler.remove_job('weekly_report')
-    
-    # Schedule the new job
+logger = logging.getLogger(__name__)
+
+# At most REPORT_WORKERS reports are generated at once; the rest wait in the executor queue.
+# Start times are spread by up to REPORT_JITTER_SECONDS so popular slots don't hit the
+# Calendar API and SMTP all at once, and a queued report still runs if it is less than
+# REPORT_MISFIRE_GRACE_SECONDS late.
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 8))
+REPORT_JITTER_SECONDS = int(os.environ.get('REPORT_JITTER_SECONDS', 900))
+REPORT_MISFIRE_GRACE_SECONDS = int(os.environ.get('REPORT_MISFIRE_GRACE_SECONDS', 6 * 3600))
+
+scheduler = BackgroundScheduler(
+    executors={'default': ThreadPoolExecutor(REPORT_WORKERS)},
+    job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': REPORT_MISFIRE_GRACE_SECONDS},
+)
+_start_lock = threading.Lock()
+
+
+def report_job_id(user_id):
+    return f'weekly_report:{user_id}'
+
+
+def report_trigger(day_of_week, hour, minute, jitter=REPORT_JITTER_SECONDS, time_zone='UTC'):
+    return CronTrigger(day_of_week=day_of_week, hour=hour, minute=minute, jitter=jitter or None, timezone=time_zone)
+
+
+def add_report_job(schedule):
+    # Replacing by id means rescheduling never needs a remove_job that may find nothing
     scheduler.add_job(
-        generate_and_send_report,
-        CronTrigger(day_of_week=day.lower()[:3], hour=time.hour, minute=time.minute),
-        id='weekly_report',
-        args=[calendar_service, email]
+        run_scheduled_report,
+        report_trigger(schedule['day_of_week'], schedule['hour'], schedule['minute'],
+                       time_zone=schedule['time_zone']),
+        id=report_job_id(schedule['user_id']),
+        args=[schedule['user_id']],
+        replace_existing=True,
+    )
+
+
+def restore_report_jobs(store=None):
+    schedules = (store or get_schedule_store()).list_schedules()
+    for schedule in schedules:
+        add_report_job(schedule)
+    return len(schedules)
+
+
+def start_scheduler():
+    # Safe to call on every Streamlit rerun; only the first call restores jobs and starts the thread
+    with _start_lock:
+        if not scheduler.running:
+            restored = restore_report_jobs()
+            scheduler.start()
+            logger.info(f"Scheduler started with {restored} report jobs")
+    return scheduler
+
+
+def schedule_weekly_report(calendar_service, email, day, time):
+    store = get_schedule_store()
+    user_id = calendar_service.user_id
+    store.save_credentials(user_id, calendar_service.credentials)
+    schedule = store.save_schedule(
+        user_id, email, day.lower()[:3], time.hour, time.minute, calendar_service.calendar_ids,
+        calendar_service.time_zone
     )
+    add_report_job(schedule)
+
+
+def cancel_weekly_report(user_id):
+    store = get_schedule_store()
+    store.delete_schedule(user_id)
+    store.delete_credentials(user_id)
+    if scheduler.get_job(report_job_id(user_id)):
+        scheduler.remove_job(report_job_id(user_id))
+
+
+def scheduled_report_service(user_id, store=None):
+    # Rebuilds a user's calendar service from stored credentials; None if they have no schedule
+    store = store or get_schedule_store()
+    schedule = store.get_schedule(user_id)
+    credentials = store.load_credentials(user_id)
+    if schedule is None or credentials is None:
+        return None, None
+    from calendar_services import GoogleCalendarService
+    from event_store import get_event_store
+
+    calendar_service = GoogleCalendarService(
+        credentials, store=get_event_store(), user_id=user_id, calendar_ids=schedule['calendar_ids']
+    )
+    calendar_service.time_zone = schedule['time_zone']
+    return calendar_service, schedule['email']
+
+
+def run_scheduled_report(user_id):
+    calendar_service, email = scheduled_report_service(user_id)
+    if calendar_service is None:
+        logger.warning(f"Skipping report for {user_id}: no stored schedule or credentials")
+        return
+    generate_and_send_report(calendar_service, email)
+
+
+def generate_and_send_report(calendar_service, email, start_date=None, end_date=None):
+    with metrics.profile('report'), metrics.stage('report') as stage:
+        stage['events'] = events = _generate_and_send_report(calendar_service, email, start_date, end_date)
+        return events
+
+
+def _generate_and_send_report(calendar_service, email, start_date, end_date):
+    from data_processor import analyze_calendar_data, analyze_intervals
+    from email_sender import send_email_report
+    from visualizer import create_visualizations
+
+    if start_date is None:
+        start_date, end_date = get_last_week_date_range(calendar_service.time_zone)
 
-def generate_and_send_report(calendar_service, email):
-    start_date, end_date = get_last_week_date_range()
-    
     # Fetch and process data
     calendar_service.authenticate()
     df = calendar_service.fetch_events(start_date, end_date)
-    
+
     # Analyze data
-    analysis = analyze_calendar_data(df)
-    
+    analysis = analyze_calendar_data(df, calendar_service.time_zone)
+    intervals = analyze_intervals(df, start_date, end_date, calendar_service.time_zone)
+
     # Create visualizations
-    figs = create_visualizations(df)
-    
+    figs = create_visualizations(df, analysis, intervals=intervals)
+
     # Send email report
-    send_email_report(email, figs)
+    if not send_email_report(email, figs):
+        raise RuntimeError(f"Could not deliver the report to {email}")
+    return len(df)
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+# Mergeable summaries of values too many to keep: a t-digest for quantiles and a HyperLogLog for
+# distinct counts. Both merge without loss beyond their own error, so per-user sketches can be
+# combined across any set of users.
+
+DIGEST_COMPRESSION = 200
+HLL_PRECISION = 12
+
+
+class TDigest:
+    # Centroids (means and weights) sorted by mean. Built and merged in batches: every value and
+    # centroid is sorted once and grouped by the k1 scale function, which keeps centroids small at
+    # the tails and about compression / 2 of them in all. Centroids holding one repeated value are
+    # marked single, so discrete data (durations on a 15-minute grid) gets quantiles that occur in it.
+    def __init__(self, means=(), weights=(), minimum=np.inf, maximum=-np.inf, compression=DIGEST_COMPRESSION,
+                 single=None):
+        self.means = np.asarray(means, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.single = np.ones(len(self.means), dtype=bool) if single is None else np.asarray(single, dtype=bool)
+        self.minimum, self.maximum = minimum, maximum
+        self.compression = compression
+
+    @classmethod
+    def from_values(cls, values, compression=DIGEST_COMPRESSION):
+        values = np.asarray(values, dtype=np.float64)
+        digest = cls(compression=compression)
+        if len(values):
+            digest = cls.combine([cls(values, np.ones(len(values)), values.min(), values.max(), compression)])
+        return digest
+
+    @classmethod
+    def combine(cls, digests):
+        digests = list(digests)
+        compression = digests[0].compression if digests else DIGEST_COMPRESSION
+        # Centroids grouped at another compression would be merged on the wrong scale
+        mismatched = sorted({digest.compression for digest in digests} - {compression})
+        if mismatched:
+            raise ValueError(f"Can't combine t-digests of compression {compression} and {', '.join(map(str, mismatched))}")
+        means = np.concatenate([digest.means for digest in digests]) if digests else np.zeros(0)
+        weights = np.concatenate([digest.weights for digest in digests]) if digests else np.zeros(0)
+        single = np.concatenate([digest.single for digest in digests]) if digests else np.zeros(0, dtype=bool)
+        minimum = min((digest.minimum for digest in digests), default=np.inf)
+        maximum = max((digest.maximum for digest in digests), default=-np.inf)
+        if not len(means):
+            return cls(minimum=minimum, maximum=maximum, compression=compression)
+        order = np.argsort(means, kind='stable')
+        means, weights, single = means[order], weights[order], single[order]
+        # Each centroid joins the group its left edge falls in on the k1 scale
+        before = (np.cumsum(weights) - weights) / weights.sum()
+        groups = np.floor(compression / (2 * np.pi) * np.arcsin(2 * before - 1)).astype(np.int64)
+        groups -= groups[0]
+        firsts = np.flatnonzero(np.diff(groups, prepend=-1))
+        totals = np.add.reduceat(weights, firsts)
+        grouped = np.add.reduceat(means * weights, firsts) / totals
+        # Means are sorted, so a group holds one value when its first and last means match
+        lasts = np.append(firsts[1:], len(means)) - 1
+        single = np.logical_and.reduceat(single, firsts) & (means[firsts] == means[lasts])
+        return cls(np.where(single, means[firsts], grouped), totals, minimum, maximum, compression, single)
+
+    def merge(self, other):
+        return TDigest.combine([self, other])
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def quantile(self, q):
+        # Interpolates between centroid centres, clamped to the exact minimum and maximum. A single
+        # value centroid answers for its whole rank range, up to half a value from either edge.
+        if not len(self.means):
+            return float('nan')
+        ends = np.cumsum(self.weights)
+        spread = self.single & (self.weights > 1)
+        left = np.where(spread, ends - self.weights + 0.5, ends - self.weights / 2)
+        right = np.where(spread, ends - 0.5, ends - self.weights / 2)
+        positions = np.concatenate([[0.0], np.column_stack([left, right]).ravel(), [self.count]])
+        values = np.concatenate([[self.minimum], np.repeat(self.means, 2), [self.maximum]])
+        return float(np.interp(np.asarray(q) * self.count, positions, values))
+
+    def to_dict(self):
+        return {'means': self.means.tolist(), 'weights': self.weights.tolist(), 'single': self.single.tolist(),
+                'min': float(self.minimum), 'max': float(self.maximum), 'compression': self.compression}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['means'], data['weights'], data['min'], data['max'], data['compression'], data['single'])
+
+
+def _bit_length(values):
+    # Bit length of uint64 values, exact: float64 only holds 53 bits, so each 32-bit half is measured apart
+    high, low = (values >> np.uint64(32)).astype(np.float64), (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def _check_precisions(sketches):
+    # Registers of different precisions index different hash bits; taking their maximum is meaningless
+    precisions = sorted({sketch.precision for sketch in sketches})
+    if len(precisions) > 1:
+        raise ValueError(f"Can't combine HyperLogLog sketches of precisions {', '.join(map(str, precisions))}")
+
+
+class HyperLogLog:
+    # 2 ** precision registers of the longest run of leading zeros seen; precision 12 means 4 KiB
+    # and a standard error of about 1.6%. Strings are hashed with pandas' fixed-key SipHash, so
+    # sketches built in different processes agree.
+    def __init__(self, registers=None, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    @classmethod
+    def from_values(cls, values, precision=HLL_PRECISION):
+        sketch = cls(precision=precision)
+        sketch.add(values)
+        return sketch
+
+    def add(self, values):
+        hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+        if not len(hashes):
+            return
+        rest_bits = 64 - self.precision
+        index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        ranks = (rest_bits - _bit_length(rest) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+
+    @classmethod
+    def combine(cls, sketches):
+        sketches = list(sketches)
+        if not sketches:
+            return cls()
+        _check_precisions(sketches)
+        return cls(np.max(np.stack([sketch.registers for sketch in sketches]), axis=0), sketches[0].precision)
+
+    def merge(self, other):
+        _check_precisions([self, other])
+        return HyperLogLog(np.maximum(self.registers, other.registers), self.precision)
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        registers = np.frombuffer(data, dtype=np.uint8).copy()
+        return cls(registers, int(np.log2(len(registers))))
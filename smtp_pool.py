@@ -0,0 +1,283 @@
+import logging
+import os
+import queue
+import random
+import re
+import smtplib
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from email import policy
+from email.utils import getaddresses, parseaddr
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def smtp_settings():
+    return {
+        'host': os.environ.get('SMTP_HOST', 'smtp.gmail.com'),
+        'port': int(os.environ.get('SMTP_PORT', 587)),
+        'username': os.environ.get('SMTP_USERNAME'),
+        'password': os.environ.get('SMTP_PASSWORD'),
+        'sender': os.environ.get('SMTP_FROM') or os.environ.get('SMTP_USERNAME') or 'reports@localhost',
+        'starttls': os.environ.get('SMTP_STARTTLS', '1') != '0',
+        'pool_size': int(os.environ.get('SMTP_POOL_SIZE', 2)),
+        'batch_size': int(os.environ.get('SMTP_BATCH_SIZE', 20)),
+        'max_retries': int(os.environ.get('SMTP_MAX_RETRIES', 5)),
+        'timeout': float(os.environ.get('SMTP_TIMEOUT', 30)),
+        'messages_per_connection': int(os.environ.get('SMTP_MESSAGES_PER_CONNECTION', 100)),
+        'idle_timeout': float(os.environ.get('SMTP_IDLE_TIMEOUT', 60)),
+    }
+
+
+def _smtp_data(data):
+    # Same line-ending and dot-stuffing rules as smtplib.SMTP.data
+    data = re.sub(br'(?:\r\n|\n|\r(?!\n))', b'\r\n', data)
+    data = re.sub(br'(?m)^\.', b'..', data)
+    return data if data.endswith(b'\r\n') else data + b'\r\n'
+
+
+class _Delivery:
+    __slots__ = ('sender', 'recipients', 'data', 'future', 'attempts')
+
+    def __init__(self, sender, recipients, data):
+        self.sender = sender
+        self.recipients = recipients
+        self.data = data
+        self.future = Future()
+        self.attempts = 0
+
+
+class SMTPPool:
+    # A queue drained by a few threads, each holding one authenticated SMTP connection.
+    # Messages that queue up together go out as one pipelined batch. submit() returns a
+    # Future that resolves to the refused-recipients dict (like smtplib's sendmail) or
+    # raises the delivery error.
+    def __init__(self, host=None, port=None, username=None, password=None, sender=None, starttls=None,
+                 pool_size=None, batch_size=None, max_retries=None, timeout=None,
+                 messages_per_connection=None, idle_timeout=None, base_delay=0.5, max_delay=30.0):
+        settings = smtp_settings()
+        self.host = host or settings['host']
+        self.port = port or settings['port']
+        self.username = username if username is not None else settings['username']
+        self.password = password if password is not None else settings['password']
+        self.sender = sender or settings['sender']
+        self.starttls = starttls if starttls is not None else settings['starttls']
+        self.pool_size = pool_size or settings['pool_size']
+        self.batch_size = batch_size or settings['batch_size']
+        self.max_retries = max_retries if max_retries is not None else settings['max_retries']
+        self.timeout = timeout or settings['timeout']
+        self.messages_per_connection = messages_per_connection or settings['messages_per_connection']
+        self.idle_timeout = idle_timeout or settings['idle_timeout']
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.counters = Counter()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def submit(self, msg):
+        recipients = [address for _, address in getaddresses(msg.get_all('To', []) + msg.get_all('Cc', []))]
+        sender = parseaddr(msg['From'] or self.sender)[1]
+        delivery = _Delivery(sender, recipients, msg.as_bytes(policy=policy.SMTP))
+        self._start()
+        self._count('submitted')
+        self._queue.put(delivery)
+        return delivery.future
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.pool_size:
+                thread = threading.Thread(target=self._run, name=f'smtp-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def close(self, timeout=None):
+        # Lets queued messages go out, then quits every connection
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.ehlo()
+            if self.starttls:
+                conn.starttls()
+                conn.ehlo()
+            if self.username:
+                conn.login(self.username, self.password)
+        except BaseException:
+            conn.close()
+            raise
+        self._count('connections')
+        return conn
+
+    def _disconnect(self, conn):
+        if conn is None:
+            return None
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+        return None
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _run(self):
+        conn, sent = None, 0
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                conn, sent = self._disconnect(conn), 0
+                continue
+            if item is None:
+                self._disconnect(conn)
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # handled once this batch is out
+                    break
+                batch.append(item)
+
+            retries = []
+            try:
+                if conn is None or sent >= self.messages_per_connection:
+                    self._disconnect(conn)
+                    conn, sent = self._connect(), 0
+                self._count('batches')
+                with metrics.stage('smtp_batch') as stage:
+                    stage['messages'] = len(batch)
+                    stage['bytes'] = sum(len(delivery.data) for delivery in batch)
+                    retries = self._send_batch(conn, batch)
+                sent += len(batch)
+            except smtplib.SMTPAuthenticationError as e:
+                # Retrying won't fix credentials
+                conn, sent = self._disconnect(conn), 0
+                for delivery in batch:
+                    self._fail(delivery, e)
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning(f"SMTP connection to {self.host}:{self.port} failed: {e}")
+                conn, sent = self._disconnect(conn), 0
+                self._count('reconnects')
+                retries = [delivery for delivery in batch if not delivery.future.done()]
+            except Exception as e:
+                conn, sent = self._disconnect(conn), 0
+                for delivery in batch:
+                    if not delivery.future.done():
+                        self._fail(delivery, e)
+            self._retry(retries)
+
+    def _retry(self, deliveries):
+        attempts = 0
+        for delivery in deliveries:
+            delivery.attempts += 1
+            if delivery.attempts > self.max_retries:
+                self._fail(delivery, smtplib.SMTPException(f"Gave up after {self.max_retries} retries"))
+            else:
+                attempts = max(attempts, delivery.attempts)
+        if attempts:
+            time.sleep(self.backoff(attempts - 1))
+            for delivery in deliveries:
+                if not delivery.future.done():
+                    self._count('retries')
+                    self._queue.put(delivery)
+
+    def _fail(self, delivery, error):
+        self._count('failed')
+        delivery.future.set_exception(error)
+
+    def _finish(self, delivery, reply, refused, retries):
+        code, message = reply
+        if code == 250:
+            self._count('sent')
+            delivery.future.set_result(refused)
+        elif 400 <= code < 500:
+            retries.append(delivery)
+        else:
+            self._fail(delivery, smtplib.SMTPResponseException(code, message))
+
+    def _send_batch(self, conn, batch):
+        # Returns the deliveries that hit a temporary (4xx) error
+        retries = []
+        if not conn.has_extn('pipelining'):
+            for delivery in batch:
+                try:
+                    self._finish(delivery, (250, b''), conn.sendmail(delivery.sender, delivery.recipients,
+                                                                     delivery.data), retries)
+                except smtplib.SMTPRecipientsRefused as e:
+                    code, message = next(iter(e.recipients.values()))
+                    self._finish(delivery, (code, message), {}, retries)
+                except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    self._finish(delivery, (e.smtp_code, e.smtp_error), {}, retries)
+            return retries
+
+        # RFC 2920: each envelope is written together with the previous message's content,
+        # so a batch of n messages takes about n + 1 round trips instead of 4n
+        in_flight, tail, reset = None, b'', False
+        for delivery in batch:
+            commands = [b'RSET'] if reset else []
+            commands.append(f'MAIL FROM:<{delivery.sender}>'.encode())
+            commands += [f'RCPT TO:<{recipient}>'.encode() for recipient in delivery.recipients]
+            commands.append(b'DATA')
+            conn.send(tail + b'\r\n'.join(commands) + b'\r\n')
+            if in_flight:
+                self._finish(in_flight[0], conn.getreply(), in_flight[1], retries)
+                in_flight = None
+            if reset:
+                conn.getreply()
+            mail = conn.getreply()
+            rcpts = [conn.getreply() for _ in delivery.recipients]
+            data = conn.getreply()
+            refused = {
+                recipient: reply for recipient, reply in zip(delivery.recipients, rcpts) if reply[0] not in (250, 251)
+            }
+            if data[0] == 354:
+                tail, in_flight, reset = _smtp_data(delivery.data) + b'.\r\n', (delivery, refused), False
+            else:
+                # Report the first real rejection rather than the DATA that followed it
+                first_error = next((reply for reply in [mail] + rcpts if reply[0] >= 400), data)
+                self._finish(delivery, first_error, refused, retries)
+                tail, reset = b'', True
+        if in_flight:
+            conn.send(tail)
+            self._finish(in_flight[0], conn.getreply(), in_flight[1], retries)
+        elif reset:
+            conn.rset()
+        self._count('pipelined', len(batch))
+        return retries
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_delivery_pool():
+    # One pool per process; a forked batch worker gets its own threads and connections
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool, _pool_pid = SMTPPool(), os.getpid()
+        return _pool
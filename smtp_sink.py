@@ -0,0 +1,181 @@
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.BaseRequestHandler):
+    # Just enough SMTP for smtplib: EHLO with PIPELINING and AUTH, and messages that are counted
+    # and then dropped. Replies are held until the client is waiting for them and then sent after
+    # `latency` seconds, so each client round trip costs what it would across a network.
+    def setup(self):
+        self.buffer = bytearray()
+        self.replies = []
+
+    def reply(self, line):
+        self.replies.append(line.encode() + b'\r\n')
+
+    def fill(self):
+        if self.replies:
+            if self.server.sink.latency:
+                time.sleep(self.server.sink.latency)
+            self.request.sendall(b''.join(self.replies))
+            self.replies.clear()
+        data = self.request.recv(65536)
+        if not data:
+            raise EOFError
+        self.buffer += data
+
+    def readline(self):
+        while (end := self.buffer.find(b'\r\n')) < 0:
+            self.fill()
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end + 2]
+        return line.decode(errors='replace')
+
+    def read_data(self):
+        if self.buffer.startswith(b'.\r\n'):
+            del self.buffer[:3]
+            return 0
+        searched = 0
+        while (end := self.buffer.find(b'\r\n.\r\n', searched)) < 0:
+            searched = max(0, len(self.buffer) - 4)
+            self.fill()
+        del self.buffer[:end + 5]
+        return end + 2
+
+    def handle(self):
+        try:
+            self.converse(self.server.sink)
+        except (EOFError, ConnectionError):
+            pass
+
+    def converse(self, sink):
+        self.reply('220 sink ESMTP')
+        recipients = 0
+        while True:
+            command = self.readline()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-sink')
+                if sink.pipelining:
+                    self.reply('250-PIPELINING')
+                self.reply('250-8BITMIME')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif verb == 'HELO':
+                self.reply('250 sink')
+            elif verb == 'AUTH':
+                if command.upper().startswith('AUTH LOGIN'):
+                    for _ in range(2 - len(command.split()[2:])):
+                        self.reply('334 ')
+                        self.readline()
+                self.reply('235 Authentication successful')
+            elif verb == 'RCPT':
+                if command.partition(':')[2].strip().strip('<>').lower() in sink.rejected:
+                    self.reply('550 No such user')
+                    continue
+                recipients += 1
+                self.reply('250 OK')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = 0
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                if sink.drop():
+                    # The replies so far go out, then the connection drops before this message
+                    self.request.sendall(b''.join(self.replies))
+                    return
+                if not recipients:
+                    self.reply('503 No valid recipients')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = self.read_data()
+                if sink.temp_failure_rate and random.random() < sink.temp_failure_rate:
+                    self.reply('451 Try again later')
+                else:
+                    sink.record(recipients, size)
+                    self.reply('250 OK')
+                recipients = 0
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                self.request.sendall(b''.join(self.replies))
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink:
+    # Local SMTP server for offline runs; counts what it receives. RCPT TO any of `rejected` gets a
+    # 550, and the first `drop_connections` DATA commands close their connection instead of a reply.
+    def __init__(self, host='127.0.0.1', port=0, latency=0, pipelining=True, temp_failure_rate=0, rejected=(),
+                 drop_connections=0):
+        self.latency = latency
+        self.pipelining = pipelining
+        self.temp_failure_rate = temp_failure_rate
+        self.rejected = {address.lower() for address in rejected}
+        self.drop_connections = drop_connections
+        self.server = socketserver.ThreadingTCPServer((host, port), SMTPSinkHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self.first_at = None
+        self.last_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def drop(self):
+        with self._lock:
+            if self.drop_connections:
+                self.drop_connections -= 1
+                return True
+            return False
+
+    def record(self, recipients, size):
+        with self._lock:
+            now = time.perf_counter()
+            self.first_at = self.first_at or now
+            self.last_at = now
+            self.messages += 1
+            self.recipients += recipients
+            self.bytes += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {'messages': self.messages, 'recipients': self.recipients, 'bytes': self.bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink that counts and discards messages")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--latency', type=float, default=0, help="Seconds added to every round trip")
+    args = parser.parse_args()
+    sink = SMTPSink(args.host, args.port, args.latency).start()
+    print(f"SMTP sink listening on {args.host}:{sink.address[1]}")
+    try:
+        while True:
+            time.sleep(10)
+            print(sink.stats())
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
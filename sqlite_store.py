@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+def _statements(script):
+    # Splits a migration at the semicolons that end statements, not ones inside quotes
+    statement = ''
+    for part in script.split(';'):
+        statement += part + ';'
+        if sqlite3.complete_statement(statement):
+            if statement.strip(' \n;'):
+                yield statement.strip()
+            statement = ''
+
+
+class SQLiteStore:
+    # One shared connection per store file; subclasses list their schema in MIGRATIONS
+    MIGRATIONS = []
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._lock = threading.Lock()
+        self._migrate()
+
+    def _migrate(self):
+        # One transaction per migration, with the user_version that records it, so a failed
+        # migration leaves the store as it was. executescript would commit before each script.
+        # BEGIN IMMEDIATE holds off other processes opening the store between reading the version
+        # and bumping it.
+        with self._lock:
+            while True:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+                    if version >= len(self.MIGRATIONS):
+                        self._conn.rollback()
+                        return
+                    for statement in _statements(self.MIGRATIONS[version]):
+                        self._conn.execute(statement)
+                    self._conn.execute(f'PRAGMA user_version = {version + 1}')
+                except BaseException:
+                    self._conn.rollback()
+                    raise
+                self._conn.commit()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, self._conn:
+            yield self._conn
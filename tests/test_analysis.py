@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processor import analyze_calendar_data
+from fake_provider import generate_events, synthetic_google_service
+
+
+@pytest.fixture(scope='module')
+def events():
+    service = synthetic_google_service(generate_events(2_000, seed=11, days=90))
+    service.authenticate()
+    return service.fetch_events(pd.Timestamp('2023-12-01').date(), pd.Timestamp('2024-04-30').date())
+
+
+@pytest.mark.parametrize('tz', ['UTC', 'Europe/Berlin'])
+def test_analysis_matches_groupbys(events, tz):
+    # The per-chart groupbys the dashboard ran before the shared analysis
+    df = events.astype({'category': object, 'duration': 'float64', 'attendees': 'int64'})
+    start = df['start'].dt.tz_convert(tz)
+    analysis = analyze_calendar_data(events, tz)
+
+    assert analysis.total_meetings == len(df)
+    assert analysis.total_duration == pytest.approx(df['duration'].sum())
+    assert analysis.avg_duration == pytest.approx(df['duration'].mean())
+    assert analysis.avg_attendees == pytest.approx(df['attendees'].mean())
+    assert analysis.max_attendees == df['attendees'].max()
+    assert analysis.meetings_by_day.to_dict() == df.groupby(start.dt.date).size().to_dict()
+    assert np.allclose(analysis.duration_by_day, df.groupby(start.dt.date)['duration'].sum())
+    assert analysis.meetings_by_category.to_dict() == df.groupby('category').size().to_dict()
+    assert np.allclose(analysis.duration_by_category, df.groupby('category')['duration'].sum())
+    assert analysis.meetings_by_hour[lambda hours: hours > 0].to_dict() == start.dt.hour.value_counts().to_dict()
+    assert analysis.meetings_by_attendees.to_dict() == df['attendees'].value_counts().to_dict()
+
+
+def test_empty_frame(events):
+    analysis = analyze_calendar_data(events.iloc[:0])
+    assert analysis.total_meetings == 0 and analysis.total_duration == 0 and analysis.max_attendees == 0
+    assert np.isnan(analysis.avg_duration) and analysis.meetings_by_day.empty
+    assert analysis.meetings_by_hour.sum() == 0 and len(analysis.meetings_by_hour) == 24
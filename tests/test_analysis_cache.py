@@ -0,0 +1,123 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from analysis_cache import AnalysisCache, dashboard_key
+from event_store import EventStore
+from fake_provider import generate_events, synthetic_google_service
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = AnalysisCache(max_entries=4, max_bytes=100, ttl=10, clock=clock)
+    cache.put('a', 'dashboard', nbytes=1)
+    clock.now = 10
+    assert cache.get('a') == 'dashboard'
+    clock.now = 10.5
+    assert cache.get('a') is None and len(cache) == 0 and cache.bytes == 0
+    assert cache.stats() == dict(hits=1, misses=1, expired=1, evicted=0, invalidated=0, entries=0, mib=0.0)
+
+
+def test_least_recently_used_go_first():
+    cache = AnalysisCache(max_entries=2, max_bytes=100, ttl=60, clock=Clock())
+    cache.put('a', 'A', nbytes=10)
+    cache.put('b', 'B', nbytes=10)
+    assert cache.get('a') == 'A'
+    cache.put('c', 'C', nbytes=10)
+    assert cache.get('b') is None and cache.get('a') == 'A' and cache.get('c') == 'C'
+    assert cache.counters['evicted'] == 1 and cache.bytes == 20
+
+
+def test_byte_bound():
+    cache = AnalysisCache(max_entries=10, max_bytes=100, ttl=60, clock=Clock())
+    for key in 'abc':
+        cache.put(key, key.upper(), nbytes=40)
+    assert len(cache) == 2 and cache.bytes == 80 and cache.get('a') is None
+
+    # Too big for the cache on its own: not stored, and nothing else is pushed out for it
+    cache.put('huge', 'H', nbytes=101)
+    assert cache.get('huge') is None and len(cache) == 2 and cache.bytes == 80
+
+    # Storing a key again replaces its size
+    cache.put('b', 'B', nbytes=60)
+    assert cache.bytes == 100 and len(cache) == 2
+
+
+def test_invalidate_and_clear():
+    cache = AnalysisCache(max_entries=10, max_bytes=100, ttl=60, clock=Clock())
+    cache.put('a', 'A', nbytes=1)
+    cache.put('b', 'B', nbytes=1)
+    cache.invalidate('a')
+    cache.invalidate('missing')
+    assert cache.get('a') is None and cache.counters['invalidated'] == 1
+    cache.clear()
+    assert len(cache) == 0 and cache.bytes == 0 and cache.counters['invalidated'] == 2
+
+
+@pytest.fixture
+def service(tmp_path):
+    items = generate_events(200, seed=5, days=14)
+    service = synthetic_google_service(items, store=EventStore(str(tmp_path / 'events.sqlite3')))
+    service.authenticate()
+    return service
+
+
+def test_key_follows_synced_changes(service):
+    window = (date(2024, 1, 1), date(2024, 1, 14))
+    service.fetch_events(*window)
+    key = dashboard_key(service, *window)
+    # A sync that finds nothing new keeps the key
+    service.fetch_events(*window)
+    assert dashboard_key(service, *window) == key
+
+    service.http_fake.update(generate_events(1, seed=-1, days=14, prefix='new'))
+    service.fetch_events(*window)
+    changed = dashboard_key(service, *window)
+    assert changed != key and changed[:-1] == key[:-1]
+
+
+def test_key_without_a_store():
+    service = synthetic_google_service(generate_events(10, seed=1))
+    assert dashboard_key(service, 'start', 'end')[-1] is None
+
+
+def test_dashboard_reruns_come_from_the_cache(tmp_path, monkeypatch):
+    # What the dashboard shows on reruns, and after a sync elsewhere brings a new meeting
+    from streamlit.testing.v1 import AppTest
+
+    from utils import get_last_week_date_range
+
+    monkeypatch.setenv('GOOGLE_CLIENT_ID', 'client-id')
+    monkeypatch.setenv('GOOGLE_CLIENT_SECRET', 'client-secret')
+    start_date, _ = get_last_week_date_range()
+    items = generate_events(300, seed=7, start=start_date, days=7)
+    service = synthetic_google_service(items, store=EventStore(str(tmp_path / 'events.sqlite3')))
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'main.py'), default_timeout=120)
+    app.session_state['calendar_service'] = service
+    app.session_state['page'] = 'Dashboard'
+
+    def shown():
+        app.run()
+        assert not app.exception and not app.error, (app.exception, app.error)
+        return [metric.value for metric in app.metric]
+
+    first = shown()
+    calls = service.http_fake.calls
+    for _ in range(3):
+        assert shown() == first
+    assert service.http_fake.calls == calls
+    cache = app.session_state['analysis_cache']
+    assert cache.counters['hits'] == 3 and len(cache) == 1
+
+    service.http_fake.update(generate_events(1, seed=-1, start=start_date, days=7, prefix='new'))
+    service.fetch_events(start_date, start_date + timedelta(days=1))
+    assert int(shown()[0]) == int(first[0]) + 1
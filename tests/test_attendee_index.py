@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from attendee_index import build_attendee_index, internal_external, pair_hours, top_collaborators
+from event_schema import join_addresses
+
+EVENTS = pd.DataFrame({
+    'attendee_emails': ['a@corp.example\nb@corp.example', 'A@corp.example\na@corp.example\nc@client.example',
+                        None, 'b@corp.example\nB@CORP.example', 'a@corp.example\nb@corp.example'],
+    'duration': [1.0, 2.0, 0.5, 0.25, 1.5],
+})
+
+
+def exploded():
+    # One row per event and distinct attendee, the way the index should count them
+    rows = EVENTS.assign(attendee=EVENTS['attendee_emails'].str.lower().str.split('\n')).explode('attendee')
+    return rows.dropna(subset=['attendee']).reset_index().drop_duplicates(['index', 'attendee'])
+
+
+def test_attendees_named_twice_count_once():
+    index = build_attendee_index(EVENTS)
+    top = top_collaborators(index)
+    expected = exploded().groupby('attendee').agg(meetings=('index', 'size'), hours=('duration', 'sum'))
+    pd.testing.assert_frame_equal(top[['meetings', 'hours']].sort_index(), expected.rename_axis('attendee'),
+                                  check_dtype=False)
+    assert index.unlisted_meetings == 1 and index.unlisted_hours == 0.5
+
+
+def test_pair_hours():
+    index = build_attendee_index(EVENTS)
+    pairs = pair_hours(index).set_index(['first', 'second'])
+    assert pairs.loc[('a@corp.example', 'b@corp.example')].tolist() == [2, 2.5]
+    assert pairs.loc[('a@corp.example', 'c@client.example')].tolist() == [1, 2.0]
+    # b's list with itself twice is one person, so no pair
+    assert len(pairs) == 2
+    assert pair_hours(index, n=0).empty
+    assert pair_hours(index, exclude='A@corp.example').empty
+
+
+def test_internal_external():
+    table = internal_external(build_attendee_index(EVENTS))
+    assert table['meetings'].tolist() == [3, 1, 1]
+    assert np.allclose(table['hours'], [2.75, 2.0, 0.5])
+
+
+def test_large_shared_lists_match_explode():
+    # Team lists shared by many events, per-event lists and a few very large ones, as the benchmark builds them
+    rng = np.random.default_rng(0)
+    people = np.array([f'person{j}@org{j % 20}.example' for j in range(2_000)], dtype=object)
+    shared = [join_addresses(people[:k].tolist()) for k in (0, 3, 8, 120)]
+    emails = [shared[rng.integers(len(shared))] if rng.random() < 0.5 else
+              join_addresses(people[rng.choice(len(people), rng.choice([2, 12, 250]), replace=False)].tolist())
+              for _ in range(3_000)]
+    df = pd.DataFrame({'attendee_emails': pd.Categorical(emails), 'duration': rng.random(3_000).astype('float32')})
+    top = top_collaborators(build_attendee_index(df), n=50)
+
+    addresses = df['attendee_emails'].astype(object).str.lower().str.split('\n').explode()
+    naive = df['duration'].astype('float64').reindex(addresses.index).groupby(addresses.to_numpy()).sum()
+    assert np.allclose(naive[top.index].to_numpy(), top['hours'].to_numpy())
+    assert np.allclose(naive.nlargest(50).to_numpy(), top['hours'].to_numpy())
@@ -0,0 +1,68 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from categorizer import DEFAULT_CATEGORY, DEFAULT_RULES, Categorizer
+
+RULES = DEFAULT_RULES + [
+    {'category': 'Vendor', 'regexes': [r'\bpo-\d+\b'], 'organizer_domains': ['Vendor.example']},
+    {'category': 'All hands', 'keywords': ['all hands'], 'min_attendees': 20},
+    {'category': '1:1', 'regexes': ['1:1|one on one'], 'max_attendees': 2},
+]
+SUMMARIES = [
+    'Project sync', 'PROJECT kickoff', 'team standup', 'Client call', 'Customer demo', 'Interview', 'Workshop',
+    'Lunch', '', None, np.nan, 'Straße planning', 'Kundentermin CLIENT', 'İnterview', 'ÅLL HANDS', 'All Hands',
+    'clie\0nt', 'project\0', '\0team', 'proj', 'ect', 'Review PO-1234', 'po-12 follow up', '1:1', 'One on One',
+    'cliënt call', 'Trainingsplan 📈', 'x' * 500 + 'workshop',
+]
+
+
+def reference(summary, attendees, organizer):
+    # The rules checked one by one on one event
+    text = summary.lower() if isinstance(summary, str) else None
+    domain = organizer.rpartition('@')[2].lower() if organizer else ''
+    for rule in RULES:
+        if rule.get('keywords') or rule.get('regexes'):
+            if text is None:
+                continue
+            keyword = any(k.lower() in text for k in rule.get('keywords', []))
+            if not keyword and not any(re.search(r, text, re.IGNORECASE) for r in rule.get('regexes', [])):
+                continue
+        if rule.get('organizer_domains') and domain not in [d.lower() for d in rule['organizer_domains']]:
+            continue
+        if attendees < rule.get('min_attendees', attendees) or attendees > rule.get('max_attendees', attendees):
+            continue
+        return rule['category']
+    return DEFAULT_CATEGORY
+
+
+@pytest.mark.parametrize('distinct', [False, True])
+def test_categorize_matches_rules_checked_per_event(distinct):
+    rng = np.random.default_rng(0)
+    n = 2_000
+    summaries = [SUMMARIES[i] for i in rng.integers(0, len(SUMMARIES), n)]
+    if distinct:
+        # Mostly distinct summaries take the per-row path instead of factorizing
+        summaries = [f'{s} #{i}' if isinstance(s, str) else s for i, s in enumerate(summaries)]
+    df = pd.DataFrame({
+        'summary': summaries,
+        'attendees': rng.integers(0, 40, n),
+        'organizer': rng.choice(['a@vendor.example', 'b@example.com', None], n),
+    })
+    expected = [reference(*row) for row in df[['summary', 'attendees', 'organizer']].itertuples(index=False)]
+    assert Categorizer(RULES).categorize(df).tolist() == expected
+
+
+def test_keywords_do_not_match_across_summaries():
+    categorizer = Categorizer(DEFAULT_RULES)
+    df = pd.DataFrame({'summary': ['proj', 'ect', 'cli', 'ent'], 'attendees': 0})
+    assert categorizer.categorize(df).tolist() == [DEFAULT_CATEGORY] * 4
+
+
+def test_rules_without_text_conditions():
+    categorizer = Categorizer([{'category': 'Big', 'min_attendees': 10}])
+    df = pd.DataFrame({'summary': ['Project', None], 'attendees': [12, 3]})
+    assert categorizer.categorize(df).tolist() == ['Big', DEFAULT_CATEGORY]
+    assert Categorizer([]).categorize(df).tolist() == [DEFAULT_CATEGORY] * 2
@@ -0,0 +1,119 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from google.auth.exceptions import RefreshError
+
+from client_cache import ClientCache
+
+
+class Credentials:
+    # Just what the cache reads: identity, expiry and refresh()
+    def __init__(self, name, expires_in=timedelta(hours=1), error=None):
+        self.client_id, self.refresh_token, self.token = 'client', name, f'{name}-token'
+        self.expiry = datetime.utcnow() + expires_in
+        self.error = error
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        if self.error is not None:
+            raise self.error
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cache(**options):
+    return ClientCache(factory=lambda credentials: object(), **options)
+
+
+def test_reuses_a_client_per_account():
+    clients = cache()
+    first = clients.get(Credentials('a'))
+    assert clients.get(Credentials('a')) is first
+    assert clients.get(Credentials('b')) is not first
+
+
+def test_least_recently_used_go_first():
+    clients = cache(max_entries=2)
+    a, b = Credentials('a'), Credentials('b')
+    client_a, client_b = clients.get(a), clients.get(b)
+    clients.get(a)
+    clients.get(Credentials('c'))
+    assert len(clients) == 2 and clients.get(a) is client_a
+    assert clients.get(b) is not client_b
+
+
+def test_idle_clients_are_dropped():
+    clock = Clock()
+    clients = cache(idle_seconds=60, clock=clock)
+    a = Credentials('a')
+    client = clients.get(a)
+    clock.now = 30
+    assert clients.get(a) is client
+    clock.now = 100
+    clients.get(Credentials('b'))
+    assert len(clients) == 1
+    assert clients.get(a) is not client
+
+
+def eventually(condition, timeout=2.0):
+    # The refresher thread runs on its own; give it a moment
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_tokens_refresh_in_the_background_before_expiry():
+    clients = cache(refresh_margin=timedelta(minutes=5))
+    fresh, expiring = Credentials('a'), Credentials('b', expires_in=timedelta(minutes=2))
+    clients.get(fresh)
+    started = time.monotonic()
+    clients.get(expiring)
+    # The request that finds the token near expiry doesn't wait for the refresh
+    assert time.monotonic() - started < 0.1
+    assert eventually(lambda: expiring.refreshes == 1)
+    assert expiring.expiry > datetime.utcnow() + timedelta(minutes=30)
+    time.sleep(0.05)
+    assert (fresh.refreshes, expiring.refreshes) == (0, 1)
+
+
+def test_requests_use_the_cached_credentials():
+    clients = cache()
+    cached = Credentials('a')
+    clients.get(cached)
+    assert clients.entry(Credentials('a')).credentials is cached
+
+
+def test_revoked_grant_drops_the_client():
+    clients = cache()
+    clients.get(Credentials('a', expires_in=timedelta(0), error=RefreshError('invalid_grant')))
+    assert eventually(lambda: len(clients) == 0)
+
+
+def test_transient_refresh_failure_keeps_the_client_and_retries_later():
+    clients = cache()
+    flaky = Credentials('a', expires_in=timedelta(minutes=2), error=ConnectionError('reset'))
+    client = clients.get(flaky)
+    assert eventually(lambda: flaky.refreshes == 1)
+    time.sleep(0.05)
+    assert clients.get(flaky) is client and flaky.refreshes == 1
+
+
+def test_idle_clients_are_not_refreshed():
+    clock = Clock()
+    clients = cache(refresh_margin=timedelta(minutes=5), idle_seconds=60, clock=clock)
+    # Due for refresh in a fifth of a second, by which time it has gone idle
+    idle = Credentials('a', expires_in=timedelta(minutes=5, seconds=0.2))
+    clients.get(idle)
+    clock.now = 100
+    assert eventually(lambda: len(clients) == 0)
+    assert idle.refreshes == 0
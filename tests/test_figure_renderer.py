@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from figure_renderer import FigureRenderer
+
+
+def test_renders_in_worker_processes_and_caches():
+    figs = [go.Figure(go.Bar(x=['a', 'b'], y=[i, i + 1]), layout={'title': {'text': f'Figure {i}'}}) for i in range(3)]
+    renderer = FigureRenderer(workers=2)
+    try:
+        images = renderer.render(figs, image_format='png')
+        assert images == [pio.to_image(fig, format='png') for fig in figs]
+        assert renderer.render(figs, image_format='png') == images
+        assert [timing['cached'] for timing in renderer.timings] == [True] * 3
+    finally:
+        renderer.close()
+
+
+BATCH_WORKER = """
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.graph_objects as go
+
+from figure_renderer import renderer
+
+
+def report(_):
+    # What a batch worker does: renders and leaves the render processes running
+    return len(renderer.render([go.Figure(go.Bar(y=[1, 2]))])[0])
+
+
+if __name__ == '__main__':
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('fork')) as pool:
+        print(pool.submit(report, 0).result() > 0)
+"""
+
+
+def test_worker_process_exits_with_render_processes_running(tmp_path):
+    script = tmp_path / 'batch_worker.py'
+    script.write_text(BATCH_WORKER)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, str(script)], env=dict(os.environ, PYTHONPATH=root),
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0 and result.stdout.split() == ['True'], result.stderr
@@ -0,0 +1,46 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from calendar_services import merge_event_batches
+from data_processor import analyze_calendar_data
+from fake_provider import generate_events, synthetic_google_service
+from incremental_analysis import IncrementalAnalysis
+from tests.test_rollups import assert_same_analysis
+
+WINDOW = (date(2024, 1, 1), date(2024, 12, 31))
+
+
+@pytest.mark.parametrize('time_zone', [None, 'America/New_York'])
+def test_progressive_result_equals_batch_result(time_zone):
+    # Two calendars of several pages each, sharing some invitations
+    events = generate_events(3_000, seed=11)
+    calendars = {'primary': events[:2_000], 'team@example.com': events[1_500:]}
+    service = synthetic_google_service(calendars=calendars, calendar_ids=list(calendars), max_results=400)
+    service.time_zone = time_zone or service.time_zone
+    df = service.fetch_events(*WINDOW)
+    analysis = analyze_calendar_data(df, time_zone)
+
+    incremental = IncrementalAnalysis(time_zone)
+    for position, batch in service.iter_events(*WINDOW):
+        incremental.add(position, batch)
+        # The figures so far are those of the events so far, copies counted once
+        assert_same_analysis(incremental.analysis(),
+                             analyze_calendar_data(merge_event_batches(incremental.batches), time_zone))
+    assert len(incremental.batches) > 2
+    assert incremental.events == len(df)
+
+    streamed_df, streamed = incremental.result()
+    pd.testing.assert_frame_equal(streamed_df, df)
+    assert_same_analysis(incremental.analysis(), analysis)
+    assert_same_analysis(streamed, analysis)
+
+
+def test_analysis_before_any_batch_is_empty():
+    analysis = IncrementalAnalysis().analysis()
+    assert analysis.total_meetings == 0 and analysis.meetings_by_day.empty
+    assert np.isnan(analysis.avg_duration)
+    df, analysis = IncrementalAnalysis().result()
+    assert df.empty and analysis.total_meetings == 0
@@ -0,0 +1,118 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processor import (
+    FOCUS_BLOCK_MINUTES, WORKDAY_END_HOUR, WORKDAY_START_HOUR, _overlapping, analyze_calendar_data, analyze_intervals
+)
+
+DAY = 86400
+
+
+def frame(intervals):
+    # (start, end) epoch seconds -> an event frame as fetch_events returns it
+    start = pd.to_datetime([s for s, _ in intervals], unit='s', utc=True)
+    end = pd.to_datetime([e for _, e in intervals], unit='s', utc=True)
+    return pd.DataFrame({'start': start, 'end': end, 'duration': (end - start).total_seconds() / 3600,
+                         'attendees': 1, 'category': 'Other'})
+
+
+def timed(start, end):
+    # What the analysis counts as a meeting: a length, and not whole UTC days (all-day events)
+    return (end > start) & ((start % DAY != 0) | ((end - start) % DAY != 0))
+
+
+def pairwise(start, end):
+    # Every meeting against every other; touching meetings don't overlap
+    meeting = timed(start, end)
+    overlaps = (start[:, None] < end[None, :]) & (start[None, :] < end[:, None]) & meeting[:, None] & meeting[None, :]
+    np.fill_diagonal(overlaps, False)
+    return overlaps.any(axis=1), int(overlaps.sum()) // 2
+
+
+def depth_hours(start, end, low, high):
+    # Hours within [low, high) covered by at least one and by at least two meetings
+    meeting = timed(start, end)
+    start, end = start[meeting], end[meeting]
+    points = np.unique(np.concatenate([start, end, [low, high]]).clip(low, high))
+    depth = np.array([((start <= a) & (a < end)).sum() for a in points[:-1]])
+    span = np.diff(points) / 3600
+    return span[depth > 0].sum(), span[depth > 1].sum(), span[depth == 0]
+
+
+def random_intervals(seed, n=300):
+    # Quarter-hour grid over two weeks so starts and ends often coincide, with zero-length
+    # meetings and all-day events mixed in
+    rng = np.random.default_rng(seed)
+    start = 19_783 * DAY + rng.integers(0, 14 * 96, n) * 900
+    end = start + rng.integers(0, 12, n) * 900
+    all_day = rng.random(n) < 0.1
+    start[all_day] -= start[all_day] % DAY
+    end[all_day] = start[all_day] + rng.integers(1, 3, all_day.sum()) * DAY
+    return start, end
+
+
+EDGE_CASES = [
+    [(3600, 7200), (7200, 9000)],                       # touching
+    [(3600, 7200), (5400, 5400), (7200, 7200)],         # zero-length inside and at the end of a meeting
+    [(DAY, 2 * DAY), (DAY + 3600, DAY + 7200)],         # a meeting on an all-day event
+    [(DAY, 3 * DAY), (DAY, 3 * DAY)],                   # two all-day events
+    [(DAY, 2 * DAY + 1), (DAY + 3600, DAY + 7200)],     # a day and a second is a meeting
+    [(3600, 7200), (3600, 7200), (3600, 7200)],         # identical
+    [(3600, 36000), (7200, 9000), (9000, 10800)],       # nested, touching each other
+]
+
+
+@pytest.mark.parametrize('intervals', EDGE_CASES + [list(zip(*random_intervals(seed))) for seed in range(5)])
+def test_overlaps_match_pairwise_reference(intervals):
+    start, end = (np.array(values, dtype=np.int64) for values in zip(*intervals))
+    overlapping, pairs = pairwise(start, end)
+    intervals = analyze_intervals(frame(list(zip(start, end))))
+    assert (intervals.overlapping.to_numpy() == overlapping).all()
+    assert intervals.overlapping_pairs == pairs
+    assert intervals.overlapping_meetings == overlapping.sum()
+    busy, double_booked, _ = depth_hours(start, end, start.min(), end.max())
+    assert intervals.busy_hours == pytest.approx(busy)
+    assert intervals.double_booked_hours == pytest.approx(double_booked)
+
+    meeting = timed(start, end)
+    assert (_overlapping(start[meeting], end[meeting]) == overlapping[meeting]).all()
+
+
+@pytest.mark.parametrize('tz', ['UTC', 'America/New_York', 'Asia/Kolkata'])
+@pytest.mark.parametrize('seed', range(3))
+def test_working_hours_match_reference(tz, seed):
+    start, end = random_intervals(seed)
+    first, last = date(2024, 3, 1), date(2024, 3, 14)  # across the US change to daylight time
+    intervals = analyze_intervals(frame(list(zip(start, end))), first, last, tz)
+    zone = ZoneInfo(tz)
+    weekdays = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    weekdays = [day for day in weekdays if day.weekday() < 5]
+    assert list(intervals.by_day.index) == weekdays
+    for day in weekdays:
+        low, high = (int(datetime(day.year, day.month, day.day, hour, tzinfo=zone).timestamp())
+                     for hour in (WORKDAY_START_HOUR, WORKDAY_END_HOUR))
+        busy, double_booked, free = depth_hours(start, end, low, high)
+        row = intervals.by_day.loc[day]
+        assert row['busy'] == pytest.approx(busy)
+        assert row['double_booked'] == pytest.approx(double_booked)
+        assert row['free'] == pytest.approx(free.sum())
+        assert row['longest_free'] == pytest.approx(free.max(initial=0))
+        assert row['focus'] == pytest.approx(free[free * 60 >= FOCUS_BLOCK_MINUTES].sum())
+
+
+def test_days_and_hours_are_local():
+    # 16:00-17:30 in New York on Friday 15 March 2024 is 20:00-21:30 UTC; 22:30 there is the 16th in UTC
+    meetings = [((2024, 3, 15, 20), (2024, 3, 15, 21, 30)), ((2024, 3, 16, 2, 30), (2024, 3, 16, 3))]
+    df = frame([tuple(int(datetime(*t, tzinfo=timezone.utc).timestamp()) for t in meeting) for meeting in meetings])
+
+    local = analyze_intervals(df, date(2024, 3, 15), date(2024, 3, 15), 'America/New_York')
+    assert local.by_day.loc[date(2024, 3, 15), 'busy'] == pytest.approx(1.0)
+    assert analyze_intervals(df, date(2024, 3, 15), date(2024, 3, 15), 'UTC').by_day['busy'].sum() == 0
+
+    analysis = analyze_calendar_data(df, 'America/New_York')
+    assert analysis.meetings_by_day.to_dict() == {date(2024, 3, 15): 2}
+    assert analysis.meetings_by_hour[lambda hours: hours > 0].to_dict() == {16: 1, 22: 1}
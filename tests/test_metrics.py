@@ -0,0 +1,109 @@
+import json
+import logging
+import time
+import urllib.request
+
+import pytest
+
+from metrics import METRIC_PREFIX, STAGE_BUCKETS, Metrics, start_metrics_server
+
+
+def counter(snapshot, name, **labels):
+    labels = {key: str(value) for key, value in labels.items()}
+    return sum(c['value'] for c in snapshot['counters'] if c['name'] == name and c['labels'] == labels)
+
+
+def test_stage_times_and_counts():
+    metrics = Metrics(enabled=True)
+    for events in (10, 5):
+        with metrics.stage('parse', provider='google') as stage:
+            stage['events'] = events
+    with pytest.raises(KeyError):
+        with metrics.stage('parse', provider='google'):
+            raise KeyError('boom')
+
+    snapshot = metrics.snapshot()
+    assert counter(snapshot, 'stage_events_total', stage='parse', provider='google') == 15
+    assert counter(snapshot, 'stage_errors_total', stage='parse', provider='google') == 1
+    [histogram] = snapshot['histograms']
+    assert histogram['labels'] == {'provider': 'google', 'stage': 'parse'} and histogram['count'] == 3
+    assert histogram['buckets'][STAGE_BUCKETS[-1]] == 3
+
+    metrics.reset()
+    assert metrics.snapshot() == {'counters': [], 'histograms': []}
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics(enabled=True)
+    for seconds in (0.001, 0.02, 0.3, 100):
+        metrics.observe('stage_seconds', seconds, stage='render')
+    [histogram] = metrics.snapshot()['histograms']
+    assert histogram['buckets'][0.005] == 1 and histogram['buckets'][0.025] == 2
+    assert histogram['buckets'][0.5] == 3 and histogram['buckets'][60.0] == 3
+    assert histogram['count'] == 4 and histogram['sum'] == pytest.approx(100.321)
+
+
+def test_disabled_records_nothing():
+    metrics = Metrics(enabled=False, log_json=False)
+    with metrics.stage('parse') as first:
+        first['events'] = 10
+    # A fresh dict each time, so what one caller stored never shows up for the next
+    with metrics.stage('parse') as second:
+        assert second == {}
+    metrics.count('calls')
+    metrics.observe('stage_seconds', 1.0, stage='parse')
+    assert metrics.snapshot() == {'counters': [], 'histograms': []}
+
+
+def test_prometheus_text():
+    metrics = Metrics(enabled=True)
+    metrics.count('api_calls_total', 2, provider='goo"gle')
+    metrics.observe('stage_seconds', 0.2, stage='fetch')
+    lines = metrics.render_prometheus().splitlines()
+    assert f'# TYPE {METRIC_PREFIX}_api_calls_total counter' in lines
+    assert f'{METRIC_PREFIX}_api_calls_total{{provider="goo\\"gle"}} 2' in lines
+    assert f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="fetch",le="0.1"}} 0' in lines
+    assert f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="fetch",le="0.25"}} 1' in lines
+    assert f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="fetch",le="+Inf"}} 1' in lines
+    assert f'{METRIC_PREFIX}_stage_seconds_count{{stage="fetch"}} 1' in lines
+
+
+def test_json_log_lines(caplog):
+    metrics = Metrics(enabled=True, log_json=True)
+    with caplog.at_level(logging.INFO, logger='metrics'):
+        with metrics.stage('aggregate', source='events') as stage:
+            stage['events'] = 3
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record['stage'] == 'aggregate' and record['source'] == 'events' and record['events'] == 3
+    assert record['status'] == 'ok' and record['seconds'] >= 0
+
+
+def test_slow_blocks_are_profiled(tmp_path):
+    metrics = Metrics(enabled=False, profile_seconds=0.01, profile_dir=str(tmp_path))
+    with metrics.profile('fast'):
+        pass
+    with metrics.profile('slow'):
+        # Nested profiles are part of the outer one
+        with metrics.profile('inner'):
+            time.sleep(0.02)
+    assert [path.name.split('-')[0] for path in tmp_path.iterdir()] == ['slow']
+
+
+def test_server(monkeypatch):
+    import metrics as module
+
+    monkeypatch.setattr(module, 'metrics', Metrics(enabled=True))
+    monkeypatch.setattr(module, '_server', None)
+    module.metrics.count('calls')
+    server = start_metrics_server(port=0)
+    try:
+        assert start_metrics_server(port=0) is server
+        host, port = server.server_address
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        text = opener.open(f'http://{host}:{port}/metrics', timeout=5).read().decode()
+        assert f'{METRIC_PREFIX}_calls 1' in text.splitlines()
+        data = json.loads(opener.open(f'http://{host}:{port}/metrics.json', timeout=5).read())
+        assert data['counters'] == [{'name': 'calls', 'labels': {}, 'value': 1}]
+    finally:
+        server.shutdown()
+        server.server_close()
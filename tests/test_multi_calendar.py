@@ -0,0 +1,40 @@
+from datetime import date
+
+from calendar_services import SELECTED_CALENDARS, merge_calendar_frames
+from event_schema import EVENT_COLUMNS
+from event_store import EventStore
+from fake_provider import generate_events, synthetic_apple_service, synthetic_google_service
+
+WINDOW = (date(2023, 12, 31), date(2027, 12, 31))
+
+
+def test_no_calendars_give_an_empty_typed_frame():
+    calendars = {f'cal{c}@example.com': generate_events(20, seed=c, prefix=f'cal{c}x') for c in range(2)}
+    typed = synthetic_google_service(calendars=calendars, calendar_ids=list(calendars)).fetch_events(*WINDOW)
+    empty = merge_calendar_frames([])
+    assert list(empty.columns) == EVENT_COLUMNS + ['attendee_emails']
+    assert empty.empty and empty.dtypes.astype(str).to_dict() == typed.dtypes.astype(str).to_dict()
+
+
+def test_services_without_calendars_return_nothing():
+    service = synthetic_google_service([], calendar_ids=[])
+    assert service.fetch_events(*WINDOW).empty
+    assert list(service.iter_events(*WINDOW)) == []
+    stored = synthetic_google_service([], calendar_ids=[], store=EventStore(':memory:'), user_id='test')
+    assert stored.fetch_analysis(*WINDOW).total_meetings == 0
+
+
+def test_apple_account_without_calendars():
+    service = synthetic_apple_service([], calendar_ids=SELECTED_CALENDARS)
+    service.list_calendars = lambda: []
+    assert service.fetch_events(*WINDOW).empty
+
+
+def test_calendars_are_merged_and_invitations_kept_once():
+    events = generate_events(200, seed=3)
+    calendars = {'primary': events[:150], 'team@example.com': events[100:]}
+    merged = synthetic_google_service(calendars=calendars, calendar_ids=list(calendars)).fetch_events(*WINDOW)
+    single = synthetic_google_service(events).fetch_events(*WINDOW)
+    assert len(merged) == len(single) == 200
+    assert merged['start'].is_monotonic_increasing
+    assert (merged['calendar_id'] == 'team@example.com').sum() == 50
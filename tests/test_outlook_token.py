@@ -0,0 +1,58 @@
+import time
+
+import pytest
+import streamlit as st
+from requests_oauthlib import OAuth2Session
+
+import auth
+import event_store
+from fake_provider import generate_events, synthetic_outlook_service
+
+
+@pytest.fixture
+def refreshed(monkeypatch):
+    # The token endpoint hands out a new access token and, as Microsoft does, a new refresh token
+    monkeypatch.setenv('MICROSOFT_CLIENT_ID', 'client-id')
+    monkeypatch.setenv('MICROSOFT_CLIENT_SECRET', 'client-secret')
+    calls = []
+
+    def refresh_token(session, token_url, **kwargs):
+        calls.append(session.token['refresh_token'])
+        return {'access_token': f'access-{len(calls)}', 'refresh_token': f'refresh-{len(calls)}',
+                'expires_at': time.time() + 3600}
+
+    monkeypatch.setattr(OAuth2Session, 'refresh_token', refresh_token)
+    return calls
+
+
+def test_refreshed_token_is_handed_back(refreshed):
+    saved = []
+    service = synthetic_outlook_service(generate_events(10, seed=1), user_id='test', on_token_refresh=saved.append)
+    service.token = {'access_token': 'access-0', 'refresh_token': 'refresh-0', 'expires_at': time.time() + 10}
+    sent = []
+    request = service.http_fake.request
+    service.http_fake.request = lambda uri, *args, headers=None, **kwargs: (
+        sent.append(headers['Authorization']), request(uri, *args, headers=headers, **kwargs))[1]
+
+    service.authenticate()
+    service.list_calendars()
+    assert refreshed == ['refresh-0']
+    assert saved == [service.token] and saved[0]['refresh_token'] == 'refresh-1'
+    assert sent and set(sent) == {'Bearer access-1'}
+
+    # Still valid: no second refresh
+    service.authenticate()
+    assert refreshed == ['refresh-0'] and len(saved) == 1
+
+
+def test_auth_keeps_the_refreshed_token_in_the_session(refreshed, monkeypatch):
+    monkeypatch.setattr(event_store, 'get_event_store', lambda: None)
+    st.session_state.outlook_token = {'access_token': 'access-0', 'refresh_token': 'refresh-0',
+                                      'expires_at': time.time() + 10}
+    service = auth.outlook_calendar_service(st.session_state.outlook_token)
+    assert service.on_token_refresh is auth.save_outlook_token
+    try:
+        service._refresh_token()
+        assert st.session_state.outlook_token['refresh_token'] == 'refresh-1'
+    finally:
+        del st.session_state.outlook_token
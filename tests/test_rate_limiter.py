@@ -0,0 +1,88 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from rate_limiter import RateLimiter, TokenBucket, google_retry_delay
+
+
+def http_error(status, content=b'', retry_after=None):
+    headers = {'status': status}
+    if retry_after is not None:
+        headers['retry-after'] = retry_after
+    return HttpError(httplib2.Response(headers), content)
+
+
+@pytest.mark.parametrize('error, delay', [
+    (http_error(429), 0),
+    (http_error(503, retry_after='2'), 2),
+    (http_error(500, retry_after='soon'), 0),
+    (http_error(403, b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'), 0),
+    (http_error(403, b'{"error": {"errors": [{"reason": "forbidden"}]}}'), None),
+    (http_error(404), None),
+    (http_error(410), None),
+    (ConnectionResetError(), 0),
+    (TimeoutError(), 0),
+    (ValueError(), None),
+])
+def test_google_retry_delay(error, delay):
+    assert google_retry_delay(error) == delay
+
+
+def limiter(**options):
+    # Rates high enough that the buckets never make a test wait
+    return RateLimiter(project_rate=1e6, user_rate=1e6, base_delay=0, **options)
+
+
+def failing(errors, result='ok'):
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return call
+
+
+def test_retries_until_the_call_succeeds():
+    calls = limiter(max_retries=3)
+    assert calls.call('user', failing([http_error(429), http_error(503)])) == 'ok'
+    assert calls.stats() == {'calls': 3, 'retries': 2}
+
+
+def test_gives_up_after_max_retries():
+    calls = limiter(max_retries=2)
+    with pytest.raises(HttpError):
+        calls.call('user', failing([http_error(503)] * 3))
+    assert calls.stats() == {'calls': 3, 'retries': 2, 'failures': 1}
+
+
+def test_does_not_retry_client_errors():
+    calls = limiter(max_retries=5)
+    with pytest.raises(HttpError):
+        calls.call('user', failing([http_error(404)]))
+    assert calls.stats() == {'calls': 1, 'failures': 1}
+
+
+def test_backoff_waits_at_least_retry_after():
+    calls = RateLimiter(project_rate=1, user_rate=1, base_delay=0.5, max_delay=4)
+    assert all(calls.backoff(attempt, 3) >= 3 for attempt in range(10))
+    assert all(0 <= calls.backoff(attempt) <= 4 for attempt in range(10))
+
+
+def test_token_bucket_throttles_past_capacity():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    # The third token is a tenth of a second away, the fourth two tenths
+    assert 0.05 < bucket.reserve() <= 0.1
+    assert 0.15 < bucket.reserve() <= 0.2
+
+
+def test_user_rate_throttles_each_user_alone():
+    calls = RateLimiter(project_rate=1e6, user_rate=1e6)
+    calls.set_user_rate('slow', 50)
+    for _ in range(51):
+        calls.acquire('fast')
+    assert 'throttled' not in calls.stats()
+    for _ in range(51):
+        calls.acquire('slow')
+    assert calls.stats()['throttled'] == 1
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from fake_provider import generate_series, recurrence_corpus, synthetic_google_service
+
+YEAR = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Day ranges into 2024
+WINDOWS = [(0, 366), (1, 365), (60, 90), (300, 307)]
+
+
+@pytest.fixture(scope='module')
+def services():
+    # Generated series plus the corpus of awkward rules and exceptions, expanded by the server
+    # (singleEvents=True) and here
+    items = generate_series(2_000, seed=7) + recurrence_corpus()
+    return {local: synthetic_google_service(items, horizon=YEAR + timedelta(days=366), local_recurrence=local)
+            for local in (False, True)}
+
+
+@pytest.mark.parametrize('low, high', WINDOWS)
+def test_local_expansion_matches_the_server(services, low, high):
+    start, end = YEAR + timedelta(days=low), YEAR + timedelta(days=high)
+    server, local = (services[local].range_columns('primary', start, end).to_records() for local in (False, True))
+    assert len(server)
+    order = ['start', 'event_id']
+    pd.testing.assert_frame_equal(local.sort_values(order, ignore_index=True), server.sort_values(order, ignore_index=True),
+                                  check_dtype=False)
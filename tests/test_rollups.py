@@ -0,0 +1,60 @@
+from dataclasses import fields
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processor import analyze_calendar_data
+from event_store import EventStore
+from fake_provider import generate_events, synthetic_google_service
+
+
+@pytest.fixture(scope='module')
+def service():
+    service = synthetic_google_service(generate_events(3_000, seed=5), store=EventStore(':memory:'), user_id='test')
+    service.sync()
+    return service
+
+
+def assert_same_analysis(rolled, raw):
+    for field in fields(raw):
+        x, y = getattr(rolled, field.name), getattr(raw, field.name)
+        if isinstance(y, pd.Series):
+            # The raw frame indexes categories by its categorical, rollups by name
+            pd.testing.assert_series_equal(x, y.set_axis(y.index.astype(x.index.dtype)), check_exact=False)
+        else:
+            assert np.isclose(x, y) or (x != x and y != y), field.name
+
+
+# Dates, as the UI passes them: a range includes its last day
+@pytest.mark.parametrize('start, days', [(date(2024, 3, 1), 1), (date(2024, 3, 4), 7),
+                                         (date(2024, 2, 15), 30), (date(2024, 1, 1), 366)])
+def test_rollups_match_raw_events(service, start, days):
+    window = (start, start + timedelta(days=days - 1))
+    assert_same_analysis(service.fetch_analysis(*window), analyze_calendar_data(service.fetch_events(*window)))
+
+
+def test_rollups_follow_incremental_changes(service):
+    window = (date(2024, 1, 1), date(2024, 12, 31))
+    events = list(service.http_fake.current['primary'].values())
+    service.http_fake.update([dict(events[0], summary='Client review'), dict(events[1], status='cancelled')])
+    rolled = service.fetch_analysis(*window)
+    assert_same_analysis(rolled, analyze_calendar_data(service.fetch_events(*window)))
+    assert rolled.total_meetings == len(events) - 1
+
+
+@pytest.mark.parametrize('time_zone', ['America/New_York', 'Asia/Kolkata'])
+def test_rollups_match_raw_events_in_local_time(service, time_zone):
+    # A new zone rebuilds the stored rollups by local day and hour; later changes keep them local
+    window = (date(2024, 3, 4), date(2024, 3, 31))
+    service.time_zone = time_zone
+    try:
+        assert_same_analysis(service.fetch_analysis(*window),
+                             analyze_calendar_data(service.fetch_events(*window), time_zone))
+        events = list(service.http_fake.current['primary'].values())
+        service.http_fake.update([dict(events[2], summary='Client review')])
+        assert_same_analysis(service.fetch_analysis(*window),
+                             analyze_calendar_data(service.fetch_events(*window), time_zone))
+    finally:
+        del service.time_zone
@@ -0,0 +1,103 @@
+import os
+import stat
+
+import pytest
+from cryptography.fernet import Fernet
+from google.oauth2.credentials import Credentials
+
+from schedule_store import ScheduleStore
+
+KEY = Fernet.generate_key()
+REFRESH_TOKEN = '1//refresh-token-that-must-not-leak'
+
+
+@pytest.fixture(autouse=True)
+def client(monkeypatch):
+    monkeypatch.setenv('GOOGLE_CLIENT_ID', 'client-id')
+    monkeypatch.setenv('GOOGLE_CLIENT_SECRET', 'client-secret')
+
+
+def credentials():
+    return Credentials('access-token', refresh_token=REFRESH_TOKEN, token_uri='https://oauth2.googleapis.com/token',
+                       client_id='client-id', client_secret='client-secret',
+                       scopes=['https://www.googleapis.com/auth/calendar.readonly'])
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def stored_bytes(path):
+    return b''.join(open(name, 'rb').read() for name in (path, f'{path}-wal') if os.path.exists(name))
+
+
+def test_files_are_private(tmp_path):
+    path = str(tmp_path / 'private' / 'schedules.sqlite3')
+    store = ScheduleStore(path, key=KEY)
+    store.save_credentials('user', credentials())
+    assert mode(tmp_path / 'private') == 0o700
+    for name in (path, f'{path}-wal', f'{path}-shm'):
+        assert mode(name) == 0o600, name
+
+
+def test_only_the_encrypted_refresh_token_is_stored(tmp_path):
+    path = str(tmp_path / 'schedules.sqlite3')
+    store = ScheduleStore(path, key=KEY)
+    store.save_credentials('user', credentials())
+    data = stored_bytes(path)
+    assert REFRESH_TOKEN.encode() not in data and b'access-token' not in data and b'client-secret' not in data
+
+    loaded = store.load_credentials('user')
+    assert loaded.refresh_token == REFRESH_TOKEN and loaded.token is None
+    assert (loaded.client_id, loaded.client_secret) == ('client-id', 'client-secret')
+    assert loaded.scopes == ['https://www.googleapis.com/auth/calendar.readonly']
+
+    store.delete_credentials('user')
+    assert store.load_credentials('user') is None
+
+
+def test_credentials_need_a_key(tmp_path):
+    store = ScheduleStore(str(tmp_path / 'schedules.sqlite3'), key=None)
+    with pytest.raises(RuntimeError, match='SCHEDULE_ENCRYPTION_KEY'):
+        store.save_credentials('user', credentials())
+    with pytest.raises(ValueError, match='refresh token'):
+        ScheduleStore(':memory:', key=KEY).save_credentials('user', Credentials('access-token'))
+
+
+def test_another_key_reads_nothing(tmp_path):
+    path = str(tmp_path / 'schedules.sqlite3')
+    ScheduleStore(path, key=KEY).save_credentials('user', credentials())
+    assert ScheduleStore(path, key=Fernet.generate_key()).load_credentials('user') is None
+
+
+def test_plaintext_credentials_are_encrypted_on_open(tmp_path):
+    path = str(tmp_path / 'schedules.sqlite3')
+    old = ScheduleStore(path, key=None)
+    with old._transaction() as conn:
+        conn.execute('INSERT INTO credentials VALUES (?, ?, ?, ?)', ('user', 'google', credentials().to_json(), None))
+    old._conn.close()
+
+    store = ScheduleStore(path, key=KEY)
+    assert store.load_credentials('user').refresh_token == REFRESH_TOKEN
+    with store._transaction() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM credentials').fetchone()[0] == 0
+    store._conn.close()
+    assert REFRESH_TOKEN.encode() not in stored_bytes(path)
+
+
+def test_schedules_come_back_as_jobs():
+    import scheduler
+
+    store = ScheduleStore(':memory:')
+    store.save_schedule('a', 'a@example.com', 'mon', 9, 30)
+    store.save_schedule('b', 'b@example.com', 'fri', 17, 0, time_zone='Asia/Kolkata')
+    store.save_schedule('a', 'a@example.com', 'tue', 8, 0)
+    try:
+        assert scheduler.restore_report_jobs(store) == 2
+        jobs = {job.id: job for job in scheduler.scheduler.get_jobs()}
+        assert sorted(jobs) == [scheduler.report_job_id('a'), scheduler.report_job_id('b')]
+        assert jobs[scheduler.report_job_id('a')].args == ('a',)
+        assert str(jobs[scheduler.report_job_id('a')].trigger.fields[4]) == 'tue'
+        assert str(jobs[scheduler.report_job_id('b')].trigger.timezone) == 'Asia/Kolkata'
+    finally:
+        scheduler.scheduler.remove_all_jobs()
@@ -0,0 +1,117 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import event_store
+from event_schema import compact_event_frame
+from event_store import EventStore
+from schedule_store import ScheduleStore
+from sqlite_store import SQLiteStore
+
+
+def events(n=6, attendees=None):
+    start = pd.date_range('2024-03-10 09:00', periods=n, freq='h', tz='America/New_York')
+    return pd.DataFrame({
+        'summary': ['Standup', 'Project sync', None] * (n // 3),
+        'start': start,
+        'end': start + pd.Timedelta(minutes=30),
+        'duration': np.full(n, 0.5),
+        'attendees': attendees if attendees is not None else np.arange(n, dtype='int64'),
+        'category': ['Other', 'Project', 'Other'] * (n // 3),
+        'calendar_id': 'primary',
+        'attendee_emails': ['a@example.com\nb@example.com', None, None] * (n // 3),
+        'ical_uid': [f'{i}@google.com' for i in range(n)],
+    })
+
+
+def test_compact_dtypes():
+    df = events()
+    compact = compact_event_frame(df)
+    assert list(compact.columns) == ['summary', 'start', 'end', 'duration', 'attendees', 'category', 'calendar_id',
+                                     'attendee_emails']
+    for column in ('summary', 'category', 'calendar_id', 'attendee_emails'):
+        assert isinstance(compact[column].dtype, pd.CategoricalDtype), column
+    assert str(compact['start'].dtype) == str(compact['end'].dtype) == 'datetime64[ns, UTC]'
+    assert compact['duration'].dtype == 'float32' and compact['attendees'].dtype == 'int16'
+
+    # The values survive, and the input keeps its own dtypes
+    assert (compact['start'] == df['start']).all()
+    assert compact['summary'].astype(object).equals(df['summary'])
+    assert compact['attendees'].tolist() == df['attendees'].tolist()
+    assert df['attendees'].dtype == 'int64' and str(df['start'].dtype) == 'datetime64[ns, America/New_York]'
+    assert df['summary'].dtype == object and 'ical_uid' in df
+
+
+def test_large_and_missing_attendee_counts():
+    assert compact_event_frame(events(attendees=[0, 1, 40_000, 2, 3, 4]))['attendees'].dtype == 'int32'
+    compact = compact_event_frame(events(attendees=[np.nan, 1, 2, 3, 4, 5]))
+    assert compact['attendees'].dtype == 'int16' and compact['attendees'].iloc[0] == 0
+
+
+def test_missing_columns():
+    with pytest.raises(ValueError, match='category, calendar_id'):
+        compact_event_frame(events().drop(columns=['calendar_id', 'category']))
+    assert 'attendee_emails' not in compact_event_frame(events().drop(columns=['attendee_emails']))
+
+
+@pytest.mark.parametrize('store', [EventStore, ScheduleStore])
+def test_fresh_store_runs_every_migration(store, tmp_path):
+    path = str(tmp_path / 'store.sqlite3')
+    store(path)._conn.close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(store.MIGRATIONS)
+    # Opening again runs nothing
+    store(path)._conn.close()
+
+
+def test_upgrade_keeps_stored_events(tmp_path):
+    # A store from before ical_uid, with an event and a sync token in it
+    path = str(tmp_path / 'events.sqlite3')
+    with sqlite3.connect(path) as conn:
+        conn.executescript(event_store.MIGRATIONS[0])
+        conn.execute("INSERT INTO events VALUES ('user', 'primary', 'evt1', 'Standup', 1710061200, 1710063000, 3)")
+        conn.execute("INSERT INTO sync_state VALUES ('user', 'primary', 'token', '2024-03-10T00:00:00+00:00')")
+        conn.execute('PRAGMA user_version = 1')
+    conn.close()
+
+    store = EventStore(path)
+    with store._transaction() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(event_store.MIGRATIONS)
+        row = conn.execute('SELECT event_id, summary, start_ts, attendees, ical_uid, attendee_emails FROM events'
+                           ).fetchone()
+        assert row == ('evt1', 'Standup', 1710061200, 3, None, None)
+        assert conn.execute('SELECT time_zone FROM rollup_state').fetchall() == []
+    # The migration that added attendee addresses asks for a full sync
+    assert store.get_sync_token('user', 'primary') is None
+
+
+class Store(SQLiteStore):
+    MIGRATIONS = [
+        "CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT); INSERT INTO notes (body) VALUES ('a; b');",
+        """
+ALTER TABLE notes ADD COLUMN author TEXT;
+CREATE TABLE tags (note_id INTEGER, tag TEXT);
+INSERT INTO missing VALUES (1);
+""",
+    ]
+
+
+def test_failed_migration_changes_nothing(tmp_path):
+    path = str(tmp_path / 'store.sqlite3')
+    with pytest.raises(sqlite3.OperationalError, match='missing'):
+        Store(path)
+    with sqlite3.connect(path) as conn:
+        # The first migration committed on its own; none of the second did
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == 1
+        assert conn.execute('SELECT * FROM notes').fetchall() == [(1, 'a; b')]
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'tags'").fetchall() == []
+    conn.close()
+
+    class Fixed(Store):
+        MIGRATIONS = [Store.MIGRATIONS[0], Store.MIGRATIONS[1].replace('INSERT INTO missing VALUES (1);', '')]
+
+    with Fixed(path)._transaction() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == 2
+        assert conn.execute('SELECT * FROM notes').fetchall() == [(1, 'a; b', None)]
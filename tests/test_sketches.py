@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from sketches import HyperLogLog, TDigest
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def rank(values, estimate):
+    return np.searchsorted(np.sort(values), estimate, side='right') / len(values)
+
+
+def test_tdigest_quantiles_are_close_in_rank():
+    values = np.random.default_rng(0).lognormal(0, 1, 100_000)
+    digest = TDigest.from_values(values)
+    assert len(digest.means) <= digest.compression
+    for q in QUANTILES:
+        assert abs(rank(values, digest.quantile(q)) - q) < 0.005, q
+    assert digest.quantile(0) == values.min() and digest.quantile(1) == values.max()
+
+
+def test_tdigest_merge_matches_one_digest_of_everything():
+    values = np.random.default_rng(1).exponential(1, 100_000)
+    merged = TDigest.combine(TDigest.from_values(part) for part in np.array_split(values, 50))
+    assert merged.count == len(values)
+    for q in QUANTILES:
+        assert abs(rank(values, merged.quantile(q)) - q) < 0.005, q
+
+
+def test_tdigest_discrete_values_give_values_that_occur():
+    # Durations on a 15-minute grid
+    values = np.random.default_rng(2).integers(1, 17, 10_000) / 4
+    digest = TDigest.from_values(values)
+    # Away from the edges between values, where the digest interpolates
+    for q in (0.03, 0.3, 0.55, 0.8, 0.97):
+        assert digest.quantile(q) == np.quantile(values, q, method='inverted_cdf'), q
+
+
+def test_tdigest_round_trips_through_dict():
+    digest = TDigest.from_values(np.arange(1_000.0))
+    restored = TDigest.from_dict(digest.to_dict())
+    assert [restored.quantile(q) for q in QUANTILES] == [digest.quantile(q) for q in QUANTILES]
+
+
+@pytest.mark.parametrize('n', [100, 10_000, 200_000])
+def test_hyperloglog_count_within_three_standard_errors(n):
+    sketch = HyperLogLog.from_values([f'person{i}@example.com' for i in range(n)])
+    error = 1.04 / np.sqrt(len(sketch.registers))
+    assert abs(sketch.count() - n) <= 3 * error * n + 1
+
+
+def test_hyperloglog_merge_equals_sketch_of_union():
+    first = [f'a{i}' for i in range(5_000)]
+    second = [f'a{i}' for i in range(2_500, 9_000)]
+    union = HyperLogLog.from_values(first + second)
+    merged = HyperLogLog.from_values(first).merge(HyperLogLog.from_values(second))
+    assert np.array_equal(merged.registers, union.registers)
+    assert HyperLogLog.combine([HyperLogLog.from_values(first), HyperLogLog.from_values(second)]).count() == union.count()
+    assert np.array_equal(HyperLogLog.from_bytes(union.to_bytes()).registers, union.registers)
+
+
+def test_mismatched_sketches_do_not_merge():
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=10).merge(HyperLogLog(precision=12))
+    with pytest.raises(ValueError):
+        HyperLogLog.combine([HyperLogLog(precision=12), HyperLogLog(precision=14)])
+    with pytest.raises(ValueError):
+        TDigest.combine([TDigest.from_values([1.0], compression=100), TDigest.from_values([2.0])])
@@ -0,0 +1,86 @@
+import smtplib
+from email.message import EmailMessage
+
+import pytest
+
+from smtp_pool import SMTPPool, _Delivery
+from smtp_sink import SMTPSink
+
+
+def message(i, to=('team@example.com',)):
+    msg = EmailMessage()
+    msg['From'] = 'reports@example.com'
+    msg['To'] = ', '.join(to)
+    msg['Subject'] = f'Report {i}'
+    msg.set_content(f'Report {i}\n.\nends with a dot line')
+    return msg
+
+
+@pytest.fixture
+def sink(request):
+    sink = SMTPSink(**getattr(request, 'param', {})).start()
+    yield sink
+    sink.stop()
+
+
+def pool_for(sink, **options):
+    host, port = sink.address
+    return SMTPPool(host, port, 'reports', 'secret', starttls=False, base_delay=0.01, max_delay=0.05, **options)
+
+
+def send_batch(pool, deliveries):
+    # One _send_batch on a fresh connection, as a pool thread runs it
+    conn = pool._connect()
+    try:
+        return pool._send_batch(conn, deliveries)
+    finally:
+        pool._disconnect(conn)
+
+
+def delivery(i, recipients=('team@example.com',)):
+    return _Delivery('reports@example.com', list(recipients), message(i, recipients).as_bytes())
+
+
+@pytest.mark.parametrize('sink', [{}, {'pipelining': False}], indirect=True)
+def test_batch_delivers_every_message(sink):
+    pool = pool_for(sink)
+    batch = [delivery(i, [f'user{j}@example.com' for j in range(i % 3 + 1)]) for i in range(12)]
+    assert send_batch(pool, batch) == []
+    assert [d.future.result(timeout=5) for d in batch] == [{}] * 12
+    assert pool.stats()['sent'] == 12
+    assert sink.stats()['messages'] == 12
+    assert sink.stats()['recipients'] == sum(len(d.recipients) for d in batch)
+
+
+@pytest.mark.parametrize('sink', [{'rejected': ['gone@example.com']},
+                                  {'rejected': ['gone@example.com'], 'pipelining': False}], indirect=True)
+def test_rejected_recipient_does_not_fail_the_batch(sink):
+    pool = pool_for(sink)
+    batch = [delivery(0), delivery(1, ['team@example.com', 'gone@example.com']), delivery(2, ['gone@example.com']),
+             delivery(3)]
+    assert send_batch(pool, batch) == []
+    # Refused recipients are reported like sendmail does; a message nobody accepts fails on its own
+    assert batch[0].future.result(timeout=5) == {}
+    assert batch[1].future.result(timeout=5) == {'gone@example.com': (550, b'No such user')}
+    with pytest.raises(smtplib.SMTPResponseException) as error:
+        batch[2].future.result(timeout=5)
+    assert error.value.smtp_code == 550
+    assert batch[3].future.result(timeout=5) == {}
+    assert pool.stats()['sent'] == 3 and pool.stats()['failed'] == 1
+    assert sink.stats()['messages'] == 3
+
+
+@pytest.mark.parametrize('sink', [{'drop_connections': 2}, {'drop_connections': 2, 'pipelining': False}],
+                         indirect=True)
+def test_dropped_connection_is_retried(sink):
+    pool = pool_for(sink, pool_size=1, batch_size=5)
+    futures = [pool.submit(message(i)) for i in range(10)]
+    try:
+        assert [future.result(timeout=10) for future in futures] == [{}] * 10
+    finally:
+        pool.close(timeout=5)
+    stats = pool.stats()
+    assert stats['sent'] == 10 and stats.get('failed', 0) == 0
+    assert stats['reconnects'] == 2 and stats['connections'] == 3
+    # Messages the server had accepted before the drop are not sent twice
+    assert sink.stats()['messages'] == 10
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+# main.py loads nothing on top of streamlit but the app's own light modules; pages import the rest.
+# Streamlit 1.39 imports plotly itself, to register its chart theme, so a server has it anyway.
+SCRIPT = """
+import sys
+import streamlit
+loaded = set(sys.modules)
+import main
+print(' '.join(sorted(set(sys.modules) - loaded)))
+"""
+
+
+def test_import_main_adds_only_app_modules():
+    result = subprocess.run([sys.executable, '-c', SCRIPT], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            capture_output=True, text=True, timeout=120, check=True)
+    assert sorted(result.stdout.split()) == ['auth', 'main', 'metrics', 'utils']
@@ -0,0 +1,56 @@
+import logging
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from event_store import EventStore
+from fake_provider import generate_events, synthetic_apple_service, synthetic_google_service, synthetic_outlook_service
+
+PROVIDERS = [synthetic_google_service, synthetic_outlook_service, synthetic_apple_service]
+WINDOW = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+
+
+def stored_service(factory, items):
+    service = factory(items, store=EventStore(':memory:'), user_id='test')
+    service.authenticate()
+    return service
+
+
+def change(service, items):
+    # One edit and one cancellation, as the next sync should see them
+    service.http_fake.update([dict(items[0], summary='Client review'), dict(items[1], status='cancelled')])
+
+
+def full_sync(factory, service):
+    # What a first sync of the server's current events gives
+    fresh = stored_service(factory, list(service.http_fake.current['primary'].values()))
+    return fresh.fetch_events(*WINDOW)
+
+
+@pytest.mark.parametrize('factory', PROVIDERS)
+def test_incremental_sync_matches_full_sync(factory):
+    items = generate_events(300, seed=3)
+    service = stored_service(factory, items)
+    service.fetch_events(*WINDOW)
+    change(service, items)
+    calls = service.http_fake.calls
+    df = service.fetch_events(*WINDOW)
+    assert service.http_fake.calls - calls <= 2
+    assert (df['summary'] == 'Client review').sum() == 1 and len(df) == len(items) - 1
+    pd.testing.assert_frame_equal(df, full_sync(factory, service))
+
+
+@pytest.mark.parametrize('factory', PROVIDERS)
+def test_expired_sync_token_runs_a_full_sync(factory, caplog):
+    items = generate_events(300, seed=3)
+    service = stored_service(factory, items)
+    service.fetch_events(*WINDOW)
+    change(service, items)
+    # The server forgets its change log, so the stored token points past its end and is refused
+    del service.http_fake.log['primary'][:]
+    with caplog.at_level(logging.INFO, logger='calendar_services'):
+        df = service.fetch_events(*WINDOW)
+    assert 'no longer valid, running a full sync' in caplog.text
+    assert (df['summary'] == 'Client review').sum() == 1 and len(df) == len(items) - 1
+    pd.testing.assert_frame_equal(df, full_sync(factory, service))
@@ -0,0 +1,51 @@
+from datetime import date, datetime, timezone
+
+import pandas as pd
+import pytest
+
+from calendar_services import parse_event_times, to_utc
+from fake_provider import generate_events, synthetic_google_service
+
+VALUES = [
+    '2024-03-10T09:00:00Z', '2024-03-10T09:00:00+00:00', '2024-03-10T09:00:00-05:00', '2024-03-10T09:00:00+05:30',
+    '2024-03-10T23:30:00-08:00', '2024-12-31T22:00:00-03:00', '2024-03-10', '2024-02-29',
+]
+
+
+@pytest.mark.parametrize('values', [VALUES, VALUES[::-1], VALUES[:1], ['2024-03-10']])
+def test_offsets_and_dates_normalise_to_utc(values):
+    parsed = parse_event_times(values)
+    assert parsed.dt.tz == timezone.utc
+    assert parsed.tolist() == pd.to_datetime(pd.Series(values), utc=True, format='ISO8601').tolist()
+
+
+def test_fractional_seconds():
+    values = ['2024-03-10T09:00:00.250Z', '2024-03-10T09:00:00-05:00', '2024-03-10T09:00:00.5+01:00']
+    parsed = parse_event_times(values)
+    assert parsed.tolist() == [pd.Timestamp('2024-03-10T09:00:00.25Z'), pd.Timestamp('2024-03-10T14:00:00Z'),
+                               pd.Timestamp('2024-03-10T08:00:00.5Z')]
+
+
+def test_ui_dates_are_local_midnights():
+    assert to_utc(date(2024, 3, 10), tz='UTC') == datetime(2024, 3, 10, tzinfo=timezone.utc)
+    # The end of an inclusive range is the next midnight, across the US change to daylight time
+    assert to_utc(date(2024, 3, 10), end_of_range=True, tz='America/New_York') == datetime(
+        2024, 3, 11, 4, tzinfo=timezone.utc)
+    assert to_utc(date(2024, 3, 9), tz='America/New_York') == datetime(2024, 3, 9, 5, tzinfo=timezone.utc)
+
+
+def test_datetimes_keep_their_time():
+    # Naive datetimes are wall-clock times in tz; aware ones already say where they are
+    assert to_utc(datetime(2024, 3, 10, 9, 30), tz='Asia/Kolkata') == datetime(2024, 3, 10, 4, tzinfo=timezone.utc)
+    aware = datetime(2024, 3, 10, 9, 30, tzinfo=timezone.utc)
+    assert to_utc(aware, end_of_range=True, tz='Asia/Kolkata') == aware
+
+
+def test_fetch_follows_every_page():
+    items = generate_events(1_050, seed=3, start=date(2024, 1, 1), days=60)
+    service = synthetic_google_service(items, max_results=100)
+    service.authenticate()
+    df = service.fetch_events(date(2023, 12, 1), date(2024, 4, 1))
+    assert len(df) == len(items) and service.http_fake.calls == 11
+    assert df['start'].dt.tz == timezone.utc and df['start'].is_monotonic_increasing
+    assert (df['end'] >= df['start']).all()
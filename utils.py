@@ -1,7 +1,10 @@
 from datetime import datetime, timedelta
 
-def get_last_week_date_range():
-    today = datetime.now().date()
+def get_last_week_date_range(time_zone=None):
+    # Monday to Sunday of last week, by today's date in time_zone (the server's by default)
+    from zoneinfo import ZoneInfo
+
+    today = datetime.now(ZoneInfo(time_zone) if time_zone else None).date()
     last_week_end = today - timedelta(days=today.weekday() + 1)
     last_week_start = last_week_end - timedelta(days=6)
     return last_week_start, last_week_end
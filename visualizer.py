@@ -1,71 +1,153 @@
+import os
+import numpy as np
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from data_processor import analyze_calendar_data, analyze_intervals
+from metrics import metrics
 
-def create_visualizations(df):
+# Above this many events the per-event charts are binned here, so only bin counts reach the browser
+LARGE_DATA_THRESHOLD = int(os.environ.get('LARGE_DATA_THRESHOLD', 5000))
+# The duration/attendees scatter is drawn with WebGL above the first and as a density heatmap above the second
+SCATTERGL_THRESHOLD = int(os.environ.get('SCATTERGL_THRESHOLD', 1000))
+DENSITY_THRESHOLD = int(os.environ.get('DENSITY_THRESHOLD', 20000))
+HISTOGRAM_BINS = 50
+
+def binned_histogram(values, title, label, bins=HISTOGRAM_BINS):
+    counts, edges = np.histogram(values.to_numpy(dtype=float), bins=bins)
+    binned = pd.DataFrame({'value': (edges[:-1] + edges[1:]) / 2, 'count': counts})
+    fig = px.bar(binned, x='value', y='count', title=title, labels={'value': label})
+    fig.update_traces(width=np.diff(edges))
+    fig.update_layout(bargap=0)
+    return fig
+
+def density_heatmap(x, y, title, labels, bins=HISTOGRAM_BINS):
+    counts, x_edges, y_edges = np.histogram2d(x.to_numpy(dtype=float), y.to_numpy(dtype=float), bins=bins)
+    # Empty cells stay transparent, like the blank space in a scatter
+    counts = np.where(counts > 0, counts, np.nan).T
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=counts,
+        colorscale='Viridis',
+        colorbar={'title': 'Meetings'},
+        hoverongaps=False
+    ))
+    fig.update_layout(title=title, xaxis_title=labels[x.name], yaxis_title=labels[y.name])
+    return fig
+
+def create_visualizations(df, analysis=None, large_data=None, intervals=None):
+    # Aggregates come from the shared analysis; df is only read for per-event charts
+    if analysis is None:
+        analysis = analyze_calendar_data(df)
+    if intervals is None:
+        intervals = analyze_intervals(df)
+    if large_data is None:
+        large_data = len(df) > LARGE_DATA_THRESHOLD
+    with metrics.stage('figures', binned=large_data) as stage:
+        stage['events'] = len(df)
+        return _build_figures(df, analysis, large_data, intervals)
+
+def time_use_chart(intervals):
+    # Per working day: merged busy time, the part of it double-booked, and free time long enough to focus
+    by_day = intervals.by_day.reset_index().melt(
+        id_vars='day', value_vars=['busy', 'double_booked', 'focus'], var_name='time', value_name='hours'
+    )
+    fig = px.bar(
+        by_day,
+        x='day',
+        y='hours',
+        color='time',
+        barmode='group',
+        title=(f'Busy, Double-Booked and Focus Time per Working Day '
+               f'({intervals.busy_hours:.1f} h busy, {intervals.double_booked_hours:.1f} h double-booked)'),
+        labels={'day': 'Date', 'hours': 'Hours', 'time': ''}
+    )
+    return fig
+
+def _build_figures(df, analysis, large_data, intervals):
     figs = []
     
     # Meetings per day
     fig_meetings_per_day = px.bar(
-        df.groupby(df['start'].dt.date).size().reset_index(name='count'),
-        x='start',
-        y='count',
+        analysis.meetings_by_day.reset_index(),
+        x='day',
+        y='meetings',
         title='Meetings per Day'
     )
     figs.append(fig_meetings_per_day)
     
     # Meeting duration distribution
-    fig_duration_dist = px.histogram(
-        df,
-        x='duration',
-        title='Meeting Duration Distribution',
-        labels={'duration': 'Duration (hours)'}
-    )
+    if large_data:
+        fig_duration_dist = binned_histogram(df['duration'], 'Meeting Duration Distribution', 'Duration (hours)')
+    else:
+        fig_duration_dist = px.histogram(
+            df,
+            x='duration',
+            title='Meeting Duration Distribution',
+            labels={'duration': 'Duration (hours)'}
+        )
     figs.append(fig_duration_dist)
     
     # Attendees distribution
-    fig_attendees_dist = px.histogram(
-        df,
+    fig_attendees_dist = px.bar(
+        analysis.meetings_by_attendees.reset_index(),
         x='attendees',
+        y='meetings',
         title='Meeting Attendees Distribution'
     )
     figs.append(fig_attendees_dist)
     
     # Time of day distribution
-    df['hour'] = df['start'].dt.hour
-    fig_time_dist = px.histogram(
-        df,
+    fig_time_dist = px.bar(
+        analysis.meetings_by_hour.reset_index(),
         x='hour',
+        y='meetings',
         title='Meeting Time Distribution',
         labels={'hour': 'Hour of Day'}
     )
     figs.append(fig_time_dist)
     
     # Meeting duration vs. Attendees scatter plot
-    fig_duration_vs_attendees = px.scatter(
-        df,
-        x='duration',
-        y='attendees',
-        title='Meeting Duration vs. Number of Attendees',
-        labels={'duration': 'Duration (hours)', 'attendees': 'Number of Attendees'}
-    )
+    scatter_labels = {'duration': 'Duration (hours)', 'attendees': 'Number of Attendees'}
+    if large_data and len(df) > DENSITY_THRESHOLD:
+        fig_duration_vs_attendees = density_heatmap(
+            df['duration'],
+            df['attendees'],
+            'Meeting Duration vs. Number of Attendees',
+            scatter_labels
+        )
+    else:
+        fig_duration_vs_attendees = px.scatter(
+            df,
+            x='duration',
+            y='attendees',
+            title='Meeting Duration vs. Number of Attendees',
+            labels=scatter_labels,
+            render_mode='webgl' if len(df) > SCATTERGL_THRESHOLD else 'svg'
+        )
     figs.append(fig_duration_vs_attendees)
     
     # Meetings by category
     fig_meetings_by_category = px.pie(
-        df,
+        analysis.meetings_by_category.reset_index(),
         names='category',
+        values='meetings',
         title='Distribution of Meetings by Category'
     )
     figs.append(fig_meetings_by_category)
     
     # Duration by category
     fig_duration_by_category = px.bar(
-        df.groupby('category')['duration'].sum().reset_index(),
+        analysis.duration_by_category.reset_index(),
         x='category',
         y='duration',
         title='Total Duration of Meetings by Category',
         labels={'duration': 'Total Duration (hours)'}
     )
     figs.append(fig_duration_by_category)
+
+    # Busy, double-booked and focus time
+    figs.append(time_use_chart(intervals))
     
     return figs